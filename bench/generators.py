@@ -0,0 +1,167 @@
+"""Synthetic inputs in each import format, for benchmarking.
+
+Each generator writes its files to a directory and returns the (files, params) pair to pass to the format's
+importer. Ballots are drawn from the same model for every format: candidate popularity falls off like a Zipf
+distribution, voters rank a random number of candidates, and a small fraction of marks are overvotes.
+"""
+
+import os
+import random
+import zipfile
+from typing import Dict, Iterator, List, Optional, Tuple, Callable
+
+OVERVOTE_RATE = 0.005
+
+# Maine workbooks are split so that no sheet goes past Excel's row limit.
+MAINE_ROWS_PER_FILE = 1000000
+
+Rankings = Iterator[List[Optional[int]]]
+
+
+def synthetic_rankings(num_ballots: int, num_candidates: int, num_ranks: int, seed: int = 0) -> Rankings:
+    """Yield one list of num_ranks marks per ballot. A mark is a candidate index, None for an undervote or -1 for an
+    overvote."""
+    rng = random.Random(seed)
+    candidates = list(range(num_candidates))
+    weights = [1 / (i + 1) for i in candidates]
+
+    for _ in range(num_ballots):
+        depth = rng.randint(1, num_ranks)
+        marks = list()  # type: List[Optional[int]]
+        for _ in range(depth):
+            if rng.random() < OVERVOTE_RATE:
+                marks.append(-1)
+            else:
+                marks.append(rng.choices(candidates, weights)[0])
+        marks.extend([None] * (num_ranks - depth))
+        yield marks
+
+
+def generate_us_ca_sfo(directory: str, num_ballots: int, num_candidates: int, num_ranks: int,
+                       seed: int = 0) -> Tuple[List[str], Dict]:
+    contest_id = 1
+    master_lookup_file = os.path.join(directory, 'MasterLookup.txt')
+    ballot_image_file = os.path.join(directory, 'BallotImage.txt')
+
+    def master_record(record_type, record_id, description, contest=0, is_writein=0):
+        return '{:<10}{:07d}{:<50}{:07d}{:07d}{:d}{:d}\n'.format(
+            record_type, record_id, description, record_id, contest, is_writein, 0)
+
+    with open(master_lookup_file, 'w') as fh:
+        fh.write(master_record('Contest', contest_id, 'Mayor'))
+        for i in range(num_candidates):
+            fh.write(master_record('Candidate', i + 1, 'CANDIDATE {}'.format(i + 1), contest_id))
+        fh.write(master_record('Candidate', num_candidates + 1, 'WRITE-IN', contest_id, 1))
+
+    with open(ballot_image_file, 'w') as fh:
+        for voter, marks in enumerate(synthetic_rankings(num_ballots, num_candidates, num_ranks, seed), 1):
+            lines = list()
+            for rank, mark in enumerate(marks, 1):
+                candidate_id = 0 if mark is None or mark == -1 else mark + 1
+                lines.append('{:07d}{:09d}{:07d}{:03d}{:07d}{:03d}{:07d}{:d}{:d}\n'.format(
+                    contest_id, voter, voter, 1, 1 + voter % 500, rank, candidate_id, mark == -1, mark is None))
+            fh.writelines(lines)
+
+    return [master_lookup_file, ballot_image_file], {'contest': contest_id}
+
+
+def generate_us_me(directory: str, num_ballots: int, num_candidates: int, num_ranks: int,
+                   seed: int = 0) -> Tuple[List[str], Dict]:
+    from openpyxl import Workbook
+
+    names = ['{} Candidate{}, Test ({})'.format('DEM' if i % 2 else 'REP', i + 1, 1000 + i)
+             for i in range(num_candidates)]
+    names[-1] = 'Candidate{}, Test'.format(num_candidates)
+    ordinals = {1: 'st', 2: 'nd', 3: 'rd'}
+    header = ['Cast Vote Record', 'Precinct', 'Ballot Style'] + [
+        'REP. TO CONGRESS {}{} Choice'.format(rank, ordinals.get(rank if rank < 20 else rank % 10, 'th'))
+        for rank in range(1, num_ranks + 1)]
+
+    files = list()
+    workbook = sheet = None
+    for record, marks in enumerate(synthetic_rankings(num_ballots, num_candidates, num_ranks, seed)):
+        if record % MAINE_ROWS_PER_FILE == 0:
+            if workbook is not None:
+                workbook.save(files[-1])
+            files.append(os.path.join(directory, 'maine{:03d}.xlsx'.format(len(files))))
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(header)
+        sheet.append([record + 1, 'Town {}'.format(record % 400), 'Style 1'] + [
+            'undervote' if mark is None else 'overvote' if mark == -1 else names[mark] for mark in marks])
+    if workbook is not None:
+        workbook.save(files[-1])
+
+    return files, {}
+
+
+def generate_us_nm_saf(directory: str, num_ballots: int, num_candidates: int, num_ranks: int,
+                       seed: int = 0) -> Tuple[List[str], Dict]:
+    filename = os.path.join(directory, 'cvr.zip')
+
+    # Slot 0 holds a single-choice contest on every card, so the ranked contest is not the first column group.
+    header = ['RecordId']
+    for slot, slot_ranks in enumerate([1, num_ranks]):
+        header.append('Original/Cards/0/Contests/{}/Id'.format(slot))
+        for mark in range(slot_ranks):
+            header.append('Original/Cards/0/Contests/{}/Marks/{}/CandidateId'.format(slot, mark))
+            header.append('Original/Cards/0/Contests/{}/Marks/{}/Rank'.format(slot, mark))
+
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('csvFiles/ContestManifest.csv', 'Description,Id,ExternalId,VoteFor,NumOfRanks\n'
+                                                    'Question,1,,1,0\n'
+                                                    'Mayor,2,,1,{}\n'.format(num_ranks - 1))
+        zf.writestr('csvFiles/CandidateManifest.csv', 'Description,Id,ExternalId,ContestId,Type\n' + ''.join(
+            ['Yes,1,,1,Regular\n', 'No,2,,1,Regular\n'] +
+            ['Candidate {},{},,2,Regular\n'.format(i + 1, i + 101) for i in range(num_candidates)]))
+
+        with zf.open('csvFiles/CvrExport.csv', 'w') as fh:
+            fh.write((','.join(header) + '\n').encode())
+            for record, marks in enumerate(synthetic_rankings(num_ballots, num_candidates, num_ranks, seed), 1):
+                row = [str(record), '1', str(1 + record % 2), '1', '2']
+                columns = list()
+                for rank, mark in enumerate(marks, 1):
+                    if mark == -1:
+                        columns.append((str(101 + (record % num_candidates)), str(rank)))
+                        columns.append((str(101 + ((record + 1) % num_candidates)), str(rank)))
+                    elif mark is not None:
+                        columns.append((str(mark + 101), str(rank)))
+                columns = columns[:num_ranks]
+                columns.extend([('', '')] * (num_ranks - len(columns)))
+                for candidate_id, rank in columns:
+                    row.extend([candidate_id, rank])
+                fh.write((','.join(row) + '\n').encode())
+
+    return [filename], {'contest': 'Mayor'}
+
+
+def generate_us_vt_btv(directory: str, num_ballots: int, num_candidates: int, num_ranks: int,
+                       seed: int = 0) -> Tuple[List[str], Dict]:
+    filename = os.path.join(directory, 'btv.zip')
+    report_path = 'Mayor.txt'
+
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as zf:
+        with zf.open(report_path, 'w') as fh:
+            fh.write(b'.ELECTION "Synthetic Mayor"\r\n')
+            for i in range(num_candidates):
+                fh.write('.CANDIDATE C{:02d}, "Candidate {}"\r\n'.format(i + 1, i + 1).encode('ascii'))
+            fh.write(b'.FINAL-PILE\r\n')
+
+            for record, marks in enumerate(synthetic_rankings(num_ballots, num_candidates, num_ranks, seed), 1):
+                choices = list()
+                for mark in marks:
+                    if mark == -1:
+                        choices.append('C{:02d}=C{:02d}'.format(1, 2))
+                    elif mark is not None:
+                        choices.append('C{:02d}'.format(mark + 1))
+                fh.write('{:07d}, 1) {}\r\n'.format(record, ','.join(choices)).encode('ascii'))
+
+    return [filename], {'report_path': report_path}
+
+
+GENERATORS = {
+    'us_ca_sfo': generate_us_ca_sfo,
+    'us_me': generate_us_me,
+    'us_nm_saf': generate_us_nm_saf,
+    'us_vt_btv': generate_us_vt_btv,
+}  # type: Dict[str, Callable[..., Tuple[List[str], Dict]]]
@@ -0,0 +1,131 @@
+"""Time each importer (and optionally its normalizer) end to end on synthetic inputs.
+
+    python -m bench.run_benchmarks --ballots 1000 100000 --formats us_me us_nm_saf --normalize
+
+Every run happens in a fresh process so that peak RSS is measured per run. Generated inputs are kept in --data-dir
+and reused by later runs with the same shape.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from tempfile import TemporaryDirectory
+from typing import Dict, List
+
+from bench.generators import GENERATORS
+from ranked_vote_import.stats import peak_rss_bytes
+
+
+def run_import(input_format: str, files: List[str], params: Dict, normalize: bool, output: str, jobs: int,
+               result_queue: multiprocessing.Queue):
+    try:
+        from ranked_vote.format import write_ballots
+        from ranked_vote_import import FORMATS, NORMALIZERS
+
+        start = time.perf_counter()
+        ballots = reader = FORMATS[input_format](files, params, jobs=jobs)
+        if normalize:
+            normalizer = NORMALIZERS[input_format]()
+            ballots = (normalizer.normalize(ballot) for ballot in reader)
+
+        if output is None:
+            for _ in ballots:
+                pass
+        else:
+            write_ballots(output, ballots)
+
+        metadata = reader.get_metadata()
+        elapsed = time.perf_counter() - start
+        result_queue.put({
+            'seconds': elapsed,
+            'num_ballots': metadata['num_ballots'],
+            'ballots_per_second': metadata['num_ballots'] / elapsed if elapsed else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+        })
+    except Exception as e:
+        result_queue.put({'error': '{}: {}'.format(type(e).__name__, e)})
+
+
+def prepare_input(data_dir: str, input_format: str, num_ballots: int, num_candidates: int, num_ranks: int,
+                  seed: int):
+    directory = os.path.join(data_dir, '{}_{}_{}_{}_{}'.format(input_format, num_ballots, num_candidates, num_ranks,
+                                                               seed))
+    manifest = os.path.join(directory, 'input.json')
+    if os.path.exists(manifest):
+        with open(manifest) as fh:
+            generated = json.load(fh)
+        return generated['files'], generated['params']
+
+    os.makedirs(directory, exist_ok=True)
+    files, params = GENERATORS[input_format](directory, num_ballots, num_candidates, num_ranks, seed)
+    with open(manifest, 'w') as fh:
+        json.dump({'files': files, 'params': params}, fh)
+    return files, params
+
+
+def run_benchmark(input_format: str, files: List[str], params: Dict, normalize: bool, output: str,
+                  jobs: int) -> Dict:
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=run_import,
+                              args=(input_format, files, params, normalize, output, jobs, result_queue))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return result
+
+
+def format_result(result: Dict) -> str:
+    if 'error' in result:
+        return 'ERROR {}'.format(result['error'])
+    return '{:>10.3f}s {:>12,.0f} ballots/s {:>8.1f} MiB peak RSS'.format(
+        result['seconds'], result['ballots_per_second'] or 0, result['peak_rss_bytes'] / (1 << 20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--formats', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument('--ballots', nargs='+', type=int, default=[1000, 100000])
+    parser.add_argument('--candidates', type=int, default=8)
+    parser.add_argument('--ranks', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--write', action='store_true', help='Write the ballots to a gzipped CSV as rcv-import does.')
+    parser.add_argument('--params', type=json.loads, default=dict(),
+                        help='Extra reader params, e.g. to compare a fast path against the default reader.')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--data-dir', help='Where to keep generated inputs (default: a temporary directory).')
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to this file as JSON.')
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        results = list()
+        for input_format in args.formats:
+            for num_ballots in args.ballots:
+                try:
+                    files, params = prepare_input(data_dir, input_format, num_ballots, args.candidates, args.ranks,
+                                                  args.seed)
+                except ImportError as e:
+                    print('{:<10} {:>10,} skipped: {}'.format(input_format, num_ballots, e))
+                    continue
+
+                params = dict(params, **args.params)
+                output = os.path.join(tmp, 'ballots.csv.gz') if args.write else None
+                for run in range(args.repeat):
+                    result = run_benchmark(input_format, files, params, args.normalize, output, args.jobs)
+                    print('{:<10} {:>10,} {}'.format(input_format, num_ballots, format_result(result)))
+                    results.append(dict(result, format=input_format, ballots=num_ballots,
+                                        candidates=args.candidates, ranks=args.ranks, run=run,
+                                        normalize=args.normalize, params=params, jobs=args.jobs))
+
+        if args.json:
+            with open(args.json, 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Time how long rcv-import takes to start for each format, and which heavy dependencies it loads.
+
+    python -m bench.startup --repeat 20
+
+Each run is a fresh interpreter that imports the command line module and looks up one format and its normalizer,
+which is everything rcv-import does before it opens the input files. An empty interpreter is timed as a baseline.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+FORMAT_NAMES = ['us_ca_sfo', 'us_me', 'us_nm_saf', 'us_vt_btv']
+
+# Modules whose import dominates startup when they are loaded.
+HEAVY_MODULES = ['numpy', 'pandas', 'openpyxl', 'pyarrow']
+
+STARTUP_SCRIPT = '''
+import sys
+import ranked_vote_import.bin.import_rcv_data
+from ranked_vote_import import FORMATS, NORMALIZERS
+FORMATS[{input_format!r}], NORMALIZERS[{input_format!r}]
+print(' '.join(m for m in {heavy_modules!r} if m in sys.modules))
+'''
+
+
+def time_startup(input_format: str) -> Dict:
+    if input_format is None:
+        command = [sys.executable, '-c', 'pass']
+    else:
+        script = STARTUP_SCRIPT.format(input_format=input_format, heavy_modules=HEAVY_MODULES)
+        command = [sys.executable, '-c', script]
+
+    start = time.perf_counter()
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        return {'error': result.stderr.strip().splitlines()[-1]}
+    return {'seconds': elapsed, 'modules': result.stdout.split()}
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    errors = [r['error'] for r in runs if 'error' in r]
+    if errors:
+        return {'error': errors[0]}
+    seconds = [r['seconds'] for r in runs]
+    return {
+        'median_seconds': statistics.median(seconds),
+        'min_seconds': min(seconds),
+        'modules': runs[0]['modules'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--formats', nargs='+', default=FORMAT_NAMES)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to this file as JSON.')
+    args = parser.parse_args()
+
+    results = list()
+    for input_format in [None] + args.formats:
+        result = summarize([time_startup(input_format) for _ in range(args.repeat)])
+        label = input_format or '(python)'
+        if 'error' in result:
+            print('{:<10} ERROR {}'.format(label, result['error']))
+        else:
+            print('{:<10} {:>8.1f} ms median {:>8.1f} ms min   {}'.format(
+                label, result['median_seconds'] * 1000, result['min_seconds'] * 1000, ' '.join(result['modules'])))
+        results.append(dict(result, format=input_format, repeat=args.repeat))
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,42 @@
-from typing import Dict, Type
-
-from ranked_vote_import.base_normalizer import BaseNormalizer
-from ranked_vote_import.base_reader import BaseReader
-from ranked_vote_import.formats.us.ca.sfo import SanFranciscoImporter, SanFranciscoNormalizer
-from ranked_vote_import.formats.us.me import MaineImporter, MaineNormalizer
-from ranked_vote_import.formats.us.nm.saf import SantaFeImporter, SantaFeNormalizer
-from ranked_vote_import.formats.us.vt.btv import BurlingtonImporter, BurlingtonNormalizer
-
-FORMATS = {
-    'us_ca_sfo': SanFranciscoImporter,
-    'us_me': MaineImporter,
-    'us_nm_saf': SantaFeImporter,
-    'us_vt_btv': BurlingtonImporter,
-}  # type: Dict[str, Type[BaseReader]]
-
-NORMALIZERS = {
-    'us_ca_sfo': SanFranciscoNormalizer,
-    'us_me': MaineNormalizer,
-    'us_nm_saf': SantaFeNormalizer,
-    'us_vt_btv': BurlingtonNormalizer,
-}  # type: Dict[str, Type[BaseNormalizer]]
+import sys
+from types import ModuleType
+from typing import Mapping, Type, TYPE_CHECKING
+
+from ranked_vote_import.registry import LazyRegistry
+
+if TYPE_CHECKING:
+    from ranked_vote_import.base_normalizer import BaseNormalizer
+    from ranked_vote_import.base_reader import BaseReader
+
+__version__ = '0.0.1'
+
+# Format modules are only imported when a format is looked up, so that e.g. a San Francisco import does not load
+# pandas for the Maine reader.
+FORMATS = LazyRegistry({
+    'us_ca_sfo': 'ranked_vote_import.formats.us.ca.sfo:SanFranciscoImporter',
+    'us_me': 'ranked_vote_import.formats.us.me:MaineImporter',
+    'us_nm_saf': 'ranked_vote_import.formats.us.nm.saf:SantaFeImporter',
+    'us_vt_btv': 'ranked_vote_import.formats.us.vt.btv:BurlingtonImporter',
+}, 'ranked_vote_import.formats')  # type: Mapping[str, Type[BaseReader]]
+
+NORMALIZERS = LazyRegistry({
+    'us_ca_sfo': 'ranked_vote_import.formats.us.ca.sfo:SanFranciscoNormalizer',
+    'us_me': 'ranked_vote_import.formats.us.me:MaineNormalizer',
+    'us_nm_saf': 'ranked_vote_import.formats.us.nm.saf:SantaFeNormalizer',
+    'us_vt_btv': 'ranked_vote_import.formats.us.vt.btv:BurlingtonNormalizer',
+}, 'ranked_vote_import.normalizers')  # type: Mapping[str, Type[BaseNormalizer]]
+
+
+class _Module(ModuleType):
+    """The class of this package's module, for the module __getattr__ that PEP 562 only allows from Python 3.7."""
+
+    def __getattr__(self, attribute: str):
+        # The importer and normalizer classes used to be imported here; keep them available by name.
+        for registry in (FORMATS, NORMALIZERS):
+            name = registry.find_attribute(attribute)
+            if name is not None:
+                return registry[name]
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, attribute))
+
+
+sys.modules[__name__].__class__ = _Module
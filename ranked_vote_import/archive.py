@@ -0,0 +1,160 @@
+import io
+import mmap
+import struct
+import zipfile
+import zlib
+from typing import BinaryIO, List, Optional
+
+# Deflated members are read and inflated in chunks of this size, rather than zipfile's 4 KiB reads.
+INFLATE_CHUNK_SIZE = 1 << 20
+
+# The fixed part of a local file header, which is followed by the file name and an extra field.
+LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+class MappedMember(io.BufferedIOBase):
+    """A stored (uncompressed) zip member, read directly from a memory map of the archive. Reads are plain copies
+    out of the page cache."""
+
+    # No need to read ahead of the parser on another thread.
+    in_memory = True
+
+    def __init__(self, archive_map: mmap.mmap, start: int, end: int):
+        super().__init__()
+        self._map = archive_map
+        self._start = self._position = start
+        self._end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = self._end if size is None or size < 0 else min(self._position + size, self._end)
+        data = self._map[self._position:end]
+        self._position = max(self._position, end)
+        return data
+
+    read1 = read
+
+    def readinto(self, b) -> int:
+        size = min(len(b), self._end - self._position)
+        b[:size] = self._map[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        newline = self._map.find(b'\n', self._position, self._end)
+        end = self._end if newline < 0 else newline + 1
+        if size is not None and size >= 0:
+            end = min(end, self._position + size)
+        return self.read(end - self._position)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: self._start, io.SEEK_CUR: self._position, io.SEEK_END: self._end}[whence]
+        self._position = max(self._start, base + offset)
+        return self.tell()
+
+    def tell(self) -> int:
+        return self._position - self._start
+
+
+class _InflatedRaw(io.RawIOBase):
+    def __init__(self, fh: BinaryIO, info: zipfile.ZipInfo):
+        super().__init__()
+        self._fh = fh
+        self._info = info
+        self._remaining = info.compress_size
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._buffer = memoryview(b'')
+        self._crc = 0
+        self._size = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _finish(self):
+        if self._size != self._info.file_size or self._crc != self._info.CRC:
+            raise zipfile.BadZipFile('Bad CRC-32 for file {!r}'.format(self._info.filename))
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            if self._decompressor.eof:
+                self._finish()
+                return 0
+            data = self._decompressor.unconsumed_tail
+            if not data and self._remaining:
+                data = self._fh.read(min(INFLATE_CHUNK_SIZE, self._remaining))
+                self._remaining -= len(data)
+            chunk = self._decompressor.decompress(data, INFLATE_CHUNK_SIZE)
+            if not chunk and not data and not self._decompressor.eof:
+                raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+            self._crc = zlib.crc32(chunk, self._crc)
+            self._size += len(chunk)
+            self._buffer = memoryview(chunk)
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        self._fh.close()
+        super().close()
+
+
+class ZipArchive:
+    """Opens the members of a zip archive for sequential reading: stored members through a memory map of the
+    archive (see MappedMember), deflated ones through a streaming inflater with large buffers that reads the
+    compressed data from the same map, and anything else (other compression methods, encryption) through zipfile.
+    The archive file is opened once, for both zipfile and the map."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._fh = open(filename, 'rb')
+        try:
+            self._zip = zipfile.ZipFile(self._fh)
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._fh.close()
+            raise
+
+    def namelist(self) -> List[str]:
+        return self._zip.namelist()
+
+    def _data_offset(self, info: zipfile.ZipInfo) -> int:
+        # The local header's name and extra field may differ in length from the central directory's.
+        if info.header_offset + LOCAL_HEADER.size > len(self._map):
+            raise zipfile.BadZipFile('Truncated file header of {!r}'.format(info.filename))
+        header = LOCAL_HEADER.unpack_from(self._map, info.header_offset)
+        if header[0] != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile('Bad magic number for file header of {!r}'.format(info.filename))
+        return info.header_offset + LOCAL_HEADER.size + header[-2] + header[-1]
+
+    def open(self, name: str) -> BinaryIO:
+        info = self._zip.getinfo(name)
+        if info.flag_bits & 0x1:
+            return self._zip.open(info)
+
+        if info.compress_type == zipfile.ZIP_STORED:
+            start = self._data_offset(info)
+            return MappedMember(self._map, start, start + info.file_size)
+        elif info.compress_type == zipfile.ZIP_DEFLATED:
+            start = self._data_offset(info)
+            compressed = MappedMember(self._map, start, start + info.compress_size)
+            return io.BufferedReader(_InflatedRaw(compressed, info), INFLATE_CHUNK_SIZE)
+        return self._zip.open(info)
+
+    def close(self):
+        self._zip.close()
+        self._map.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
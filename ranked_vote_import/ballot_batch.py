@@ -0,0 +1,175 @@
+from abc import ABC, abstractmethod
+from typing import List, Iterator, Dict, Iterable, Optional
+
+import numpy as np
+
+from ranked_vote.ballot import Ballot, Candidate, Choice, UNDERVOTE, OVERVOTE, WRITE_IN
+
+# Candidates are coded by their position in the candidate table; the special choices get reserved negative codes.
+UNDERVOTE_CODE = -1
+OVERVOTE_CODE = -2
+WRITE_IN_CODE = -3
+# Fills the rest of a row when a ballot has fewer choices than the widest ballot in its batch.
+PADDING_CODE = -4
+
+CODE_DTYPE = np.int32
+
+# Ballots given to a BatchConsumer one at a time are handled in batches of this size.
+BUFFER_SIZE = 10000
+
+# Indexing a list with a negative code counts back from its end, so appending these to the candidate table lets the
+# same lookup decode candidate and reserved codes alike.
+_RESERVED_CHOICES = [None, WRITE_IN, OVERVOTE, UNDERVOTE]
+
+
+class ChoiceEncoder:
+    """Assigns codes to choices, adding each new candidate to the end of a candidate table."""
+
+    def __init__(self, candidates: Optional[List[Candidate]] = None):
+        self.candidates = list(candidates or [])  # type: List[Candidate]
+        self._codes = {candidate: code for code, candidate in enumerate(self.candidates)}  # type: Dict[Candidate, int]
+
+    def code(self, choice: Choice) -> int:
+        # The special choices compare by identity and are not hashable, so they are checked before the dict lookup.
+        if choice is UNDERVOTE:
+            return UNDERVOTE_CODE
+        elif choice is OVERVOTE:
+            return OVERVOTE_CODE
+        elif choice is WRITE_IN:
+            return WRITE_IN_CODE
+
+        code = self._codes.get(choice)
+        if code is None:
+            code = self._codes[choice] = len(self.candidates)
+            self.candidates.append(choice)
+        return code
+
+
+class BallotBatch:
+    """A block of ballots held as a list of ballot ids, a (ballots x ranks) matrix of choice codes, the number of
+    choices on each ballot, and the candidate table that candidate codes index into. Ballot objects are only built
+    when a consumer asks for them."""
+
+    def __init__(self, ballot_ids: List[str], choices: np.ndarray, candidates: List[Candidate],
+                 lengths: Optional[np.ndarray] = None):
+        self.ballot_ids = ballot_ids
+        self.choices = choices
+        self.candidates = candidates
+        if lengths is None:
+            lengths = np.full(len(ballot_ids), choices.shape[1], dtype=CODE_DTYPE)
+        self.lengths = lengths
+
+    def __len__(self):
+        return len(self.ballot_ids)
+
+    @staticmethod
+    def from_rows(ballot_ids: List[str], rows: List[List[int]], candidates: List[Candidate]) -> 'BallotBatch':
+        lengths = np.fromiter((len(row) for row in rows), dtype=CODE_DTYPE, count=len(rows))
+        choices = np.full((len(rows), int(lengths.max()) if len(rows) else 0), PADDING_CODE, dtype=CODE_DTYPE)
+        for i, row in enumerate(rows):
+            choices[i, :len(row)] = row
+        return BallotBatch(ballot_ids, choices, candidates, lengths)
+
+    @staticmethod
+    def from_ballots(ballots: Iterable[Ballot], encoder: ChoiceEncoder) -> 'BallotBatch':
+        ballot_ids = list()
+        rows = list()
+        for ballot in ballots:
+            ballot_ids.append(ballot.ballot_id)
+            rows.append([encoder.code(choice) for choice in ballot.choices])
+        return BallotBatch.from_rows(ballot_ids, rows, encoder.candidates)
+
+    def to_ballots(self) -> Iterator[Ballot]:
+        lookup = np.empty(len(self.candidates) + len(_RESERVED_CHOICES), dtype=object)
+        lookup[:] = list(self.candidates) + _RESERVED_CHOICES
+        decoded = lookup[self.choices].tolist()
+        width = self.choices.shape[1]
+
+        for ballot_id, choices, length in zip(self.ballot_ids, decoded, self.lengths.tolist()):
+            yield Ballot(ballot_id, choices if length == width else choices[:length])
+
+
+class BatchConsumer(ABC):
+    """Works through ballots a batch at a time in add_batch(). Ballots added one at a time are buffered into batches,
+    and flush() handles any left over, so subclasses call it before reporting their results."""
+
+    def __init__(self):
+        self._pending = list()  # type: List[Ballot]
+
+    @abstractmethod
+    def add_batch(self, batch: BallotBatch):
+        pass
+
+    def add(self, ballot: Ballot):
+        self._pending.append(ballot)
+        if len(self._pending) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.add_batch(BallotBatch.from_ballots(self._pending, ChoiceEncoder()))
+            self._pending = list()
+
+    def add_ballots(self, ballots: Iterable[Ballot]) -> Iterator[Ballot]:
+        """Pass ballots through, adding each one."""
+        for ballot in ballots:
+            self.add(ballot)
+            yield ballot
+
+    def add_batches(self, batches: Iterable[BallotBatch]) -> Iterator[BallotBatch]:
+        """Pass batches through, adding each one."""
+        for batch in batches:
+            self.add_batch(batch)
+            yield batch
+
+
+def _previous_position(mask: np.ndarray) -> np.ndarray:
+    """For each cell, the column of the nearest cell strictly to its left where mask is set, or -1."""
+    positions = np.where(mask, np.arange(mask.shape[1]), -1)
+    latest = np.maximum.accumulate(positions, axis=1)
+    previous = np.full_like(latest, -1)
+    previous[:, 1:] = latest[:, :-1]
+    return previous
+
+
+def normalize_codes(batch: BallotBatch, exhaust_on_repeated_undervote: bool = False) -> BallotBatch:
+    """Apply the common normalization rules to a whole batch at once: undervotes are skipped, a ballot is exhausted
+    at its first overvote (which is kept), repeated choices are dropped, and each ballot is padded back to its
+    original length with undervotes. With exhaust_on_repeated_undervote, a ballot is also exhausted at an undervote
+    that follows another undervote with no new choice in between (Maine's two-consecutive-skipped-rankings rule)."""
+    choices = batch.choices
+    num_ballots, width = choices.shape
+    if width == 0:
+        return batch
+    positions = np.arange(width)
+
+    is_undervote = choices == UNDERVOTE_CODE
+    is_overvote = choices == OVERVOTE_CODE
+    is_choice = (choices >= 0) | (choices == WRITE_IN_CODE)
+
+    # Ballots have few ranks, so comparing each column with the ones before it is cheap.
+    repeated = np.zeros_like(is_choice)
+    for col in range(1, width):
+        repeated[:, col] = (choices[:, :col] == choices[:, col:col + 1]).any(axis=1)
+    is_new = is_choice & ~repeated
+
+    stop = np.where(is_overvote.any(axis=1), is_overvote.argmax(axis=1), width)
+    if exhaust_on_repeated_undervote:
+        repeated_undervote = is_undervote & (_previous_position(is_undervote) > _previous_position(is_new))
+        stop_undervote = np.where(repeated_undervote.any(axis=1), repeated_undervote.argmax(axis=1), width)
+        stopped_by_overvote = stop < stop_undervote
+        stop = np.minimum(stop, stop_undervote)
+    else:
+        stopped_by_overvote = stop < width
+
+    kept = is_new & (positions < stop[:, None])
+    num_kept = kept.sum(axis=1)
+
+    normalized = np.full_like(choices, UNDERVOTE_CODE)
+    rows, cols = np.nonzero(kept)
+    normalized[rows, (np.cumsum(kept, axis=1) - 1)[rows, cols]] = choices[rows, cols]
+    overvote_rows = np.nonzero(stopped_by_overvote)[0]
+    normalized[overvote_rows, num_kept[overvote_rows]] = OVERVOTE_CODE
+    normalized[positions >= batch.lengths[:, None]] = PADDING_CODE
+
+    return BallotBatch(batch.ballot_ids, normalized, batch.candidates, batch.lengths)
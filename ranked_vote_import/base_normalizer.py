@@ -1,9 +1,21 @@
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
 
 from ranked_vote.ballot import Ballot
 
+if TYPE_CHECKING:
+    from ranked_vote_import.ballot_batch import BallotBatch
+
 
 class BaseNormalizer(ABC):
     @abstractmethod
     def normalize(self, ballot: Ballot) -> Ballot:
         pass
+
+    def normalize_batch(self, batch: 'BallotBatch') -> 'BallotBatch':
+        """Normalize every ballot in a batch. Normalizing only drops, moves or adds special choices, so the batch's
+        candidate table still applies to the result."""
+        from ranked_vote_import.ballot_batch import BallotBatch, ChoiceEncoder
+
+        return BallotBatch.from_ballots((self.normalize(ballot) for ballot in batch.to_ballots()),
+                                        ChoiceEncoder(batch.candidates))
@@ -1,31 +1,235 @@
 import hashlib
+import json
+import os
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
 from os.path import join
-from typing import List, Dict
+from threading import Lock, Thread
+from types import GeneratorType
+from typing import List, Dict, Iterator, Tuple, Any, Optional, BinaryIO, Hashable, TYPE_CHECKING
 
-from ranked_vote.ballot import Ballot, Candidate
+from ranked_vote.ballot import Ballot, Candidate, Choice
 
+if TYPE_CHECKING:
+    from ranked_vote_import.ballot_batch import BallotBatch
+    from ranked_vote_import.stats import ImportHook
+
+BATCH_SIZE = 10000
+
+HASH_CHUNK_SIZE = 1 << 20
+
+# How often, in ballots, hooks are told how far a ballot-at-a-time read has got.
+PROGRESS_INTERVAL = 10000
+
+
+class Sha1Cache:
+    """A JSON file of file digests keyed by path, size and modification time, so that unchanged inputs are not
+    hashed again on every import."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._lock = Lock()
+        try:
+            with open(filename) as fh:
+                self._entries = json.load(fh)  # type: Dict[str, dict]
+        except (FileNotFoundError, ValueError):
+            self._entries = dict()
+
+    def get(self, filename: str) -> Optional[str]:
+        stat = os.stat(filename)
+        with self._lock:
+            entry = self._entries.get(os.path.realpath(filename))
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry['sha1']
+        return None
+
+    def put(self, filename: str, stat: os.stat_result, sha1: str):
+        with self._lock:
+            self._entries[os.path.realpath(filename)] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'sha1': sha1,
+            }
+
+    def save(self):
+        with self._lock:
+            # Several processes may share a cache file, e.g. in a batch import.
+            tmp_filename = '{}.{}.tmp'.format(self.filename, os.getpid())
+            with open(tmp_filename, 'w') as fh:
+                json.dump(self._entries, fh, sort_keys=True, indent=2)
+            os.replace(tmp_filename, self.filename)
+
+
+def get_file_sha1(filename, cache: Optional[Sha1Cache] = None):
+    if cache is not None:
+        sha1 = cache.get(filename)
+        if sha1 is not None:
+            return sha1
+        # Stat before reading, so that a file modified while it is hashed is not cached under its new mtime.
+        stat = os.stat(filename)
 
-def get_file_sha1(filename):
     with open(filename, 'rb') as fh:
         h = hashlib.sha1()
-        h.update(fh.read())
-        return h.hexdigest()
+        for chunk in iter(partial(fh.read, HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+
+    if cache is not None:
+        cache.put(filename, stat, h.hexdigest())
+    return h.hexdigest()
+
+
+def update_sha1(sha1, fh: BinaryIO, size: int) -> int:
+    """Feed up to size bytes from fh into sha1, returning the number of bytes read."""
+    read = 0
+    while read < size:
+        chunk = fh.read(min(HASH_CHUNK_SIZE, size - read))
+        if not chunk:
+            break
+        sha1.update(chunk)
+        read += len(chunk)
+    return read
+
+
+def _read_partition(reader: 'BaseReader', partition) -> Tuple['BallotBatch', list]:
+    """Runs in a worker process. Ballots are sent back as a single batch, which pickles compactly and keeps the
+    special choices (which compare by identity) as codes until the parent process decodes them."""
+    from ranked_vote_import.ballot_batch import BallotBatch, ChoiceEncoder
+
+    batch = BallotBatch.from_ballots(reader.read_partition(partition), ChoiceEncoder())
+    return batch, list(reader.candidates)
 
 
 class BaseReader(ABC):
     _params: Dict
 
-    def __init__(self, files: List[str], params: Dict, base_dir: str = '.'):
+    # Bump when a change to the format's reader or normalizer changes the ballots or metadata it produces, so that
+    # imports cached by an earlier version are not reused.
+    format_version = 1
+    # Formats that implement get_position() and seek_position(), so that a later import can continue from where an
+    # earlier one stopped.
+    supports_checkpoints = False
+    # Set before the first ballot is read to have the reader keep the state that get_position() needs.
+    track_checkpoints = False
+    # How many of the ballots read so far lie past the position get_position() returns. Positions only advance past
+    # complete records, so the ballots at the end of an input that may have been cut off mid-record, such as an
+    # election night drop, are read again after restore_checkpoint().
+    ballots_past_position = 0
+    # Set before the first ballot is read to have compressed input streams decompressed ahead of parsing, on
+    # another thread.
+    read_ahead = False
+    # Set before the first ballot is read to have the reader check its input as it parses it, and report problems
+    # to its hooks' anomaly().
+    validate = False
+
+    # Attributes left out when a reader is pickled into a worker process.
+    _unpicklable = ('_hash_thread', '_hash_error', '_file_hashes', '_sha1_cache', '_hooks')
+    _hooks = ()  # type: List[ImportHook]
+    _hash_thread = None  # type: Optional[Thread]
+
+    # Candidates by raw name as written in the input, and by canonical name; created on first use.
+    _resolved_candidates = None  # type: Optional[Dict[str, Choice]]
+    _canonical_candidates = None  # type: Optional[Dict[Hashable, Choice]]
+
+    def __init__(self, files: List[str], params: Dict, base_dir: str = '.', jobs: int = 1,
+                 sha1_cache: Optional[Sha1Cache] = None, hooks: Optional[List['ImportHook']] = None):
         self._params = params
+        self._hooks = list(hooks or [])
         self.num_ballots = 0
+        self.contests = list(params.get('contests', []))
+        self.contest_num_ballots = dict()  # type: Dict[Any, int]
         self.done_reading = False
         self.filenames = [join(base_dir, f) for f in files]
-        self.files = [{
+
+        # Input files are hashed on a background thread while they are parsed, so that the parser does not wait for
+        # a full extra pass over every file and both mostly share the same page-cached reads. The thread starts with
+        # the read (see _start_hashing()), so readers that never read, such as those in worker processes, do not hash.
+        self._sha1_cache = sha1_cache
+        self._file_hashes = dict()  # type: Dict[str, str]
+        self._hash_error = None  # type: Optional[Exception]
+
+        self._merged_choices = dict()  # type: Dict[str, Candidate]
+        self._parallel_ballots = None  # type: Optional[Iterator[Ballot]]
+        self.read()
+
+        if jobs > 1 and not self.contests:
+            partitions = self.partitions(jobs)
+            if partitions is not None:
+                self._parallel_ballots = self._read_parallel(partitions, jobs)
+
+    def _start_hashing(self):
+        if self._hash_thread is None:
+            self._hash_thread = Thread(target=self._hash_files, daemon=True)
+            self._hash_thread.start()
+
+    def _finish_reading(self):
+        self.done_reading = True
+        # Nothing reads the input files once the reader is done with them.
+        if self._hash_thread is not None:
+            self._hash_thread.join()
+
+    def _hash_files(self):
+        try:
+            for filename in self.filenames:
+                with self.stage('hash'):
+                    self._file_hashes[filename] = get_file_sha1(filename, self._sha1_cache)
+            if self._sha1_cache is not None:
+                self._sha1_cache.save()
+        except Exception as e:
+            self._hash_error = e
+
+    @contextmanager
+    def stage(self, name: str):
+        """Attribute the time spent in the block to the named stage, for any hooks the reader was given."""
+        for hook in self._hooks:
+            hook.enter_stage(name)
+        try:
+            yield
+        finally:
+            for hook in reversed(self._hooks):
+                hook.exit_stage(name)
+
+    def timed_stream(self, fh: BinaryIO, stage: str) -> BinaryIO:
+        """Return fh, wrapped so that its reads count towards the given stage if the reader has hooks."""
+        if not self._hooks:
+            return fh
+        from ranked_vote_import.stats import TimedStream
+        return TimedStream(fh, self, stage)
+
+    def read_ahead_stream(self, fh: BinaryIO) -> BinaryIO:
+        """Return fh, wrapped to be read ahead on another thread if read_ahead is set. Use it as a context manager
+        inside the one that closes fh. Members of a zip archive that are read from memory are left as they are."""
+        if not self.read_ahead or getattr(fh, 'in_memory', False):
+            return fh
+        from ranked_vote_import.pipeline import read_ahead
+        return read_ahead(fh)
+
+    def _progress(self):
+        for hook in self._hooks:
+            hook.progress(self.num_ballots)
+
+    def anomaly(self, kind: str, ballot_id: Optional[str] = None):
+        for hook in self._hooks:
+            hook.anomaly(kind, ballot_id)
+
+    @property
+    def input_file_bytes(self) -> int:
+        """The total size of the input files, which a partial read (e.g. after restore_checkpoint()) does not read
+        in full."""
+        return sum(os.path.getsize(filename) for filename in self.filenames)
+
+    @property
+    def files(self) -> List[dict]:
+        self._start_hashing()
+        self._hash_thread.join()
+        if self._hash_error is not None:
+            raise self._hash_error
+        return [{
             'name': filename,
-            'sha1': get_file_sha1(filename)
+            'sha1': self._file_hashes[filename]
         } for filename in self.filenames]
-        self.read()
 
     @abstractmethod
     def read(self):
@@ -45,21 +249,189 @@ class BaseReader(ABC):
             'format': self.format_name,
         }
 
+    def get_contest_metadata(self, contest) -> dict:
+        assert self.done_reading
+        return {
+            'num_ballots': self.contest_num_ballots[contest],
+            'candidate_ids': [str(c) for c in self.contest_candidates(contest)],
+            'files': self.files,
+            'format': self.format_name,
+            'contest': contest,
+        }
+
     @abstractmethod
     def read_next_ballot(self) -> Ballot:
         pass
 
+    def canonical_candidate_name(self, raw: str) -> str:
+        """Return the canonical name of a candidate as written in the input. Formats override this with their own
+        clean-up rules."""
+        return raw
+
+    def candidate_key(self, raw: str, name: str) -> Hashable:
+        """Return the key that raw names resolving to the same candidate share: by default their canonical name."""
+        return name
+
+    def new_candidate(self, raw: str, name: str) -> Choice:
+        """Create the candidate for a canonical name the first time it is resolved."""
+        return Candidate(name)
+
+    def resolve_candidate(self, raw: str) -> Choice:
+        """Return the candidate for a name as written in the input. Each distinct raw name is canonicalized once per
+        reader, and every raw name with the same candidate_key() resolves to the same candidate, across all of the
+        reader's files."""
+        if self._resolved_candidates is None:
+            self._resolved_candidates = dict()
+            self._canonical_candidates = dict()
+
+        candidate = self._resolved_candidates.get(raw)
+        if candidate is None:
+            name = self.canonical_candidate_name(raw)
+            key = self.candidate_key(raw, name)
+            candidate = self._canonical_candidates.get(key)
+            if candidate is None:
+                candidate = self._canonical_candidates[key] = self.new_candidate(raw, name)
+            self._resolved_candidates[raw] = candidate
+        return candidate
+
+    def contest_candidates(self, contest) -> List[Candidate]:
+        raise NotImplementedError('Format {} does not support multi-contest import.'.format(self.format_name))
+
+    def read_contests(self) -> Iterator[Tuple[Any, Ballot]]:
+        """Yield (contest, ballot) pairs for every contest in self.contests, in a single pass over the input."""
+        raise NotImplementedError('Format {} does not support multi-contest import.'.format(self.format_name))
+
+    def iter_contests(self) -> Iterator[Tuple[Any, Ballot]]:
+        assert not self.done_reading
+        self._start_hashing()
+        self.contest_num_ballots = {contest: 0 for contest in self.contests}
+        for contest, ballot in self.read_contests():
+            self.contest_num_ballots[contest] += 1
+            self.num_ballots += 1
+            if self._hooks and not self.num_ballots % PROGRESS_INTERVAL:
+                self._progress()
+            yield contest, ballot
+        self._finish_reading()
+
+    def partitions(self, jobs: int) -> Optional[list]:
+        """Return picklable units of work that read_partition() can read independently in worker processes, or None
+        if this format (or this particular input) can only be read serially."""
+        return None
+
+    def read_partition(self, partition) -> Iterator[Ballot]:
+        raise NotImplementedError('Format {} does not support parallel import.'.format(self.format_name))
+
+    def merge_candidates(self, candidates: list):
+        """Merge the candidates a worker process registered while reading one partition."""
+        pass
+
+    def _merge_choice(self, candidate: Candidate) -> Candidate:
+        return self._merged_choices.setdefault(candidate.candidate_id, candidate)
+
+    def _read_parallel(self, partitions: list, jobs: int) -> Iterator[Ballot]:
+        # Imported here; the process pool machinery takes a noticeable share of startup time for serial imports.
+        from concurrent.futures import ProcessPoolExecutor
+
+        partitions = iter(partitions)
+        with ProcessPoolExecutor(jobs) as executor:
+            # Keep a bounded window of partitions in flight, and consume results in submission order so that the
+            # ballots come out in the same order as a serial read.
+            pending = deque(executor.submit(_read_partition, self, p) for p in islice(partitions, 2 * jobs))
+            while pending:
+                batch, candidates = pending.popleft().result()
+                for partition in islice(partitions, 1):
+                    pending.append(executor.submit(_read_partition, self, partition))
+
+                self.merge_candidates([self._merge_choice(c) if isinstance(c, Candidate) else c for c in candidates])
+                batch.candidates = [self._merge_choice(c) for c in batch.candidates]
+                yield from batch.to_ballots()
+
+    def get_position(self) -> Optional[dict]:
+        """Return a JSON-serializable description of how far the input has been read, including a digest of the data
+        read so far, or None if the reader did not track it."""
+        return None
+
+    def seek_position(self, position: dict) -> bool:
+        """Make the read continue after a position returned by get_position(), provided the input still begins with
+        exactly the data that had been read up to it. Otherwise return False and leave the reader unchanged."""
+        return False
+
+    def get_checkpoint(self) -> Optional[dict]:
+        """Return a checkpoint of the read so far, for restore_checkpoint(). It may be taken between any two ballots
+        of a serial read, as well as at the end, and covers all but the last ballots_past_position of them."""
+        position = self.get_position()
+        if position is None:
+            return None
+        return {
+            'format': self.format_name,
+            'num_ballots': self.num_ballots - self.ballots_past_position,
+            'position': position,
+        }
+
+    def restore_checkpoint(self, checkpoint: dict) -> bool:
+        """Continue reading after a checkpoint of an earlier read of the same input, or of an earlier version of it
+        that the current one appends to. Returns False if the reader has to start over instead."""
+        assert not self.done_reading and not self.num_ballots
+        if checkpoint.get('format') != self.format_name or not self.seek_position(checkpoint['position']):
+            return False
+        self.num_ballots = checkpoint['num_ballots']
+        return True
+
+    def __getstate__(self):
+        # Readers are pickled into worker processes before they start reading; open generators and the hashing
+        # thread's state stay behind.
+        return {k: v for k, v in self.__dict__.items()
+                if k not in self._unpicklable and not isinstance(v, GeneratorType)}
+
+    def _next_ballot(self) -> Ballot:
+        if self._parallel_ballots is not None:
+            return next(self._parallel_ballots)
+        return self.read_next_ballot()
+
+    def read_batches(self, batch_size: int) -> Iterator['BallotBatch']:
+        """Yield the remaining ballots as batches. Readers with a columnar source override this to build batches
+        directly instead of encoding Ballot objects."""
+        from ranked_vote_import.ballot_batch import BallotBatch, ChoiceEncoder
+
+        def unbatched():
+            while True:
+                try:
+                    yield self._next_ballot()
+                except StopIteration:
+                    return
+
+        ballots = unbatched()
+        encoder = ChoiceEncoder()
+        while True:
+            batch = BallotBatch.from_ballots(islice(ballots, batch_size), encoder)
+            if not len(batch):
+                return
+            yield batch
+
+    def batches(self, batch_size: int = BATCH_SIZE) -> Iterator['BallotBatch']:
+        assert not self.done_reading
+        self._start_hashing()
+        for batch in self.read_batches(batch_size):
+            self.num_ballots += len(batch)
+            if self._hooks:
+                self._progress()
+            yield batch
+        self._finish_reading()
+
     def __next__(self) -> Ballot:
         assert not self.done_reading
         try:
-            ballot = self.read_next_ballot()
+            ballot = self._next_ballot()
             self.num_ballots += 1
+            if self._hooks and not self.num_ballots % PROGRESS_INTERVAL:
+                self._progress()
             return ballot
         except StopIteration:
-            self.done_reading = True
+            self._finish_reading()
             raise
 
     def __iter__(self):
+        self._start_hashing()
         return self
 
     @property
@@ -0,0 +1,212 @@
+"""Import many elections listed in a JSON or YAML manifest, in a pool of worker processes.
+
+A manifest is a list of jobs (or an object with a "jobs" list). Each job has a format, files and an output, as
+given to rcv-import, and optionally a name, params, normalize, contests, batch_size, output_format, tallies and
+validate. Relative paths are relative to the manifest:
+
+    - format: us_ca_sfo
+      files: [sf/MasterLookup.txt, sf/BallotImage.txt]
+      params: {contest: 18}
+      normalize: true
+      output: out/sf_mayor.csv.gz
+
+Jobs whose outputs were written by an earlier run from the same inputs and options are skipped.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from os.path import join
+from sys import stderr
+from typing import Dict, List, Optional
+
+from ranked_vote_import import FORMATS
+from ranked_vote_import.base_reader import Sha1Cache, get_file_sha1
+from ranked_vote_import.bin.import_rcv_data import import_rcv_data, contest_output_filename, metadata_filename
+from ranked_vote_import.cache import ImportCache
+from ranked_vote_import.output import output_format_for
+
+JOB_OPTIONS = ('normalize', 'params', 'contests', 'batch_size', 'output_format', 'tallies', 'validate')
+
+MANIFEST_EXTENSION = r'\.(?:json|ya?ml)$'
+
+
+def read_manifest(filename: str) -> List[dict]:
+    with open(filename) as manifest_fh:
+        if re.search(r'\.ya?ml$', filename):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('Reading a YAML manifest requires PyYAML (pip install pyyaml).')
+            manifest = yaml.safe_load(manifest_fh)
+        else:
+            manifest = json.load(manifest_fh)
+
+    if isinstance(manifest, dict):
+        manifest = manifest['jobs']
+
+    base_dir = os.path.dirname(os.path.abspath(filename))
+    jobs = list()
+    for i, job in enumerate(manifest):
+        missing = {'format', 'files', 'output'} - set(job)
+        if missing:
+            raise ValueError('Job {} of {} has no {}.'.format(i, filename, ', '.join(sorted(missing))))
+        unknown = set(job) - {'name', 'format', 'files', 'output'} - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError('Job {} of {} has unknown keys {}.'.format(i, filename, ', '.join(sorted(unknown))))
+
+        jobs.append(dict(job,
+                         name=job.get('name', job['output']),
+                         files=[join(base_dir, f) for f in job['files']],
+                         output=join(base_dir, job['output'])))
+    return jobs
+
+
+def job_outputs(job: dict) -> List[str]:
+    if job.get('contests'):
+        outputs = [contest_output_filename(job['output'], contest) for contest in job['contests']]
+    else:
+        outputs = [job['output']]
+    return outputs + [metadata_filename(output) for output in outputs]
+
+
+def job_key(job: dict, sha1_cache: Optional[Sha1Cache]) -> str:
+    """The import cache key of a job, which changes whenever its inputs or anything affecting its output does."""
+    file_hashes = [get_file_sha1(f, sha1_cache) for f in job['files']]
+    output = job['output']
+    output_type = (job.get('output_format') or output_format_for(output)) + ('.gz' if output.endswith('.gz') else '')
+    params = dict(job.get('params') or {})
+    if job.get('contests'):
+        params['contests'] = job['contests']
+    for option in ('tallies', 'validate'):
+        if job.get(option):
+            params[option] = True
+    return ImportCache.key(job['format'], file_hashes, params, bool(job.get('normalize')), output_type,
+                           FORMATS[job['format']].format_version)
+
+
+def run_job(job: dict, sha1_cache: Optional[str]) -> dict:
+    """Runs in a worker process."""
+    start = time.perf_counter()
+    result = {'name': job['name'], 'output': job['output']}
+    try:
+        os.makedirs(os.path.dirname(job['output']) or '.', exist_ok=True)
+        options = {option: job[option] for option in JOB_OPTIONS if option in job}
+        options['params'] = job.get('params') or dict()
+        import_rcv_data(job['format'], job['files'], job['output'], sha1_cache=sha1_cache, **options)
+
+        if not job.get('contests'):
+            with open(metadata_filename(job['output'])) as meta_fh:
+                result['num_ballots'] = json.load(meta_fh)['num_ballots']
+        result['status'] = 'imported'
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def read_state(filename: str) -> Dict[str, str]:
+    try:
+        with open(filename) as state_fh:
+            return json.load(state_fh)
+    except (FileNotFoundError, ValueError):
+        return dict()
+
+
+def write_json(filename: str, data):
+    with open(filename + '.tmp', 'w') as fh:
+        json.dump(data, fh, sort_keys=True, indent=2)
+    os.replace(filename + '.tmp', filename)
+
+
+def import_rcv_batch(manifest: str, jobs: int = 1, force: bool = False, sha1_cache: str = None,
+                     state: str = None, report: str = None) -> List[dict]:
+    base = re.sub(MANIFEST_EXTENSION, '', manifest)
+    sha1_cache = sha1_cache or base + '.sha1.json'
+    state_file = state or base + '.state.json'
+    report_file = report or base + '.report.json'
+
+    batch_jobs = read_manifest(manifest)
+    job_state = read_state(state_file)
+    cache = Sha1Cache(sha1_cache)
+
+    # Hashing releases the GIL, so new or changed inputs are hashed in parallel; unchanged ones hit the cache.
+    def key_or_error(job):
+        try:
+            return job_key(job, cache)
+        except (OSError, KeyError):
+            # A missing input or unknown format, which the job reports when it runs.
+            return None
+
+    with ThreadPoolExecutor(jobs) as executor:
+        keys = list(executor.map(key_or_error, batch_jobs))
+    cache.save()
+
+    results = list()
+    pending = list()
+    for job, key in zip(batch_jobs, keys):
+        if (not force and key is not None and job_state.get(job['output']) == key
+                and all(os.path.exists(f) for f in job_outputs(job))):
+            results.append({'name': job['name'], 'output': job['output'], 'status': 'up_to_date', 'seconds': 0.0})
+        else:
+            pending.append((job, key))
+
+    print('{} jobs, {} up to date.'.format(len(batch_jobs), len(results)), file=stderr)
+
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = {executor.submit(run_job, job, sha1_cache): (job, key) for job, key in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            job, key = futures[future]
+            result = future.result()
+            results.append(result)
+
+            if result['status'] == 'imported':
+                if key is not None:
+                    job_state[job['output']] = key
+                    write_json(state_file, job_state)
+                print('[{}/{}] imported {} in {:.1f}s'.format(done, len(pending), job['name'], result['seconds']),
+                      file=stderr)
+            else:
+                job_state.pop(job['output'], None)
+                print('[{}/{}] FAILED {}: {}'.format(done, len(pending), job['name'], result['error']), file=stderr)
+
+    write_json(state_file, job_state)
+    order = {job['output']: i for i, job in enumerate(batch_jobs)}
+    results.sort(key=lambda r: order[r['output']])
+    write_json(report_file, {
+        'manifest': manifest,
+        'jobs': results,
+        'imported': sum(r['status'] == 'imported' for r in results),
+        'up_to_date': sum(r['status'] == 'up_to_date' for r in results),
+        'failed': sum(r['status'] == 'failed' for r in results),
+    })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Run this many imports at once (default: the number of CPUs).')
+    parser.add_argument('--force', action='store_true', help='Import every job, even if its outputs are up to date.')
+    parser.add_argument('--sha1-cache', metavar='FILE',
+                        help='Input file digests kept between runs (default: <manifest>.sha1.json).')
+    parser.add_argument('--state', metavar='FILE',
+                        help='Where to record what each output was imported from (default: <manifest>.state.json).')
+    parser.add_argument('--report', metavar='FILE',
+                        help='Where to write per-job timings and failures (default: <manifest>.report.json).')
+
+    results = import_rcv_batch(**vars(parser.parse_args()))
+    if any(r['status'] == 'failed' for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
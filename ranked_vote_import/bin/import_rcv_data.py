@@ -1,11 +1,19 @@
 import argparse
 import json
+import os
 import re
+from contextlib import contextmanager
+from os.path import join
 from sys import stdout, stderr
-from typing import Dict
+from typing import Dict, List, Optional
 
 from ranked_vote.format import write_ballots, write_ballots_fh
 from ranked_vote_import import FORMATS, NORMALIZERS
+from ranked_vote_import.base_reader import Sha1Cache, get_file_sha1
+from ranked_vote_import.pipeline import threaded
+from ranked_vote_import.stats import ImportStats
+from ranked_vote_import.output import BallotWriter, ColumnarBallotWriter, OUTPUT_FORMATS, open_ballot_writer, \
+    output_format_for
 
 TERMINAL_RESET = '\033[0m'
 TERMINAL_BOLD = '\033[1m'
@@ -13,32 +21,114 @@ TERMINAL_GREEN = '\033[92m'
 
 FORMAT_METADATA = TERMINAL_BOLD + TERMINAL_GREEN + '  {}: ' + TERMINAL_RESET + '{}'
 
+# How often --profile prints progress, in seconds.
+PROGRESS_SECONDS = 5.0
 
-def import_rcv_data(input_format, files, output, normalize=False, params: Dict = None):
-    if input_format not in FORMATS:
-        raise ValueError('Format {} not understood.'.format(input_format))
+# How often a resumable import records a checkpoint, in ballots.
+CHECKPOINT_INTERVAL = 100000
 
-    ballots = reader = FORMATS[input_format](files, params)
-    if normalize:
-        normalizer = NORMALIZERS[input_format]()
-        ballots = (normalizer.normalize(ballot) for ballot in reader)
 
-    if output is None:
-        print('Writing data to stdout and not writing metadata.', file=stderr)
-        write_ballots_fh(stdout, ballots)
-        meta_file = None
-    else:
-        write_ballots(output, ballots)
-        meta_file = re.sub(r'\.csv(\.gz)?$', '', output) + '.json'
+OUTPUT_EXTENSION = r'\.(?:csv(?:\.gz)?|parquet|arrow|feather)$'
 
-    metadata = reader.get_metadata()
-    metadata['normalized'] = normalize
 
-    if meta_file is not None:
-        with open(meta_file, 'w') as meta_fh:
-            json.dump(metadata, meta_fh, sort_keys=True, indent=2)
+@contextmanager
+def no_stage(name: str):
+    # Stands in for ImportStats.stage() when not profiling.
+    yield
 
-    print(TERMINAL_BOLD + TERMINAL_GREEN + 'Done Converting.' + TERMINAL_RESET, file=stderr)
+
+def metadata_filename(output: str) -> str:
+    return re.sub(OUTPUT_EXTENSION, '', output) + '.json'
+
+
+def contest_output_filename(output: str, contest) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '_', str(contest).lower()).strip('_')
+    if '{contest}' in output:
+        return output.replace('{contest}', slug)
+    ext = re.search(OUTPUT_EXTENSION, output)
+    base = output[:ext.start()] if ext else output
+    return '{}.{}{}'.format(base, slug, ext.group() if ext else '')
+
+
+def stats_filename(output: str) -> str:
+    return re.sub(OUTPUT_EXTENSION, '', output) + '.stats.json'
+
+
+def report_stats(stats: ImportStats, stats_file: Optional[str], profile: bool):
+    if profile:
+        for line in stats.format():
+            print('  ' + line, file=stderr)
+    if stats_file is not None:
+        with open(stats_file, 'w') as stats_fh:
+            json.dump(stats.to_dict(), stats_fh, sort_keys=True, indent=2)
+
+
+def checkpoint_filename(output: str) -> str:
+    return re.sub(OUTPUT_EXTENSION, '', output) + '.checkpoint.json'
+
+
+def partial_output_filename(output: str) -> str:
+    """Where a resumable import writes its output until it is complete."""
+    return output + '.partial'
+
+
+def read_checkpoint(output: str, params: Dict, normalize: bool) -> Optional[dict]:
+    """Return the checkpoint of an earlier incremental import into output with the same options, or None if there is
+    none or the output no longer holds everything it imported."""
+    try:
+        with open(checkpoint_filename(output)) as checkpoint_fh:
+            checkpoint = json.load(checkpoint_fh)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if checkpoint.get('params') != params or checkpoint.get('normalize') != normalize:
+        return None
+    if not os.path.exists(output) or os.path.getsize(output) < checkpoint['output_size']:
+        return None
+    return checkpoint
+
+
+def write_checkpoint(output: str, checkpoint: dict):
+    filename = checkpoint_filename(output)
+    with open(filename + '.tmp', 'w') as checkpoint_fh:
+        json.dump(checkpoint, checkpoint_fh, sort_keys=True, indent=2)
+    os.replace(filename + '.tmp', filename)
+
+
+def check_checkpoint_options(input_format: str, output: Optional[str], contests: Optional[List], output_format: str,
+                             tallies: bool, incremental: bool):
+    """Raise ValueError unless an incremental import (or, if not incremental, a resumable one) can keep checkpoints
+    with these options."""
+    kind = 'incremental' if incremental else 'resumable'
+    if output is None or contests or (output_format or output_format_for(output)) != 'csv':
+        raise ValueError('An {} import requires a single contest and a CSV output file.'.format(kind))
+    if not incremental and output.endswith('.gz'):
+        # Only uncompressed output can be cut back to the length recorded in a checkpoint and appended to; an
+        # incremental import instead appends a new gzip member after the one the checkpoint covers.
+        raise ValueError('A resumable import requires an uncompressed output file.')
+    if not FORMATS[input_format].supports_checkpoints:
+        raise ValueError('Format {} does not support {} import.'.format(input_format, kind))
+    if tallies:
+        raise ValueError('Tallies cannot be computed in an {} import, which may only read some ballots.'.format(kind))
+
+
+def save_checkpoint(output: str, params: Optional[Dict], normalize: bool, reader, output_size: Optional[int] = None):
+    """Record that output holds every ballot the reader's checkpoint covers, which end at output_size if the reader
+    has read ballots past its position, or at the end of the output otherwise."""
+    write_checkpoint(output, {
+        'params': params or {},
+        'normalize': normalize,
+        'output_size': os.path.getsize(output) if output_size is None else output_size,
+        'reader': reader.get_checkpoint(),
+    })
+
+
+def write_metadata(meta_file: str, metadata: dict):
+    with open(meta_file, 'w') as meta_fh:
+        json.dump(metadata, meta_fh, sort_keys=True, indent=2)
+
+
+def print_metadata(metadata: dict):
     for mk, mv in metadata.items():
         if isinstance(mv, list):
             print(FORMAT_METADATA.format(mk, ''), file=stderr)
@@ -48,12 +138,301 @@ def import_rcv_data(input_format, files, output, normalize=False, params: Dict =
             print(FORMAT_METADATA.format(mk, mv), file=stderr)
 
 
+def import_rcv_contests(input_format, files, output, contests: List, normalize=False, params: Dict = None,
+                        sha1_cache: Sha1Cache = None, output_format: str = None, stats: ImportStats = None,
+                        tallies: bool = False):
+    """Import several contests from the same source files in a single pass, writing a ballots file and a metadata
+    file for each contest."""
+    if output is None:
+        raise ValueError('An output filename is required when importing multiple contests.')
+
+    params = dict(params or {}, contests=contests)
+    stage = stats.stage if stats is not None else no_stage
+    with stage('open'):
+        reader = FORMATS[input_format](files, params, sha1_cache=sha1_cache, hooks=[stats] if stats else None)
+    normalizer = NORMALIZERS[input_format]() if normalize else None
+
+    outputs = {contest: contest_output_filename(output, contest) for contest in reader.contests}
+    writers = {contest: open_ballot_writer(filename, output_format) for contest, filename in outputs.items()}
+    contest_tallies = None
+    if tallies:
+        from ranked_vote_import.tallies import Tallies
+        contest_tallies = {contest: Tallies() for contest in outputs}
+    contest_ballots = reader.iter_contests()
+    if stats is not None:
+        contest_ballots = stats.timed('read', contest_ballots)
+    for contest, ballot in contest_ballots:
+        if normalizer is not None:
+            with stage('normalize'):
+                ballot = normalizer.normalize(ballot)
+        if contest_tallies is not None:
+            with stage('tally'):
+                contest_tallies[contest].add(ballot)
+        with stage('write'):
+            writers[contest].write(ballot)
+
+    print(TERMINAL_BOLD + TERMINAL_GREEN + 'Done Converting.' + TERMINAL_RESET, file=stderr)
+    for contest, filename in outputs.items():
+        with stage('metadata'):
+            metadata = reader.get_contest_metadata(contest)
+        metadata['normalized'] = normalize
+        if contest_tallies is not None:
+            with stage('tally'):
+                metadata['tallies'] = contest_tallies[contest].to_dict(metadata['candidate_ids'])
+        with stage('write'):
+            writers[contest].close(metadata)
+        write_metadata(metadata_filename(filename), metadata)
+        print_metadata(metadata)
+
+    if stats is not None:
+        stats.finish(reader.num_ballots, reader.input_file_bytes)
+
+
+def import_rcv_data(input_format, files, output, normalize=False, params: Dict = None, contests: List = None,
+                    jobs: int = 1, sha1_cache: str = None, batch_size: int = None, output_format: str = None,
+                    cache_dir: str = None, cache_max_bytes: int = None, incremental: bool = False,
+                    profile: bool = False, stats_json: str = None, pipeline: bool = False, tallies: bool = False,
+                    resume: bool = False, checkpoint_interval: int = CHECKPOINT_INTERVAL, validate: bool = False):
+    if input_format not in FORMATS:
+        raise ValueError('Format {} not understood.'.format(input_format))
+
+    stats = None
+    if profile or stats_json:
+        stats = ImportStats(PROGRESS_SECONDS if profile else None)
+        if stats_json is None and output is not None and not contests:
+            stats_json = stats_filename(output)
+    stage = stats.stage if stats is not None else no_stage
+    timed = stats.timed if stats is not None else lambda name, items: items
+
+    if incremental and resume:
+        raise ValueError('An incremental import cannot also be resumable.')
+    if incremental or resume:
+        check_checkpoint_options(input_format, output, contests, output_format, tallies, incremental)
+        # A checkpoint is a position in a serial read, and the reader must not run ahead of the writer.
+        jobs = 1
+        batch_size = None
+        pipeline = False
+    if contests and (jobs > 1 or batch_size or pipeline or cache_dir is not None):
+        raise ValueError('Parallel, batched, pipelined and cached imports are only available when importing a single '
+                         'contest.')
+    validator = None
+    if validate:
+        if contests:
+            raise ValueError('Validation is only available when importing a single contest.')
+        if incremental or resume:
+            raise ValueError('Validation cannot be combined with an incremental or resumable import, which may only '
+                             'read some ballots.')
+        from ranked_vote_import.validation import Validator
+        validator = Validator()
+        # Readers only check their input in a serial read.
+        jobs = 1
+
+    if sha1_cache is not None:
+        sha1_cache = Sha1Cache(sha1_cache)
+    elif cache_dir is not None:
+        sha1_cache = Sha1Cache(join(cache_dir, 'sha1.json'))
+
+    if contests:
+        import_rcv_contests(input_format, files, output, contests, normalize, params, sha1_cache, output_format,
+                            stats, tallies)
+        if stats is not None:
+            report_stats(stats, stats_json, profile)
+        return
+
+    cache = cache_key = None
+    if cache_dir is not None and output is not None and not incremental and not resume:
+        from ranked_vote_import.cache import ImportCache
+        cache = ImportCache(cache_dir, cache_max_bytes)
+        with stage('hash'):
+            file_hashes = [get_file_sha1(join('.', f), sha1_cache) for f in files]
+        output_type = (output_format or output_format_for(output)) + ('.gz' if output.endswith('.gz') else '')
+        cache_key = ImportCache.key(input_format, file_hashes, params, normalize, output_type,
+                                    FORMATS[input_format].format_version)
+
+        with stage('cache'):
+            metadata = cache.restore(cache_key, output)
+        # An import cached without tallies or validation cannot supply them.
+        if metadata is not None and (not tallies or 'tallies' in metadata) and (
+                not validate or 'validation' in metadata):
+            # The cached import may have read the same files from other paths.
+            metadata['files'] = [{'name': join('.', f), 'sha1': h} for f, h in zip(files, file_hashes)]
+            write_metadata(metadata_filename(output), metadata)
+            print(TERMINAL_BOLD + TERMINAL_GREEN + 'Restored from cache.' + TERMINAL_RESET, file=stderr)
+            print_metadata(metadata)
+            if stats is not None:
+                stats.finish(metadata['num_ballots'])
+                report_stats(stats, stats_json, profile)
+            return
+
+    with stage('open'):
+        reader = FORMATS[input_format](files, params, jobs=jobs, sha1_cache=sha1_cache,
+                                       hooks=[hook for hook in (stats, validator) if hook is not None] or None)
+    reader.validate = validate
+
+    # Incremental imports append to the output itself; resumable ones to a partial output, renamed when complete.
+    append = False
+    checkpoint_output = checkpoint_size = None
+    if incremental or resume:
+        checkpoint_output = partial_output_filename(output) if resume else output
+        reader.track_checkpoints = True
+        checkpoint = read_checkpoint(checkpoint_output, params or {}, normalize)
+        append = checkpoint is not None and reader.restore_checkpoint(checkpoint['reader'])
+        if append:
+            # Drop anything written after the checkpoint was taken, such as part of an interrupted import.
+            os.truncate(checkpoint_output, checkpoint['output_size'])
+            print('Continuing after {} imported ballots.'.format(reader.num_ballots), file=stderr)
+        elif checkpoint is not None:
+            print('Input changed other than by appending; importing all ballots.', file=stderr)
+
+    # In a pipelined import, reading, normalizing and writing each run on their own thread, and hand ballots (or
+    # batches) to the next stage in order through bounded queues.
+    stage_output = threaded if pipeline else lambda items, chunk_size=None: items
+    # Tallies are counted from the (normalized) ballots on their way to the writer, in the same pass.
+    tally = None
+    if tallies:
+        from ranked_vote_import.tallies import Tallies
+        tally = Tallies()
+    if pipeline:
+        reader.read_ahead = True
+
+    # Ballots are validated as read, before normalization.
+    if batch_size:
+        batches = stage_output(timed('read', reader.batches(batch_size)), 1)
+        if validator is not None:
+            batches = timed('validate', validator.add_batches(batches))
+        if normalize:
+            normalizer = NORMALIZERS[input_format]()
+            batches = stage_output(timed('normalize', (normalizer.normalize_batch(batch) for batch in batches)), 1)
+        if tally is not None:
+            batches = timed('tally', tally.add_batches(batches))
+        ballots = (ballot for batch in batches for ballot in batch.to_ballots())
+    else:
+        ballots = stage_output(timed('read', reader))
+        if validator is not None:
+            ballots = timed('validate', validator.add_ballots(ballots))
+        if normalize:
+            normalizer = NORMALIZERS[input_format]()
+            ballots = stage_output(timed('normalize', (normalizer.normalize(ballot) for ballot in ballots)))
+        if tally is not None:
+            ballots = timed('tally', tally.add_ballots(ballots))
+
+    writer = None
+    with stage('write'):
+        if output is None:
+            print('Writing data to stdout and not writing metadata.', file=stderr)
+            write_ballots_fh(stdout, ballots)
+            meta_file = None
+        elif checkpoint_output is not None:
+            ballot_writer = BallotWriter(checkpoint_output, append=append)
+            try:
+                for ballot in ballots:
+                    if checkpoint_size is None and reader.ballots_past_position:
+                        # The ballots at the end of the input may be incomplete, and are read again by the next
+                        # import. Write them after the end of what the checkpoint covers (as a new gzip member, if
+                        # compressed), so that they can be cut off.
+                        ballot_writer.close()
+                        checkpoint_size = os.path.getsize(checkpoint_output)
+                        ballot_writer = BallotWriter(checkpoint_output, append=True)
+                    ballot_writer.write(ballot)
+                    if resume and not reader.num_ballots % checkpoint_interval:
+                        ballot_writer.flush()
+                        save_checkpoint(checkpoint_output, params, normalize, reader, checkpoint_size)
+            finally:
+                ballot_writer.close()
+            meta_file = metadata_filename(output)
+        elif (output_format or output_format_for(output)) == 'csv':
+            write_ballots(output, ballots)
+            meta_file = metadata_filename(output)
+        else:
+            writer = ColumnarBallotWriter(output, output_format)
+            for ballot in ballots:
+                writer.write(ballot)
+            meta_file = metadata_filename(output)
+
+    # Waits for the input files to finish hashing.
+    with stage('metadata'):
+        metadata = reader.get_metadata()
+    metadata['normalized'] = normalize
+    if tally is not None:
+        with stage('tally'):
+            metadata['tallies'] = tally.to_dict(metadata['candidate_ids'])
+    if validator is not None:
+        metadata['validation'] = validator.to_dict()
+        for line in validator.format():
+            print('  ' + line, file=stderr)
+
+    if writer is not None:
+        with stage('write'):
+            writer.close(metadata)
+    if meta_file is not None:
+        write_metadata(meta_file, metadata)
+    if cache is not None:
+        cache.store(cache_key, output, metadata)
+    if incremental:
+        save_checkpoint(output, params, normalize, reader, checkpoint_size)
+    if resume:
+        os.replace(checkpoint_output, output)
+        try:
+            os.remove(checkpoint_filename(checkpoint_output))
+        except FileNotFoundError:
+            pass
+
+    print(TERMINAL_BOLD + TERMINAL_GREEN + 'Done Converting.' + TERMINAL_RESET, file=stderr)
+    print_metadata(metadata)
+    if stats is not None:
+        # A run continuing from a checkpoint only read part of its input, so has no meaningful input throughput.
+        stats.finish(reader.num_ballots, None if append else reader.input_file_bytes)
+        report_stats(stats, stats_json, profile)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('input_format')
     parser.add_argument('files', nargs='+')
     parser.add_argument('--normalize', action='store_true')
     parser.add_argument('--params', type=json.loads, default=dict())
+    parser.add_argument('--contests', nargs='+',
+                        help='Import each of these contests in a single pass. The output filename may contain '
+                             '{contest}; otherwise the contest name is added before the extension.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Parse input files, or chunks of a file where the format allows, in this many processes.')
+    parser.add_argument('--sha1-cache', metavar='FILE',
+                        help='Reuse input file digests stored in this file when the file size and mtime are unchanged.')
+    parser.add_argument('--batch-size', type=int,
+                        help='Pass ballots from the reader through the normalizer in compact batches of this size.')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS,
+                        help='Output file format. By default it follows the output extension: .parquet, '
+                             '.arrow/.feather or CSV (gzipped if the name ends in .gz).')
+    parser.add_argument('--cache-dir',
+                        help='Reuse the output of an earlier import with the same input files, format, params and '
+                             'options from this directory, and store new imports in it.')
+    parser.add_argument('--cache-max-bytes', type=int,
+                        help='Evict the least recently used cached imports beyond this total size.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Keep a checkpoint next to the output and, when the input has only had ballots appended '
+                             'since the last import, read and append just the new ones.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Write the output to a .partial file, recording a checkpoint every so often, and rename '
+                             'it once complete. Running the same command again after an interrupted import continues '
+                             'from the last checkpoint.')
+    parser.add_argument('--checkpoint-interval', type=int, default=CHECKPOINT_INTERVAL, metavar='BALLOTS',
+                        help='How often a resumable import records a checkpoint (default: every %(default)s ballots).')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print progress while importing and the time spent in each stage (reading, '
+                             'decompressing, hashing, normalizing, writing) at the end, and write them to a '
+                             '.stats.json file next to the metadata. Timing each ballot slows the import down '
+                             'somewhat.')
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help='Write import statistics to this file instead.')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Read (and decompress), normalize and write on separate threads, so that decompression '
+                             'and gzip compression overlap with parsing.')
+    parser.add_argument('--tallies', action='store_true',
+                        help='Count first choices, rank distributions, pairwise preferences and overvote, undervote '
+                             'and exhaustion rates while importing, and add them to the metadata.')
+    parser.add_argument('--validate', action='store_true',
+                        help='Check the input for duplicate ballot ids, skipped and out-of-order ranks, repeated and '
+                             'unknown candidates while importing, and add a report to the metadata.')
     parser.add_argument('-o', '--output')
 
     import_rcv_data(**vars(parser.parse_args()))
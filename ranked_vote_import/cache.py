@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+from tempfile import mkdtemp
+from typing import List, Dict, Optional
+
+BALLOTS_NAME = 'ballots'
+METADATA_NAME = 'metadata.json'
+
+# Bump when a change to the output files or metadata affects every format; changes to a single format's reader or
+# normalizer bump its format_version instead (see BaseReader).
+CACHE_VERSION = 1
+
+COPY_CHUNK_SIZE = 1 << 20
+
+
+class ImportCache:
+    """A local directory of finished imports, keyed on everything that determines an import's output: the format,
+    the SHA1 of every input file, the params, whether ballots are normalized, the output file type, and the versions
+    of the format's parser and of the cache. Each entry holds the written ballots file and its metadata. Entries are
+    evicted least recently used first once the cache grows past max_bytes."""
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(input_format: str, file_hashes: List[str], params: Dict, normalize: bool, output_type: str,
+            format_version: int) -> str:
+        description = json.dumps({
+            'format': input_format,
+            'format_version': format_version,
+            'files': file_hashes,
+            'params': params,
+            'normalize': normalize,
+            'output_type': output_type,
+            'version': CACHE_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def restore(self, key: str, output: str) -> Optional[dict]:
+        """Copy a cached ballots file to output and return its metadata, or return None on a cache miss."""
+        entry = self._entry(key)
+        try:
+            entry_fd = os.open(entry, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+
+        # Both files are opened through the same handle on the entry directory, so that they come from the same
+        # entry even if store() replaces it meanwhile.
+        def opener(name, flags):
+            return os.open(name, flags, dir_fd=entry_fd)
+
+        try:
+            with open(METADATA_NAME, opener=opener) as fh:
+                metadata = json.load(fh)
+            with open(BALLOTS_NAME, 'rb', opener=opener) as src, open(output, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        except FileNotFoundError:
+            return None
+        finally:
+            os.close(entry_fd)
+
+        # The entry's mtime records when it was last used, for eviction.
+        os.utime(entry)
+        return metadata
+
+    def store(self, key: str, output: str, metadata: dict):
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+
+        # Build the entry beside its final location and rename it into place, so a reader never sees half an entry.
+        tmp_entry = mkdtemp(dir=os.path.dirname(entry), prefix='.tmp-')
+        shutil.copyfile(output, os.path.join(tmp_entry, BALLOTS_NAME))
+        with open(os.path.join(tmp_entry, METADATA_NAME), 'w') as fh:
+            json.dump(metadata, fh, sort_keys=True, indent=2)
+
+        # An existing entry, such as one stored without tallies, is replaced. A directory cannot be renamed over a
+        # non-empty one, so the old entry is moved aside first and only deleted once the new one is in place.
+        old_entry = tmp_entry + '-old'
+        try:
+            os.rename(entry, old_entry)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another import stored the same entry in between.
+            shutil.rmtree(tmp_entry)
+        shutil.rmtree(old_entry, ignore_errors=True)
+
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes: int):
+        entries = list()
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name.startswith('.tmp-'):
+                    continue
+                entry = os.path.join(prefix_dir, name)
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -1,10 +1,25 @@
+import hashlib
+import json
+import mmap
+import os
+from array import array
 from collections import defaultdict
-from itertools import groupby
-from typing import List, Iterator, NamedTuple, Dict, DefaultDict
+from itertools import chain
+from typing import List, Iterator, NamedTuple, Dict, DefaultDict, BinaryIO, Optional, Tuple, Set, TYPE_CHECKING
 
 from ranked_vote.ballot import Ballot, UNDERVOTE, OVERVOTE, Candidate, Choice, WRITE_IN
 from ranked_vote_import.base_normalizer import BaseNormalizer
-from ranked_vote_import.base_reader import BaseReader
+from ranked_vote_import.base_reader import BaseReader, update_sha1
+
+if TYPE_CHECKING:
+    import numpy as np
+    from ranked_vote_import.ballot_batch import BallotBatch
+
+READ_CHUNK_SIZE = 1 << 24
+PARTITION_SIZE = 1 << 26
+
+# The length of a ballot image record, without its line terminator.
+BALLOT_RECORD_LENGTH = 45
 
 
 class SanFranciscoNormalizer(BaseNormalizer):
@@ -28,6 +43,10 @@ class SanFranciscoNormalizer(BaseNormalizer):
             normalized_choices.append(UNDERVOTE)
         return Ballot(ballot.ballot_id, normalized_choices)
 
+    def normalize_batch(self, batch: 'BallotBatch') -> 'BallotBatch':
+        from ranked_vote_import.ballot_batch import normalize_codes
+        return normalize_codes(batch)
+
 
 class MasterRecord(NamedTuple):
     record_type: str
@@ -77,6 +96,157 @@ class BallotRecord(NamedTuple):
         )
 
 
+def iter_lines(fh: BinaryIO, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yield the lines (without line terminators) in the byte range [start, end) of a binary file, reading it in
+    large chunks."""
+    fh.seek(start)
+    position = start
+    remainder = b''
+    while end is None or position < end:
+        size = READ_CHUNK_SIZE if end is None else min(READ_CHUNK_SIZE, end - position)
+        chunk = fh.read(size)
+        if not chunk:
+            break
+        position += len(chunk)
+        lines = (remainder + chunk).split(b'\n')
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def next_ballot_start(fh: BinaryIO, position: int, end: int) -> int:
+    """Return the offset of a line at or after position that starts a new (pref_voter_id, contest_id) group, or end
+    if there is none before it."""
+    fh.seek(position - 1)
+    fh.readline()
+    position = fh.tell()
+    key = None
+    while position < end:
+        line = fh.readline()
+        if not line:
+            break
+        if key is None:
+            key = line[0:16]
+        elif line[0:16] != key:
+            return position
+        position += len(line)
+    return end
+
+
+def split_at_ballots(filename: str, ranges: List[Tuple[int, int]], partition_size: int) -> List[Tuple[int, int]]:
+    """Split byte ranges of a ballot image into smaller ranges that never divide a ballot."""
+    partitions = list()
+    with open(filename, 'rb') as fh:
+        for start, end in ranges:
+            while end - start > partition_size:
+                split = next_ballot_start(fh, start + partition_size, end)
+                partitions.append((start, split))
+                start = split
+            if start < end:
+                partitions.append((start, end))
+    return partitions
+
+
+def contest_index_filename(ballot_image_file: str) -> str:
+    return ballot_image_file + '.index.json'
+
+
+def read_contest_index(ballot_image_file: str) -> Optional[Dict[int, List[Tuple[int, int]]]]:
+    """Return the byte ranges of each contest from the sidecar index of a ballot image, or None if there is no index
+    or it was built from a different version of the file."""
+    try:
+        with open(contest_index_filename(ballot_image_file)) as index_fh:
+            index = json.load(index_fh)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    stat = os.stat(ballot_image_file)
+    if index.get('size') != stat.st_size or index.get('mtime') != stat.st_mtime_ns:
+        return None
+    return {int(contest_id): [tuple(r) for r in ranges] for contest_id, ranges in index['contests'].items()}
+
+
+def write_contest_index(ballot_image_file: str, contests: Dict[int, List[Tuple[int, int]]]):
+    stat = os.stat(ballot_image_file)
+    with open(contest_index_filename(ballot_image_file), 'w') as index_fh:
+        json.dump({
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'contests': {str(contest_id): ranges for contest_id, ranges in contests.items()},
+        }, index_fh)
+
+
+VOTER_INDEX_COLUMNS = ('contest_id', 'pref_voter_id', 'precinct_id', 'start', 'end')
+# pref_voter_id and precinct_id are 9 and 7 digit fields.
+VOTER_KEY_SCALE = 10 ** 9
+PRECINCT_KEY_SCALE = 10 ** 7
+
+
+def voter_index_filename(ballot_image_file: str) -> str:
+    return ballot_image_file + '.voters.npz'
+
+
+def build_voter_index(ballot_image_file: str) -> Dict[str, 'np.ndarray']:
+    """Find the contest_id, pref_voter_id, precinct_id and byte range of every ballot in a ballot image. Ballots are
+    sorted by (contest_id, pref_voter_id), and precinct_order lists them by (contest_id, precinct_id, start)."""
+    import numpy as np
+
+    columns = {name: array('q') for name in VOTER_INDEX_COLUMNS}
+    key = None
+    offset = 0
+    with open(ballot_image_file, 'rb') as ballot_image_fh:
+        for line in chain(iter_lines(ballot_image_fh), [b'']):
+            line_start = offset
+            offset += len(line) + 1
+            blank = len(line) < 7 and not line.strip()
+            if key is not None and (blank or line[0:16] != key):
+                columns['end'].append(line_start)
+                key = None
+            if not blank and key is None:
+                key = line[0:16]
+                columns['contest_id'].append(int(line[0:7]))
+                columns['pref_voter_id'].append(int(line[7:16]))
+                columns['precinct_id'].append(int(line[26:33]))
+                columns['start'].append(line_start)
+        size = os.fstat(ballot_image_fh.fileno()).st_size
+
+    index = {name: np.frombuffer(column, dtype=np.int64) for name, column in columns.items()}
+    np.minimum(index['end'], size, out=index['end'])
+    order = np.lexsort((index['start'], index['pref_voter_id'], index['contest_id']))
+    index = {name: column[order] for name, column in index.items()}
+    index['precinct_order'] = np.lexsort((index['start'], index['precinct_id'], index['contest_id']))
+    return index
+
+
+def read_voter_index(ballot_image_file: str) -> Optional[Dict[str, 'np.ndarray']]:
+    """Return the sidecar voter index of a ballot image, or None if there is none or it was built from a different
+    version of the file."""
+    import numpy as np
+
+    try:
+        with np.load(voter_index_filename(ballot_image_file)) as npz:
+            index = dict(npz)
+    except (OSError, ValueError):
+        return None
+
+    stat = os.stat(ballot_image_file)
+    file_stat = index.pop('file_stat', None)
+    if file_stat is None or file_stat.tolist() != [stat.st_size, stat.st_mtime_ns]:
+        return None
+    return index
+
+
+def write_voter_index(ballot_image_file: str, index: Dict[str, 'np.ndarray']):
+    import numpy as np
+
+    stat = os.stat(ballot_image_file)
+    filename = voter_index_filename(ballot_image_file)
+    with open(filename + '.tmp', 'wb') as index_fh:
+        np.savez(index_fh, file_stat=np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64), **index)
+    os.replace(filename + '.tmp', filename)
+
+
 class SanFranciscoImporter(BaseReader):
     format_name = 'us_ca_sfo'
     _contest: int
@@ -84,33 +254,279 @@ class SanFranciscoImporter(BaseReader):
     _candidates: DefaultDict[int, Dict[int, Choice]]
     ballots: Iterator[Ballot]
 
+    supports_checkpoints = True
+    # Byte offset of the ballot image to start reading at, and the offset just past the last ballot read.
+    _start_offset = 0
+    _position = 0
+    # Digest of the ballot image up to _hashed_offset, extended as positions are taken.
+    _prefix_sha1 = None
+    _hashed_offset = 0
+
+    # Random access to ballots, for ballot() and ballots_in_precinct().
+    _voter_index = None  # type: Optional[Dict[str, np.ndarray]]
+    _ballot_image_map = None  # type: Optional[mmap.mmap]
+    _unpicklable = BaseReader._unpicklable + ('_voter_index', '_ballot_image_map')
+
     @property
     def candidates(self):
         return [str(c) for c in self._candidates[self._contest].values()]
 
+    def canonical_candidate_name(self, raw: str) -> str:
+        if raw.startswith('WRITE-IN - '):
+            return raw.replace('WRITE-IN - ', '').title()
+        return raw.title()
+
+    def candidate_key(self, raw: str, name: str) -> Tuple[str, bool]:
+        # A write-in is a different candidate from a qualified candidate of the same name.
+        return name, raw.startswith('WRITE-IN - ')
+
+    def new_candidate(self, raw: str, name: str) -> Candidate:
+        try:
+            return Candidate.get(raw, name=name, write_in=raw.startswith('WRITE-IN - '))
+        except TypeError:
+            # ranked-vote 0.0.1 registers candidates by name alone.
+            return Candidate.get(name)
+
+    def _choice(self, contest_id: int, fields: bytes) -> Choice:
+        # fields holds candidate_id, over_vote and under_vote (ballot image columns 36 to 45).
+        if fields[8:9] == b'1':
+            return UNDERVOTE
+        elif fields[7:8] == b'1':
+            return OVERVOTE
+        else:
+            return self._candidates[contest_id][int(fields[0:7])]
+
+    def _read_contest_ballots(self, filename: str, contests: Optional[Set[int]],
+                              ranges: Optional[List[Tuple[int, Optional[int]]]] = None) -> Iterator[Tuple[int, Ballot]]:
+        """Yield (contest_id, ballot) pairs from the ballot image (or the given byte ranges of it), for the given
+        contests or for every contest if contests is None. When reading a single range, self._position is the offset
+        just past the records of the last ballot yielded, except for the last ballot in the file: its records may
+        continue in a later version of the file, so it is counted in self.ballots_past_position instead."""
+        build_index = False
+        if ranges is None and self._params.get('index'):
+            contest_index = read_contest_index(filename)
+            if contest_index is None:
+                build_index = True
+            elif contests is not None:
+                ranges = sorted(r for contest_id in contests for r in contest_index.get(contest_id, []))
+
+        with open(filename, 'rb') as ballot_image_fh:
+            ballot_image_fh = self.timed_stream(ballot_image_fh, 'io')
+            if ranges is None:
+                lines = iter_lines(ballot_image_fh)
+            else:
+                # A blank line between ranges ends the ballot at the end of each one.
+                lines = chain.from_iterable(chain([b''] if i else [], iter_lines(ballot_image_fh, s, e))
+                                            for i, (s, e) in enumerate(ranges))
+
+            file_size = os.fstat(ballot_image_fh.fileno()).st_size
+            validate = self.validate
+            contest_ids = dict()  # type: Dict[bytes, int]
+            choices_by_fields = dict()  # type: Dict[Tuple[int, bytes], Choice]
+            contest_runs = defaultdict(list)  # type: DefaultDict[int, List[Tuple[int, int]]]
+            run_contest = None
+            run_start = offset = ranges[0][0] if ranges else 0
+            ballot_contest = voter_id = None
+            choices = None  # type: Optional[List[Choice]]
+
+            for line in lines:
+                line_start = offset
+                offset += len(line) + 1
+                if offset > file_size and len(line) < BALLOT_RECORD_LENGTH and line.strip():
+                    if not self.track_checkpoints:
+                        raise ValueError('Ballot image {} ends part way through a record.'.format(filename))
+                    # The file ends part way through a record, e.g. one that is still being written. It is read again
+                    # from the checkpoint once the file is complete.
+                    break
+                if len(line) < 7 and not line.strip():
+                    # Blank lines, including the ones separating byte ranges, end the current ballot.
+                    if choices is not None:
+                        self._position = line_start
+                        yield ballot_contest, Ballot(str(int(voter_id)), choices)
+                        ballot_contest = voter_id = choices = None
+                    continue
+
+                # Only the contest_id is decoded for every line; the rest is parsed for the chosen contests only.
+                contest_key = line[0:7]
+                contest_id = contest_ids.get(contest_key)
+                if contest_id is None:
+                    contest_id = contest_ids[contest_key] = int(contest_key)
+
+                if build_index and contest_id != run_contest:
+                    if run_contest is not None:
+                        contest_runs[run_contest].append((run_start, line_start))
+                    run_contest, run_start = contest_id, line_start
+
+                if contests is not None and contest_id not in contests:
+                    if choices is not None:
+                        self._position = line_start
+                        yield ballot_contest, Ballot(str(int(voter_id)), choices)
+                        ballot_contest = voter_id = choices = None
+                    continue
+
+                if line[7:16] != voter_id or contest_id != ballot_contest:
+                    if choices is not None:
+                        self._position = line_start
+                        yield ballot_contest, Ballot(str(int(voter_id)), choices)
+                    ballot_contest = contest_id
+                    voter_id = line[7:16]
+                    choices = list()
+
+                if validate and int(line[33:36]) != len(choices) + 1:
+                    # Records of a ballot should list its ranks in order, from 1.
+                    self.anomaly('rank_out_of_order', str(int(voter_id)))
+
+                fields = (contest_id, line[36:45])
+                choice = choices_by_fields.get(fields)
+                if choice is None:
+                    choice = choices_by_fields[fields] = self._choice(*fields)
+                choices.append(choice)
+
+            if choices is not None:
+                # More of the last ballot's records may follow in a later version of the file, so the position stays
+                # at its start.
+                self.ballots_past_position = 1
+                yield ballot_contest, Ballot(str(int(voter_id)), choices)
+
+            if build_index:
+                if run_contest is not None:
+                    contest_runs[run_contest].append((run_start, offset))
+                write_contest_index(filename, contest_runs)
+
     def _read_ballots(self, filename: str) -> Iterator[Ballot]:
-        print(filename)
-        with open(filename) as ballot_image_fh:
-            ballots = (BallotRecord.parse(b) for b in ballot_image_fh)
-
-            for (ballot_id, contest_id), ballot_records in groupby(ballots, lambda x: (x.pref_voter_id, x.contest_id)):
-                choices = list()  # type: List[Choice]
-                if 'contest' in self._params:
-                    if contest_id != self._params['contest']:
-                        continue
-                elif self._contest:
+        contests = {self._contest} if 'contest' in self._params else None
+        # Positions are only meaningful for a single range, so checkpointed reads do not use the contest index.
+        ranges = [(self._start_offset, None)] if self.track_checkpoints or self._start_offset else None
+        for contest_id, ballot in self._read_contest_ballots(filename, contests, ranges):
+            if contests is None:
+                if self._contest:
                     assert self._contest == contest_id
                 else:
                     self._contest = contest_id
+            yield ballot
 
-                for ballot_record in ballot_records:
-                    if ballot_record.under_vote:
-                        choices.append(UNDERVOTE)
-                    elif ballot_record.over_vote:
-                        choices.append(OVERVOTE)
-                    else:
-                        choices.append(self._candidates[ballot_record.contest_id][ballot_record.candidate_id])
-                yield Ballot(str(ballot_id), choices)
+    def _candidate_names(self) -> Dict[str, str]:
+        return {str(candidate_id): str(c) for candidate_id, c in self._candidates[self._contest].items()}
+
+    def get_position(self) -> Optional[dict]:
+        if not self.track_checkpoints:
+            return None
+
+        _, ballot_image_file = self.filenames
+        if self._prefix_sha1 is None:
+            self._prefix_sha1 = hashlib.sha1()
+        with open(ballot_image_file, 'rb') as ballot_image_fh:
+            ballot_image_fh.seek(self._hashed_offset)
+            self._hashed_offset += update_sha1(self._prefix_sha1, ballot_image_fh,
+                                               self._position - self._hashed_offset)
+
+        return {
+            'contest': self._contest,
+            'offset': self._position,
+            'sha1': self._prefix_sha1.hexdigest(),
+            'candidates': self._candidate_names(),
+        }
+
+    def seek_position(self, position: dict) -> bool:
+        if self._contest is not None and self._contest != position['contest']:
+            return False
+
+        _, ballot_image_file = self.filenames
+        offset = position['offset']
+        sha1 = hashlib.sha1()
+        with open(ballot_image_file, 'rb') as ballot_image_fh:
+            if update_sha1(sha1, ballot_image_fh, offset) != offset or sha1.hexdigest() != position['sha1']:
+                return False
+
+        # Ballots already imported must still refer to the same candidates.
+        contest = self._contest
+        self._contest = position['contest']
+        candidate_names = self._candidate_names()
+        if any(candidate_names.get(i) != name for i, name in position['candidates'].items()):
+            self._contest = contest
+            return False
+
+        self._prefix_sha1, self._hashed_offset = sha1, offset
+        self._start_offset = self._position = offset
+        return True
+
+    def voter_index(self) -> Dict[str, 'np.ndarray']:
+        """Return the index of ballots by pref_voter_id and precinct_id, reading it from beside the ballot image, or
+        building it with one pass over the file and saving it there on first use."""
+        if self._voter_index is None:
+            _, ballot_image_file = self.filenames
+            index = read_voter_index(ballot_image_file)
+            if index is None:
+                with self.stage('index'):
+                    index = build_voter_index(ballot_image_file)
+                write_voter_index(ballot_image_file, index)
+            # Sorted lookup keys combining the contest_id with the pref_voter_id or precinct_id.
+            index['voter_key'] = index['contest_id'] * VOTER_KEY_SCALE + index['pref_voter_id']
+            index['precinct_key'] = (index['contest_id'] * PRECINCT_KEY_SCALE + index['precinct_id'])[
+                index['precinct_order']]
+            self._voter_index = index
+        return self._voter_index
+
+    def _ballot_at(self, contest: int, start: int, end: int) -> Ballot:
+        if self._ballot_image_map is None:
+            _, ballot_image_file = self.filenames
+            with open(ballot_image_file, 'rb') as ballot_image_fh:
+                self._ballot_image_map = mmap.mmap(ballot_image_fh.fileno(), 0, access=mmap.ACCESS_READ)
+        lines = self._ballot_image_map[start:end].splitlines()
+        return Ballot(str(int(lines[0][7:16])), [self._choice(contest, line[36:45]) for line in lines])
+
+    def _contest_or_default(self, contest: Optional[int]) -> int:
+        contest = self._contest if contest is None else contest
+        if contest is None:
+            raise ValueError('A contest is required to look up ballots when the contest param is not set.')
+        return contest
+
+    def ballot(self, pref_voter_id: int, contest: Optional[int] = None) -> Optional[Ballot]:
+        """Return the ballot with the given pref_voter_id (in the chosen contest by default), or None if there is
+        none, without reading the rest of the ballot image."""
+        contest = self._contest_or_default(contest)
+        index = self.voter_index()
+        key = contest * VOTER_KEY_SCALE + pref_voter_id
+        i = index['voter_key'].searchsorted(key)
+        if i == len(index['voter_key']) or index['voter_key'][i] != key:
+            return None
+        return self._ballot_at(contest, int(index['start'][i]), int(index['end'][i]))
+
+    def ballots_in_precinct(self, precinct_id: int, contest: Optional[int] = None) -> Iterator[Ballot]:
+        """Yield the ballots cast in a precinct (in the chosen contest by default), in file order."""
+        contest = self._contest_or_default(contest)
+        index = self.voter_index()
+        key = contest * PRECINCT_KEY_SCALE + precinct_id
+        first, last = index['precinct_key'].searchsorted([key, key + 1])
+        for i in index['precinct_order'][first:last]:
+            yield self._ballot_at(contest, int(index['start'][i]), int(index['end'][i]))
+
+    def partitions(self, jobs: int) -> Optional[List[Tuple[int, int]]]:
+        if 'contest' not in self._params:
+            # Without a contest param the contest comes from the first ballot, which only a serial read sees.
+            return None
+
+        _, ballot_image_file = self.filenames
+        contest_index = read_contest_index(ballot_image_file) if self._params.get('index') else None
+        if contest_index is None:
+            ranges = [(0, os.path.getsize(ballot_image_file))]
+        else:
+            ranges = contest_index.get(self._contest, [])
+
+        total = sum(end - start for start, end in ranges)
+        return split_at_ballots(ballot_image_file, ranges, min(PARTITION_SIZE, max(1, total // jobs)))
+
+    def read_partition(self, partition: Tuple[int, int]) -> Iterator[Ballot]:
+        _, ballot_image_file = self.filenames
+        for _, ballot in self._read_contest_ballots(ballot_image_file, {self._contest}, [partition]):
+            yield ballot
+
+    def contest_candidates(self, contest: int) -> List[Choice]:
+        return list(self._candidates[contest].values())
+
+    def read_contests(self) -> Iterator[Tuple[int, Ballot]]:
+        _, ballot_image_file = self.filenames
+        return self._read_contest_ballots(ballot_image_file, set(self.contests))
 
     def read(self):
         master_lookup_file, ballot_image_file = self.filenames
@@ -118,6 +534,7 @@ class SanFranciscoImporter(BaseReader):
         self._candidates = defaultdict(dict)
         self._contests = dict()
         self._contest = self._params.get('contest', None)
+        self.contests = [int(c) for c in self.contests]
         self.num_ballots = 0
 
         with open(master_lookup_file) as master_lookup_fh:
@@ -131,16 +548,8 @@ class SanFranciscoImporter(BaseReader):
                     if master_record.description == 'WRITE-IN':
                         self._candidates[master_record.contest_id][master_record.record_id] = WRITE_IN
                     else:
-                        candidate_name = master_record.description
-                        if candidate_name.startswith('WRITE-IN - '):
-                            write_in = True
-                            name = candidate_name.replace('WRITE-IN - ', '').title()
-                        else:
-                            write_in = False
-                            name = candidate_name.title()
-
-                        self._candidates[master_record.contest_id][master_record.record_id] = Candidate.get(
-                            master_record.description, name=name, write_in=write_in)
+                        self._candidates[master_record.contest_id][master_record.record_id] = \
+                            self.resolve_candidate(master_record.description)
 
         self.ballots = self._read_ballots(ballot_image_file)
 
@@ -1,11 +1,14 @@
+import hashlib
 import re
-from typing import List, Iterator, Dict
+from typing import List, Iterator, Dict, Tuple, Any, Optional
 
+import numpy as np
 import pandas as pd
 
-from ranked_vote.ballot import Ballot, UNDERVOTE, OVERVOTE, Candidate, WRITE_IN
+from ranked_vote.ballot import Ballot, UNDERVOTE, OVERVOTE, Candidate, WRITE_IN, Choice
+from ranked_vote_import.ballot_batch import BallotBatch, ChoiceEncoder, CODE_DTYPE, normalize_codes
 from ranked_vote_import.base_normalizer import BaseNormalizer
-from ranked_vote_import.base_reader import BaseReader
+from ranked_vote_import.base_reader import BaseReader, get_file_sha1
 
 
 class MaineNormalizer(BaseNormalizer):
@@ -30,15 +33,38 @@ class MaineNormalizer(BaseNormalizer):
             normalized_choices.append(UNDERVOTE)
         return Ballot(ballot.ballot_id, normalized_choices)
 
+    def normalize_batch(self, batch: BallotBatch) -> BallotBatch:
+        return normalize_codes(batch, exhaust_on_repeated_undervote=True)
+
 
 class MaineImporter(BaseReader):
     format_name = 'us_me'
     ballots: Iterator[Ballot]
     _candidates: Dict[str, Candidate]
 
+    supports_checkpoints = True
+    # The index of the file being read, the number of ballots read from it so far and a digest of them, and the
+    # digests of the files before it. Excel files are rewritten rather than appended to, so the ballots already read
+    # from a file are checked by what they parse to rather than by the bytes of the file.
+    _file_index = 0
+    _row = 0
+    _rows_sha1 = None
+    _file_sha1s = ()  # type: List[str]
+    # The ballots of the file that seek_position() read up to _row, and the digest of those ballots, for the read to
+    # continue from.
+    _resumed = None  # type: Optional[Tuple[Iterator[Ballot], Any]]
+    _unpicklable = BaseReader._unpicklable + ('_resumed',)
+
     def read(self):
-        self.ballots = self._read_raw_ballots(self.filenames)
+        if self._params.get('streaming'):
+            try:
+                import openpyxl
+            except ImportError:
+                raise ImportError('Streaming Maine workbooks requires openpyxl '
+                                  '(pip install ranked-vote-import[streaming]).')
+        self.ballots = self._read_ballots()
         self._candidates = dict()  # type: Dict[str, Candidate]
+        self._encoder = ChoiceEncoder()
 
     @property
     def candidates(self):
@@ -52,12 +78,13 @@ class MaineImporter(BaseReader):
         return next(self.ballots)
 
     @staticmethod
-    def normalize_columns(df: pd.DataFrame) -> (pd.DataFrame, List[str]):
+    def map_columns(columns: List[Any]) -> Tuple[Dict[str, str], List[str]]:
+        """Return new names for the header columns, and the ranked choice columns in rank order."""
         renamed = {'Cast Vote Record': 'VoteRecord'}
         n_choices = 0
         choice_columns = list()
-        for c in df.columns:
-            match = re.match(r'.+ (\d+)(?:st|nd|rd|th) Choice', c)
+        for c in columns:
+            match = re.match(r'.+ (\d+)(?:st|nd|rd|th) Choice', str(c))
             if match:
                 rank = int(match.groups()[0])
                 assert rank == n_choices + 1
@@ -65,6 +92,11 @@ class MaineImporter(BaseReader):
                 choice_col = 'choice_{}'.format(rank)
                 renamed[c] = choice_col
                 choice_columns.append(choice_col)
+        return renamed, choice_columns
+
+    @staticmethod
+    def normalize_columns(df: pd.DataFrame) -> (pd.DataFrame, List[str]):
+        renamed, choice_columns = MaineImporter.map_columns(df.columns)
         return df.rename(columns=renamed), choice_columns
 
     def parse_ballot(self, choice_str):
@@ -75,17 +107,196 @@ class MaineImporter(BaseReader):
         elif choice_str == 'Write-in':
             return WRITE_IN
         else:
-            candidate = MaineImporter.fix_string(choice_str)
-            if candidate not in self._candidates:
-                self._candidates[candidate] = Candidate.get(candidate)
-            return self._candidates[candidate]
+            return self.resolve_candidate(choice_str)
+
+    def canonical_candidate_name(self, raw: str) -> str:
+        return MaineImporter.fix_string(raw)
+
+    def new_candidate(self, raw: str, name: str) -> Candidate:
+        # Candidates merged from worker processes are already registered under their name.
+        return self._candidates.setdefault(name, Candidate.get(name))
+
+    def _factorize_frame(self, data: pd.DataFrame) -> Tuple[List[str], List[Tuple[np.ndarray, List]]]:
+        data, choice_columns = MaineImporter.normalize_columns(data)
+        ballot_ids = [str(v) for v in data['VoteRecord'].tolist()]
+
+        # Factorize each choice column so that every distinct string is parsed once per column rather than once
+        # per cell. Missing cells get code -1, which indexes the trailing entry of the lookup table.
+        factorized = list()
+        first_seen = list()
+        for col_index, c in enumerate(choice_columns):
+            codes, uniques = pd.factorize(data[c])
+            values = list(uniques)
+            if (codes == -1).any():
+                values.append(data[c][codes == -1].iloc[0])
+            _, first_rows = np.unique(codes, return_index=True)
+            first_codes = codes[first_rows]
+            first_seen.extend((row, col_index, values[code]) for row, code in zip(first_rows, first_codes))
+            factorized.append((codes, values))
+
+        # Register candidates in the same (row-major) order that the cell-by-cell reader encountered them, so
+        # that candidate_ids in the metadata come out unchanged.
+        first_seen.sort(key=lambda x: (x[0], x[1]))
+        for _, _, value in first_seen:
+            self.parse_ballot(value)
+
+        return ballot_ids, factorized
+
+    def _ballots_from_frame(self, data: pd.DataFrame) -> Iterator[Ballot]:
+        ballot_ids, factorized = self._factorize_frame(data)
+
+        columns = list()
+        for codes, values in factorized:
+            lookup = np.empty(len(values), dtype=object)
+            lookup[:] = [self.parse_ballot(v) for v in values]
+            columns.append(lookup[codes].tolist())
+
+        for ballot_id, *choices in zip(ballot_ids, *columns):
+            yield Ballot(ballot_id, choices)
+
+    def _batches_from_frame(self, data: pd.DataFrame, batch_size: int) -> Iterator[BallotBatch]:
+        ballot_ids, factorized = self._factorize_frame(data)
+
+        choices = np.empty((len(ballot_ids), len(factorized)), dtype=CODE_DTYPE)
+        for col_index, (codes, values) in enumerate(factorized):
+            lookup = np.array([self._encoder.code(self.parse_ballot(v)) for v in values], dtype=CODE_DTYPE)
+            choices[:, col_index] = lookup[codes]
+
+        for start in range(0, len(ballot_ids), batch_size):
+            yield BallotBatch(ballot_ids[start:start + batch_size], choices[start:start + batch_size],
+                              self._encoder.candidates)
+
+    def _stream_ballots(self, filename: str) -> Iterator[Ballot]:
+        """Yield ballots as the rows of the first worksheet are parsed, without loading the whole workbook."""
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(filename, read_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, ())
+            renamed, choice_columns = MaineImporter.map_columns(header)
+            column_names = [renamed.get(c) for c in header]
+            id_index = column_names.index('VoteRecord')
+            choice_indexes = [column_names.index(c) for c in choice_columns]
+
+            # Each distinct cell value is parsed once.
+            choices_by_value = dict()  # type: Dict[Any, Choice]
+            for row in rows:
+                if row[id_index] is None and not any(row):
+                    # Read-only worksheets can report trailing rows that were formatted but left empty.
+                    continue
+
+                choices = list()
+                for i in choice_indexes:
+                    value = row[i]
+                    choice = choices_by_value.get(value)
+                    if choice is None:
+                        choice = choices_by_value[value] = self.parse_ballot(value)
+                    choices.append(choice)
+                yield Ballot(str(row[id_index]), choices)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _update_rows_sha1(sha1, ballot: Ballot):
+        sha1.update('{}\t{}\n'.format(ballot.ballot_id, '\t'.join(map(str, ballot.choices))).encode('utf-8'))
+
+    def _read_ballots(self) -> Iterator[Ballot]:
+        if not self.track_checkpoints and self._resumed is None:
+            yield from self._read_raw_ballots(self.filenames)
+            return
+
+        if self._resumed is not None:
+            ballots, sha1 = self._resumed
+            self._resumed = None
+        else:
+            ballots = sha1 = None
+            self._file_sha1s = list()
+        for file_index in range(self._file_index, len(self.filenames)):
+            filename = self.filenames[file_index]
+            if ballots is None:
+                ballots = self._read_raw_ballots([filename])
+                sha1 = hashlib.sha1()
+                self._row = 0
+            self._file_index = file_index
+            self._rows_sha1 = sha1
+
+            for ballot in ballots:
+                MaineImporter._update_rows_sha1(sha1, ballot)
+                self._row += 1
+                yield ballot
+
+            ballots = None
+            if file_index + 1 < len(self.filenames):
+                self._file_sha1s.append(self._file_hashes.get(filename) or get_file_sha1(filename, self._sha1_cache))
+
+    def get_position(self) -> Optional[dict]:
+        if self._rows_sha1 is None:
+            return None
+        return {
+            'file': self._file_index,
+            'file_sha1s': self._file_sha1s[:self._file_index],
+            'row': self._row,
+            'sha1': self._rows_sha1.hexdigest(),
+            'candidates': [str(c) for c in self.candidates],
+        }
+
+    def seek_position(self, position: dict) -> bool:
+        file_index = position['file']
+        if file_index >= len(self.filenames) or len(position['file_sha1s']) != file_index or any(
+                get_file_sha1(f, self._sha1_cache) != h for f, h in zip(self.filenames, position['file_sha1s'])):
+            return False
+
+        # Candidates first seen in the files before are listed first, as in a full read.
+        self.merge_candidates([Candidate.get(name) for name in position['candidates']])
+        # The ballots before the row are read once, both to check that they are unchanged and to skip them.
+        ballots = self._read_raw_ballots([self.filenames[file_index]])
+        sha1 = hashlib.sha1()
+        row = 0
+        while row < position['row']:
+            ballot = next(ballots, None)
+            if ballot is None:
+                break
+            MaineImporter._update_rows_sha1(sha1, ballot)
+            row += 1
+        if row != position['row'] or sha1.hexdigest() != position['sha1']:
+            ballots.close()
+            self._candidates = dict()
+            self._resolved_candidates = self._canonical_candidates = None
+            return False
+
+        self._resumed = (ballots, sha1)
+        self._file_index = file_index
+        self._file_sha1s = list(position['file_sha1s'])
+        self._row = row
+        return True
+
+    def read_batches(self, batch_size: int) -> Iterator[BallotBatch]:
+        if self._parallel_ballots is not None or self._params.get('streaming'):
+            return super().read_batches(batch_size)
+        return self._read_raw_batches(self.filenames, batch_size)
+
+    def partitions(self, jobs: int) -> List[str]:
+        return self.filenames
+
+    def read_partition(self, filename: str) -> Iterator[Ballot]:
+        return self._read_raw_ballots([filename])
+
+    def merge_candidates(self, candidates: List[Candidate]):
+        for candidate in candidates:
+            self._candidates.setdefault(str(candidate), candidate)
 
     def _read_raw_ballots(self, files: List[str]) -> Iterator[Ballot]:
         for filename in files:
-            data = pd.read_excel(filename)
-            data, choice_columns = MaineImporter.normalize_columns(data)
+            if self._params.get('streaming'):
+                yield from self._stream_ballots(filename)
+                continue
+            with self.stage('parse_excel'):
+                data = pd.read_excel(filename)
+            yield from self._ballots_from_frame(data)
 
-            for _, row in data.iterrows():
-                yield Ballot(str(row['VoteRecord']), [
-                    self.parse_ballot(row[c]) for c in choice_columns
-                ])
+    def _read_raw_batches(self, files: List[str], batch_size: int) -> Iterator[BallotBatch]:
+        for filename in files:
+            with self.stage('parse_excel'):
+                data = pd.read_excel(filename)
+            yield from self._batches_from_frame(data, batch_size)
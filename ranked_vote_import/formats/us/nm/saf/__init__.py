@@ -1,11 +1,19 @@
 import csv
+import hashlib
 import io
-import zipfile
-from typing import Iterator
+import re
+from itertools import count
+from typing import Any, Iterator, List, Tuple, Dict, BinaryIO, Optional, TYPE_CHECKING
 
 from ranked_vote.ballot import Ballot, UNDERVOTE, OVERVOTE, Candidate
+from ranked_vote_import.archive import ZipArchive
 from ranked_vote_import.base_normalizer import BaseNormalizer
-from ranked_vote_import.base_reader import BaseReader
+from ranked_vote_import.base_reader import BaseReader, update_sha1
+
+if TYPE_CHECKING:
+    from ranked_vote_import.ballot_batch import BallotBatch
+
+CONTEST_ID_COLUMN = re.compile(r'^Original/Cards/(\d+)/Contests/(\d+)/Id$')
 
 
 class SantaFeNormalizer(BaseNormalizer):
@@ -30,75 +38,232 @@ class SantaFeNormalizer(BaseNormalizer):
             normalized_choices.append(UNDERVOTE)
         return Ballot(ballot.ballot_id, normalized_choices)
 
+    def normalize_batch(self, batch: 'BallotBatch') -> 'BallotBatch':
+        from ranked_vote_import.ballot_batch import normalize_codes
+        return normalize_codes(batch)
+
 
 class SantaFeImporter(BaseReader):
     format_name = 'us_nm_saf'
     ballots: Iterator[Ballot]
+    _contest_candidates: Dict[str, Dict[str, Candidate]]
+
+    supports_checkpoints = True
+    # Offset into the decompressed CvrExport to start reading rows at, the offset just past the rows read so far, and
+    # the digest of everything before it.
+    _start_offset = 0
+    _position = 0
+    _prefix_sha1 = None
+    # The archive and CvrExport stream that seek_position() read up to _start_offset, along with the header line and
+    # the digest of what it read, for the read to continue from.
+    _resumed = None  # type: Optional[Tuple[ZipArchive, BinaryIO, bytes, Any]]
+    _unpicklable = BaseReader._unpicklable + ('_resumed',)
+    # Whether the last line yielded by _tracked_lines() had no terminator, so may be incomplete.
+    _partial_line = False
 
     @property
     def candidates(self):
-        return self._candidates
+        return [str(c) for c in self.contest_candidates(self._params.get('contest'))]
 
-    def _read_ballots(self):
+    def contest_candidates(self, contest: str) -> List[Candidate]:
+        return list(self._contest_candidates[contest].values())
+
+    @staticmethod
+    def index_columns(header: List[str]) -> Tuple[int, List[Tuple[int, List[Tuple[int, int]]]]]:
+        """Map the CvrExport header to the RecordId column and, for each contest slot on every card, in (card, slot)
+        order, the column of its contest Id and the (CandidateId, Rank) columns of each of its marks."""
+        columns = {name: i for i, name in enumerate(header)}
+        slots = sorted((int(m.group(1)), int(m.group(2))) for m in map(CONTEST_ID_COLUMN.match, header) if m)
+        contest_slots = list()
+
+        for card, slot in slots:
+            prefix = f'Original/Cards/{card}/Contests/{slot}'
+            mark_columns = list()
+            for mark in count():
+                candidate_key = f'{prefix}/Marks/{mark}/CandidateId'
+                rank_key = f'{prefix}/Marks/{mark}/Rank'
+                if candidate_key not in columns or rank_key not in columns:
+                    break
+                mark_columns.append((columns[candidate_key], columns[rank_key]))
+
+            contest_slots.append((columns[prefix + '/Id'], mark_columns))
+
+        return columns['RecordId'], contest_slots
+
+    def _read_manifests(self, archive: ZipArchive, contests: List[str]) \
+            -> Tuple[Dict[str, str], Dict[str, int], Dict[str, Dict[str, Candidate]]]:
+        """Return the description and number of ranks of each of the given contests, and its candidates, keyed by
+        contest Id."""
+        self._contest_candidates = {contest: dict() for contest in contests}
+        contest_descriptions = dict()  # type: Dict[str, str]
+        num_ranks = dict()  # type: Dict[str, int]
+        candidates = dict()  # type: Dict[str, Dict[str, Candidate]]
+
+        with archive.open('csvFiles/ContestManifest.csv') as contest_manifest_fh:
+            contest_manifest_text_fh = io.TextIOWrapper(contest_manifest_fh, 'utf-8')
+            for row in csv.DictReader(contest_manifest_text_fh):
+                description = row['Description']
+                if description in self._contest_candidates and description not in contest_descriptions.values():
+                    num_ranks[row['Id']] = int(row['NumOfRanks']) + 1
+                    contest_descriptions[row['Id']] = description
+                    candidates[row['Id']] = self._contest_candidates[description]
+
+        with archive.open('csvFiles/CandidateManifest.csv') as candidate_manifest_fh:
+            candidate_manifest_text_fh = io.TextIOWrapper(candidate_manifest_fh, 'utf-8')
+            for row in csv.DictReader(candidate_manifest_text_fh):
+                if row['ContestId'] in candidates:
+                    candidates[row['ContestId']][row['Id']] = self.resolve_candidate(row['Description'])
+
+        return contest_descriptions, num_ranks, candidates
+
+    def _tracked_lines(self, ballots_fh: BinaryIO, header: Optional[bytes] = None, sha1=None) -> Iterator[str]:
+        """Decode the lines of the CvrExport for the csv reader, keeping the offset of and a digest over every complete
+        line it has consumed. When continuing after seek_position(), ballots_fh is at self._start_offset and the
+        header and digest of the lines before it are given."""
+        if header is None:
+            header = ballots_fh.readline()
+            sha1 = hashlib.sha1(header)
+            self._position = len(header)
+        else:
+            self._position = self._start_offset
+        self._prefix_sha1 = sha1
+        yield header.decode('utf-8')
+
+        for line in ballots_fh:
+            if not line.endswith(b'\n'):
+                # The end of a file that is still being written, or was cut off: the line is parsed, but not
+                # counted as read.
+                self._partial_line = True
+                yield line.decode('utf-8')
+                return
+            sha1.update(line)
+            self._position += len(line)
+            yield line.decode('utf-8')
+
+    def _read_contest_ballots(self, contests: List[str]) -> Iterator[Tuple[str, Ballot]]:
         data_filename, = self.filenames
-        contest = self._params.get('contest')
-        candidates = dict()
-        contest_id = None
-        num_ranks = None
-
-        with zipfile.ZipFile(data_filename) as zf:
-            with zf.open('csvFiles/ContestManifest.csv', 'r') as contest_manifest_fh:
-                contest_manifest_text_fh = io.TextIOWrapper(contest_manifest_fh, 'utf-8')
-                for row in csv.DictReader(contest_manifest_text_fh):
-                    if row['Description'] == contest:
-                        num_ranks = int(row['NumOfRanks']) + 1
-                        contest_id = row['Id']
-                        break
-
-            with zf.open('csvFiles/CandidateManifest.csv', 'r') as candidate_manifest_fh:
-                candidate_manifest_text_fh = io.TextIOWrapper(candidate_manifest_fh, 'utf-8')
-                for row in csv.DictReader(candidate_manifest_text_fh):
-                    if row['ContestId'] == contest_id:
-                        candidates[row['Id']] = Candidate(row['Description'])
-                self._candidates = [str(c) for c in candidates.values()]
-
-            with zf.open('csvFiles/CvrExport.csv', 'r') as ballots_fh:
-                ballots_text_fh = io.TextIOWrapper(ballots_fh, 'utf-8')
-                for row in csv.DictReader(ballots_text_fh):
-                    ballot_ranks = dict()
-                    ballot_id = row['RecordId']
-
-                    for ballot_contest in range(100):
-                        key = f'Original/Cards/0/Contests/{ballot_contest}/Id'
-                        if key not in row:
+        if self._resumed is not None:
+            archive, member_fh, header, sha1 = self._resumed
+            self._resumed = None
+        else:
+            archive = ZipArchive(data_filename)
+            member_fh = header = sha1 = None
+
+        with archive:
+            contest_descriptions, num_ranks, candidates = self._read_manifests(archive, contests)
+            if member_fh is None:
+                member_fh = archive.open('csvFiles/CvrExport.csv')
+
+            with member_fh, self.read_ahead_stream(member_fh) as ballots_fh:
+                ballots_fh = self.timed_stream(ballots_fh, 'decompress')
+                if self.track_checkpoints or header is not None:
+                    rows = csv.reader(self._tracked_lines(ballots_fh, header, sha1))
+                else:
+                    rows = csv.reader(io.TextIOWrapper(ballots_fh, 'utf-8'))
+                header_row = next(rows)
+                record_id_column, contest_slots = SantaFeImporter.index_columns(header_row)
+                validate = self.validate
+
+                for row in rows:
+                    if self._partial_line:
+                        if len(row) < len(header_row):
+                            # The row was cut off; a later version of the file may complete it.
                             break
+                        self.ballots_past_position += 1
+                    ballot_id = row[record_id_column]
+                    seen_contests = None
 
-                        if row[key] == contest_id:
+                    for contest_column, mark_columns in contest_slots:
+                        contest_id = row[contest_column]
+                        if contest_id not in contest_descriptions:
+                            continue
+                        if seen_contests is None:
+                            seen_contests = {contest_id}
+                        elif contest_id in seen_contests:
+                            continue
+                        else:
+                            seen_contests.add(contest_id)
 
-                            for mark in range(num_ranks):
-                                candidate_key = f'Original/Cards/0/Contests/{ballot_contest}/Marks/{mark}/CandidateId'
-                                rank_key = f'Original/Cards/0/Contests/{ballot_contest}/Marks/{mark}/Rank'
-                                candidate_id = row[candidate_key]
+                        contest_ranks = num_ranks[contest_id]
+                        contest_candidates = candidates[contest_id]
+                        ballot_ranks = dict()
 
-                                if candidate_id == '':
-                                    break
+                        for candidate_column, rank_column in mark_columns[:contest_ranks]:
+                            candidate_id = row[candidate_column]
 
-                                rank = int(row[rank_key]) - 1
+                            if candidate_id == '':
+                                break
 
-                                candidate = candidates[candidate_id]
+                            rank = int(row[rank_column]) - 1
+                            if validate and not 0 <= rank < contest_ranks:
+                                # Marks outside the contest's ranks are left out of the ballot.
+                                self.anomaly('rank_out_of_range', ballot_id)
 
-                                if rank in ballot_ranks:
-                                    ballot_ranks[rank] = OVERVOTE
-                                else:
-                                    ballot_ranks[rank] = candidate
+                            candidate = contest_candidates[candidate_id]
 
-                            yield Ballot(ballot_id, [ballot_ranks.get(i, UNDERVOTE) for i in range(num_ranks)])
-                            break
+                            if rank in ballot_ranks:
+                                ballot_ranks[rank] = OVERVOTE
+                            else:
+                                ballot_ranks[rank] = candidate
+
+                        yield contest_descriptions[contest_id], Ballot(
+                            ballot_id, [ballot_ranks.get(i, UNDERVOTE) for i in range(contest_ranks)])
+
+    def _read_ballots(self):
+        for _, ballot in self._read_contest_ballots([self._params.get('contest')]):
+            yield ballot
+
+    def get_position(self) -> Optional[dict]:
+        if self._prefix_sha1 is None:
+            return None
+
+        contest = self._params.get('contest')
+        return {
+            'contest': contest,
+            'offset': self._position,
+            'sha1': self._prefix_sha1.hexdigest(),
+            'candidates': {candidate_id: str(c) for candidate_id, c in self._contest_candidates[contest].items()},
+        }
+
+    def seek_position(self, position: dict) -> bool:
+        contest = self._params.get('contest')
+        if contest != position['contest']:
+            return False
+
+        data_filename, = self.filenames
+        offset = position['offset']
+        archive = ZipArchive(data_filename)
+        try:
+            self._read_manifests(archive, [contest])
+            # Ballots already imported must still refer to the same candidates.
+            candidates = self._contest_candidates[contest]
+            if any(i not in candidates or str(candidates[i]) != name for i, name in position['candidates'].items()):
+                archive.close()
+                return False
+
+            # The rows before the offset are read once, both to check that they are unchanged and to skip them.
+            ballots_fh = archive.open('csvFiles/CvrExport.csv')
+            header = ballots_fh.readline()
+            sha1 = hashlib.sha1(header)
+            skip = offset - len(header)
+            if skip < 0 or update_sha1(sha1, ballots_fh, skip) != skip or sha1.hexdigest() != position['sha1']:
+                ballots_fh.close()
+                archive.close()
+                return False
+        except BaseException:
+            archive.close()
+            raise
+
+        self._resumed = (archive, ballots_fh, header, sha1)
+        self._start_offset = offset
+        return True
 
-            return
+    def read_contests(self) -> Iterator[Tuple[str, Ballot]]:
+        return self._read_contest_ballots(self.contests)
 
     def read_next_ballot(self) -> Ballot:
         return next(self.ballots)
 
     def read(self):
+        self._contest_candidates = dict()
         self.ballots = self._read_ballots()
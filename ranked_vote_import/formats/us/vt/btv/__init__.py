@@ -1,10 +1,20 @@
+import hashlib
 import re
-import zipfile
-from typing import Iterator
+from functools import partial
+from typing import Any, Iterator, BinaryIO, Optional, Tuple, TYPE_CHECKING
 
-from ranked_vote.ballot import Ballot, Candidate, OVERVOTE, UNDERVOTE
+from ranked_vote.ballot import Ballot, OVERVOTE, UNDERVOTE
+from ranked_vote_import.archive import ZipArchive
 from ranked_vote_import.base_normalizer import BaseNormalizer
-from ranked_vote_import.base_reader import BaseReader
+from ranked_vote_import.base_reader import BaseReader, update_sha1
+
+if TYPE_CHECKING:
+    from ranked_vote_import.ballot_batch import BallotBatch
+
+CANDIDATE_LINE = re.compile(rb'\.CANDIDATE ([^,]+), "([^"]+)"')
+BALLOT_LINE = re.compile(rb'([^,]+), \d\) (.+)')
+
+READ_CHUNK_SIZE = 1 << 20
 
 
 class BurlingtonNormalizer(BaseNormalizer):
@@ -24,37 +34,163 @@ class BurlingtonNormalizer(BaseNormalizer):
             normalized_choices.append(UNDERVOTE)
         return Ballot(ballot.ballot_id, normalized_choices)
 
+    def normalize_batch(self, batch: 'BallotBatch') -> 'BallotBatch':
+        from ranked_vote_import.ballot_batch import normalize_codes
+        return normalize_codes(batch)
+
 
 class BurlingtonImporter(BaseReader):
     format_name = 'us_vt_btv'
     ballots: Iterator[Ballot]
 
+    supports_checkpoints = True
+    # Offset into the report to start reading lines at, the offset just past the lines read so far, and the digest
+    # of everything before it.
+    _start_offset = 0
+    _position = 0
+    _prefix_sha1 = None
+    # The archive and report stream that seek_position() read up to _start_offset, along with the digest of what it
+    # read, for the read to continue from.
+    _resumed = None  # type: Optional[Tuple[ZipArchive, BinaryIO, Any]]
+    _unpicklable = BaseReader._unpicklable + ('_resumed',)
+    # Whether the last line yielded by _tracked_lines() had no terminator, so may be incomplete.
+    _partial_line = False
+
     @property
     def candidates(self):
         return self._candidates.values()
 
-    def _read_ballots(self):
-        data_filename, = self.filenames
-        report_path = self._params.get('report_path')
+    @staticmethod
+    def _report_lines(report_fh: BinaryIO) -> Iterator[bytes]:
+        # Only b'\r\n' ends a line, as in the report format.
+        remainder = b''
+        for chunk in iter(partial(report_fh.read, READ_CHUNK_SIZE), b''):
+            lines = (remainder + chunk).split(b'\r\n')
+            remainder = lines.pop()
+            yield from lines
+        if remainder:
+            yield remainder
 
-        zf = zipfile.ZipFile(data_filename)
-        report = zf.open(report_path).read().decode('ascii')
+    def _tracked_lines(self, report_fh: BinaryIO, sha1=None) -> Iterator[bytes]:
+        """Split the report into lines like _report_lines(), keeping the offset of and a digest over every complete
+        line it has consumed. When continuing after seek_position(), report_fh is at self._start_offset and the digest
+        of the lines before it is given."""
+        if sha1 is None:
+            sha1 = hashlib.sha1()
+            self._position = 0
+        else:
+            self._position = self._start_offset
+        self._prefix_sha1 = sha1
 
-        self._candidates = dict()
-        lines = iter(report.split('\r\n'))
+        remainder = b''
+        for chunk in iter(partial(report_fh.read, READ_CHUNK_SIZE), b''):
+            lines = (remainder + chunk).split(b'\r\n')
+            remainder = lines.pop()
+            for line in lines:
+                sha1.update(line + b'\r\n')
+                self._position += len(line) + 2
+                yield line
+        if remainder:
+            # The end of a report that is still being written, or was cut off: the line is parsed, but not counted
+            # as read.
+            self._partial_line = True
+            yield remainder
+
+    def _parse_candidates(self, lines: Iterator[bytes]):
         for line in lines:
-            match = re.match(r'\.CANDIDATE ([^,]+), "([^"]+)"', line)
+            match = CANDIDATE_LINE.match(line)
             if match:
                 cid, cname = match.groups()
-                self._candidates[cid] = Candidate(cname)
-            elif line.startswith('.FINAL-PILE'):
+                self._candidates[cid] = self.resolve_candidate(cname.decode('ascii'))
+            elif line.startswith(b'.FINAL-PILE'):
                 break
 
-        for line in lines:
-            match = re.match(r'([^,]+), \d\) (.+)', line)
-            if match:
-                ballot_id, votes = match.groups()
-                yield Ballot(ballot_id, [self._candidates.get(cid, OVERVOTE) for cid in votes.split(',')])
+    def _read_ballots(self):
+        data_filename, = self.filenames
+        report_path = self._params.get('report_path')
+
+        # Lines are parsed as bytes, keeping candidate ids as bytes; the report is ASCII.
+        if self._resumed is not None:
+            archive, member_fh, sha1 = self._resumed
+            self._resumed = None
+        else:
+            self._candidates = dict()
+            archive = ZipArchive(data_filename)
+            member_fh = sha1 = None
+
+        with archive:
+            if member_fh is None:
+                member_fh = archive.open(report_path)
+            with member_fh, self.read_ahead_stream(member_fh) as report_fh:
+                report_fh = self.timed_stream(report_fh, 'decompress')
+                if self.track_checkpoints or sha1 is not None:
+                    lines = self._tracked_lines(report_fh, sha1)
+                else:
+                    lines = BurlingtonImporter._report_lines(report_fh)
+                if sha1 is None:
+                    self._parse_candidates(lines)
+
+                for line in lines:
+                    match = BALLOT_LINE.match(line)
+                    if match:
+                        if self._partial_line:
+                            self.ballots_past_position += 1
+                        ballot_id, votes = match.groups()
+                        ballot_id = ballot_id.decode('ascii')
+                        if self.validate:
+                            # Tied rankings such as C01=C02 are overvotes; any other unknown id is an error.
+                            for cid in votes.split(b','):
+                                if cid not in self._candidates and b'=' not in cid:
+                                    self.anomaly('unknown_candidate', ballot_id)
+                        yield Ballot(ballot_id, [self._candidates.get(cid, OVERVOTE) for cid in votes.split(b',')])
+
+    def get_position(self) -> Optional[dict]:
+        if self._prefix_sha1 is None:
+            return None
+        return {
+            'report_path': self._params.get('report_path'),
+            'offset': self._position,
+            'sha1': self._prefix_sha1.hexdigest(),
+        }
+
+    def seek_position(self, position: dict) -> bool:
+        report_path = self._params.get('report_path')
+        if report_path != position['report_path']:
+            return False
+
+        data_filename, = self.filenames
+        offset = position['offset']
+        archive = ZipArchive(data_filename)
+        try:
+            # The lines before the offset, candidates included, are read once, both to check that they are unchanged
+            # and to skip them.
+            report_fh = archive.open(report_path)
+            sha1 = hashlib.sha1()
+            header = list()
+            read = 0
+            while read < offset:
+                line = report_fh.readline(offset - read)
+                if not line:
+                    break
+                sha1.update(line)
+                read += len(line)
+                header.append(line.rstrip(b'\r\n'))
+                if line.startswith(b'.FINAL-PILE'):
+                    break
+            read += update_sha1(sha1, report_fh, offset - read)
+            if read != offset or sha1.hexdigest() != position['sha1']:
+                report_fh.close()
+                archive.close()
+                return False
+        except BaseException:
+            archive.close()
+            raise
+
+        self._candidates = dict()
+        self._parse_candidates(iter(header))
+        self._resumed = (archive, report_fh, sha1)
+        self._start_offset = offset
+        return True
 
     def read_next_ballot(self) -> Ballot:
         return next(self.ballots)
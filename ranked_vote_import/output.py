@@ -0,0 +1,207 @@
+import csv
+import gzip
+import json
+import os
+import re
+from typing import List, Optional, Iterator, Tuple, TYPE_CHECKING
+
+from ranked_vote.ballot import Ballot, parse_choice, UNDERVOTE, OVERVOTE, WRITE_IN
+
+if TYPE_CHECKING:
+    import numpy as np
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'arrow')
+
+# Schema metadata keys of columnar ballot files.
+METADATA_KEY = b'ranked_vote_import.metadata'
+CANDIDATES_KEY = b'ranked_vote_import.candidates'
+
+
+def output_format_for(filename: str) -> str:
+    if re.search(r'\.parquet$', filename):
+        return 'parquet'
+    elif re.search(r'\.(arrow|feather)$', filename):
+        return 'arrow'
+    return 'csv'
+
+
+class BallotWriter:
+    """Writes ballots one at a time in the same CSV layout as ranked_vote.format.write_ballots, so that several
+    outputs can be filled from a single pass over the input. With append=True, ballots are added to the end of an
+    existing file (as a new gzip member, if compressed) without repeating the header."""
+
+    def __init__(self, filename: str, append: bool = False):
+        mode = 'a' if append else 'w'
+        if filename.endswith('.gz'):
+            self._fh = gzip.open(filename, mode + 't', encoding='UTF-8')
+        else:
+            self._fh = open(filename, mode)
+        self._writer = csv.writer(self._fh, lineterminator='\n')
+        if not append:
+            self._writer.writerow(['ballot_id', 'rank', 'choice'])
+
+    def write(self, ballot: Ballot):
+        ballot_id = ballot.ballot_id
+        self._writer.writerows((ballot_id, rank, str(choice)) for rank, choice in enumerate(ballot.choices, 1))
+
+    def flush(self):
+        """Make sure everything written so far is on disk, e.g. before recording a checkpoint that counts it."""
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self, metadata: Optional[dict] = None):
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ColumnarBallotWriter:
+    """Writes ballots as a Parquet or Arrow IPC file with a ballot_id column and one dictionary-encoded column per
+    rank (null past the end of a shorter ballot). The dictionary is the candidate table followed by the special
+    choices. The schema (the number of ranks, the candidate table and the import metadata passed to close()) is only
+    known once every ballot has been read, so ballots are spilled as compact code chunks of CHUNK_SIZE ballots to a
+    temporary Arrow stream next to the output, and close() copies them into the file a record batch at a time."""
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, filename: str, file_format: Optional[str] = None):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('Writing Parquet or Arrow output requires pyarrow (pip install pyarrow).')
+        from ranked_vote_import.ballot_batch import ChoiceEncoder
+
+        self.filename = filename
+        self.file_format = file_format or output_format_for(filename)
+        self._encoder = ChoiceEncoder()
+        self._pending = list()  # type: List[Ballot]
+        self._width = 0
+        self._spill_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        self._spill_sink = None
+        self._spill = None
+
+    def write(self, ballot: Ballot):
+        self._pending.append(ballot)
+        if len(self._pending) >= self.CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        import numpy as np
+        import pyarrow as pa
+        from ranked_vote_import.ballot_batch import BallotBatch
+
+        if not self._pending:
+            return
+        batch = BallotBatch.from_ballots(self._pending, self._encoder)
+        self._pending = list()
+        num_ballots, width = batch.choices.shape
+        self._width = max(self._width, width)
+
+        # Each chunk's codes are stored as a list column of rows of the chunk's own width.
+        offsets = pa.array(np.arange(num_ballots + 1, dtype=np.int32) * width)
+        choices = pa.ListArray.from_arrays(offsets, pa.array(batch.choices.ravel()))
+        chunk = pa.record_batch([pa.array(batch.ballot_ids, pa.string()), choices], names=['ballot_id', 'choices'])
+        if self._spill is None:
+            self._spill_sink = pa.OSFile(self._spill_filename, 'wb')
+            self._spill = pa.ipc.new_stream(self._spill_sink, chunk.schema)
+        self._spill.write_batch(chunk)
+
+    def _chunks(self) -> Iterator[Tuple[list, 'np.ndarray']]:
+        import pyarrow as pa
+
+        if self._spill is None:
+            return
+        for chunk in pa.ipc.open_stream(pa.memory_map(self._spill_filename)):
+            ballot_ids = chunk.column(0).to_pylist()
+            codes = chunk.column(1).flatten().to_numpy()
+            yield ballot_ids, codes.reshape(len(ballot_ids), len(codes) // len(ballot_ids))
+
+    def _record_batches(self, schema) -> Iterator:
+        import numpy as np
+        import pyarrow as pa
+        from ranked_vote_import.ballot_batch import PADDING_CODE, CODE_DTYPE
+
+        candidate_ids = json.loads(schema.metadata[CANDIDATES_KEY])
+        dictionary = pa.array(candidate_ids + [str(UNDERVOTE), str(OVERVOTE), str(WRITE_IN)], pa.string())
+        num_candidates = len(candidate_ids)
+        for ballot_ids, choices in self._chunks():
+            # Reserved codes -1, -2, -3 (undervote, overvote, write-in) map to the entries after the candidates.
+            padding = choices == PADDING_CODE
+            indices = np.where(choices >= 0, choices, num_candidates - choices - 1)
+            indices = np.where(padding, 0, indices).astype(CODE_DTYPE)
+            columns = [pa.array(ballot_ids, pa.string())]
+            for rank in range(self._width):
+                if rank < choices.shape[1]:
+                    column_indices = pa.array(indices[:, rank], mask=padding[:, rank])
+                else:
+                    column_indices = pa.nulls(len(ballot_ids), pa.int32())
+                columns.append(pa.DictionaryArray.from_arrays(column_indices, dictionary))
+            yield pa.record_batch(columns, schema=schema)
+
+    def _schema(self, metadata: Optional[dict]):
+        import pyarrow as pa
+
+        return pa.schema(
+            [pa.field('ballot_id', pa.string())] +
+            [pa.field('rank_{}'.format(rank), pa.dictionary(pa.int32(), pa.string()))
+             for rank in range(1, self._width + 1)],
+            metadata={
+                METADATA_KEY: json.dumps(metadata or {}, sort_keys=True),
+                CANDIDATES_KEY: json.dumps([str(c) for c in self._encoder.candidates]),
+            })
+
+    def close(self, metadata: Optional[dict] = None):
+        import pyarrow as pa
+
+        self._flush()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill_sink.close()
+
+        try:
+            schema = self._schema(metadata)
+            if self.file_format == 'parquet':
+                import pyarrow.parquet as pq
+                with pq.ParquetWriter(self.filename, schema) as writer:
+                    for batch in self._record_batches(schema):
+                        writer.write_batch(batch)
+            else:
+                with pa.OSFile(self.filename, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                    for batch in self._record_batches(schema):
+                        writer.write_batch(batch)
+        finally:
+            if self._spill is not None:
+                os.remove(self._spill_filename)
+
+
+def open_ballot_writer(filename: str, file_format: Optional[str] = None):
+    file_format = file_format or output_format_for(filename)
+    if file_format == 'csv':
+        return BallotWriter(filename)
+    return ColumnarBallotWriter(filename, file_format)
+
+
+def read_columnar_ballots(filename: str) -> Tuple[Iterator[Ballot], dict]:
+    """Read a file written by ColumnarBallotWriter, returning its ballots and the embedded import metadata. Arrow
+    files are memory-mapped."""
+    import pyarrow as pa
+
+    if output_format_for(filename) == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(filename)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(filename)).read_all()
+
+    metadata = json.loads(table.schema.metadata[METADATA_KEY])
+
+    def ballots():
+        ballot_ids = table.column('ballot_id').to_pylist()
+        ranks = [table.column(name).to_pylist() for name in table.column_names[1:]]
+        for i, ballot_id in enumerate(ballot_ids):
+            yield Ballot(ballot_id, [parse_choice(rank[i]) for rank in ranks if rank[i] is not None])
+
+    return ballots(), metadata
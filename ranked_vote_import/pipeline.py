@@ -0,0 +1,98 @@
+import io
+import queue
+from functools import partial
+from threading import Event, Thread
+from typing import BinaryIO, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+# Items are handed between threads in chunks, to keep queue and thread switching overhead low per ballot.
+CHUNK_SIZE = 1000
+QUEUE_DEPTH = 16
+READ_AHEAD_SIZE = 1 << 20
+READ_AHEAD_DEPTH = 4
+
+_DONE = object()
+
+
+class _Raised:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def _put(chunks: queue.Queue, item, stop: Event) -> bool:
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def threaded(items: Iterable[T], chunk_size: int = CHUNK_SIZE, depth: int = QUEUE_DEPTH) -> Iterator[T]:
+    """Iterate over items on a background thread, which runs ahead of the consumer by at most depth chunks of items.
+    Items come out in order, and an exception raised while producing them is raised again in the consumer."""
+    chunks = queue.Queue(depth)
+    stop = Event()
+
+    def produce():
+        try:
+            chunk = list()
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    if not _put(chunks, chunk, stop):
+                        return
+                    chunk = list()
+            if chunk and not _put(chunks, chunk, stop):
+                return
+            _put(chunks, _DONE, stop)
+        except BaseException as e:
+            _put(chunks, _Raised(e), stop)
+
+    thread = Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, _Raised):
+                raise chunk.exception
+            yield from chunk
+    finally:
+        # Also stops the producer when the consumer gives up early.
+        stop.set()
+        thread.join()
+
+
+class _ReadAheadRaw(io.RawIOBase):
+    def __init__(self, raw: BinaryIO, chunk_size: int, depth: int):
+        super().__init__()
+        self._chunks = threaded(iter(partial(raw.read, chunk_size), b''), 1, depth)
+        self._buffer = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buffer:
+            chunk = next(self._chunks, b'')
+            if not chunk:
+                return 0
+            self._buffer = memoryview(chunk)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        self._chunks.close()
+        super().close()
+
+
+def read_ahead(raw: BinaryIO, chunk_size: int = READ_AHEAD_SIZE, depth: int = READ_AHEAD_DEPTH) -> BinaryIO:
+    """Wrap a sequentially read binary stream so that reading it, e.g. decompressing a zip member, runs ahead of the
+    consumer on a background thread. Close the wrapper before the stream it wraps."""
+    return io.BufferedReader(_ReadAheadRaw(raw, chunk_size, depth), chunk_size)
@@ -0,0 +1,78 @@
+from importlib import import_module
+from typing import Dict, Iterator, Mapping, Optional, Any
+
+
+def _entry_points(group: str) -> list:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            try:
+                import pkg_resources
+            except ImportError:
+                return []
+            return list(pkg_resources.iter_entry_points(group))
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+class LazyRegistry(Mapping):
+    """A read-only mapping from format names to classes, given as 'module:attribute' strings and imported on first
+    access, so that a run only pays for loading the format (and the dependencies) it uses.
+
+    Other packages can add formats under the entry point group, e.g. in their setup.py:
+
+        entry_points={'ranked_vote_import.formats': ['xx_abc = my_package.abc:AbcImporter']}
+
+    Entry points are only looked up for names that are not built in, or when listing every name."""
+
+    def __init__(self, specs: Dict[str, str], entry_point_group: Optional[str] = None):
+        self._specs = dict(specs)
+        self._entry_point_group = entry_point_group
+        self._plugins = None  # type: Optional[Dict[str, Any]]
+        self._loaded = dict()  # type: Dict[str, Any]
+
+    def _discover(self) -> Dict[str, Any]:
+        if self._plugins is None:
+            self._plugins = dict()
+            if self._entry_point_group is not None:
+                for ep in _entry_points(self._entry_point_group):
+                    # Built-in formats take precedence over plugins of the same name.
+                    if ep.name not in self._specs:
+                        self._plugins.setdefault(ep.name, ep)
+        return self._plugins
+
+    def __getitem__(self, name: str):
+        loaded = self._loaded.get(name)
+        if loaded is None:
+            if name in self._specs:
+                module_name, attribute = self._specs[name].split(':')
+                loaded = getattr(import_module(module_name), attribute)
+            elif name in self._discover():
+                loaded = self._plugins[name].load()
+            else:
+                raise KeyError(name)
+            self._loaded[name] = loaded
+        return loaded
+
+    def __contains__(self, name) -> bool:
+        return name in self._specs or name in self._discover()
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._specs
+        yield from self._discover()
+
+    def __len__(self) -> int:
+        return len(self._specs) + len(self._discover())
+
+    def find_attribute(self, attribute: str) -> Optional[str]:
+        """Return the name of the built-in format whose spec refers to the given class name, if any."""
+        for name, spec in self._specs.items():
+            if spec.endswith(':' + attribute):
+                return name
+        return None
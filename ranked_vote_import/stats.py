@@ -0,0 +1,198 @@
+import io
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock, local
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, BinaryIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The CPU time of the calling thread. Python 3.6 only has the whole process's, which also counts other threads.
+thread_time = getattr(time, 'thread_time', time.process_time)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class ImportHook:
+    """Receives events from a reader (see BaseReader.stage()) and from the import around it. Every method does
+    nothing by default, so hooks only override what they use.
+
+    Stages nest: a stage entered while another one is running on the same thread is part of it, e.g. 'decompress'
+    within 'read'. Readers may enter stages on background threads, such as 'hash'."""
+
+    def enter_stage(self, name: str):
+        pass
+
+    def exit_stage(self, name: str):
+        pass
+
+    def progress(self, num_ballots: int):
+        """Called every PROGRESS_INTERVAL ballots, and after every batch when reading in batches."""
+        pass
+
+    def anomaly(self, kind: str, ballot_id: Optional[str] = None):
+        """Called for each problem found in the input by a reader with validate set, e.g. 'unknown_candidate'."""
+        pass
+
+
+class ImportStats(ImportHook):
+    """Collects the wall and CPU time spent in each stage, excluding the stages nested in it, along with throughput
+    and peak memory. With progress_seconds set, prints a progress line at most that often."""
+
+    def __init__(self, progress_seconds: Optional[float] = None, progress_fh: TextIO = sys.stderr):
+        self.progress_seconds = progress_seconds
+        self.progress_fh = progress_fh
+        self.num_ballots = 0
+        self.input_file_bytes = None  # type: Optional[int]
+        self._stages = dict()  # type: Dict[str, List]
+        self._lock = Lock()
+        self._local = local()
+        self._start = self._last_progress = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._finished = None  # type: Optional[float]
+        self._finished_cpu = None  # type: Optional[float]
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = list()
+        return stack
+
+    def enter_stage(self, name: str):
+        # Each entry holds the stage name, its start times and the time spent in stages nested in it.
+        self._stack().append([name, time.perf_counter(), thread_time(), 0.0, 0.0])
+
+    def exit_stage(self, name: str):
+        stack = self._stack()
+        entry_name, start, start_cpu, nested, nested_cpu = stack.pop()
+        assert entry_name == name
+        wall = time.perf_counter() - start
+        cpu = thread_time() - start_cpu
+        if stack:
+            stack[-1][3] += wall
+            stack[-1][4] += cpu
+
+        with self._lock:
+            totals = self._stages.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += wall - nested
+            totals[1] += cpu - nested_cpu
+            totals[2] += 1
+
+    @contextmanager
+    def stage(self, name: str):
+        self.enter_stage(name)
+        try:
+            yield
+        finally:
+            self.exit_stage(name)
+
+    def timed(self, name: str, items: Iterable) -> Iterator:
+        """Yield from items, counting the time spent producing each one towards the given stage."""
+        items = iter(items)
+        while True:
+            self.enter_stage(name)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self.exit_stage(name)
+            yield item
+
+    def progress(self, num_ballots: int):
+        self.num_ballots = num_ballots
+        if self.progress_seconds is None:
+            return
+        now = time.perf_counter()
+        if now - self._last_progress >= self.progress_seconds:
+            self._last_progress = now
+            elapsed = now - self._start
+            print('  {:,} ballots in {:.1f}s ({:,.0f} ballots/s)'.format(
+                num_ballots, elapsed, num_ballots / elapsed if elapsed else 0), file=self.progress_fh)
+
+    def finish(self, num_ballots: int, input_file_bytes: Optional[int] = None):
+        """Record the end of the import. Input throughput is only reported if input_file_bytes is given, which should
+        be when the import read its input files in full."""
+        self.num_ballots = num_ballots
+        self.input_file_bytes = input_file_bytes
+        self._finished = time.perf_counter()
+        self._finished_cpu = time.process_time()
+
+    def to_dict(self) -> dict:
+        end = self._finished if self._finished is not None else time.perf_counter()
+        end_cpu = self._finished_cpu if self._finished_cpu is not None else time.process_time()
+        wall = end - self._start
+        with self._lock:
+            stages = {name: {'wall_seconds': totals[0], 'cpu_seconds': totals[1], 'calls': totals[2]}
+                      for name, totals in self._stages.items()}
+        return {
+            'wall_seconds': wall,
+            'cpu_seconds': end_cpu - self._start_cpu,
+            'num_ballots': self.num_ballots,
+            'ballots_per_second': self.num_ballots / wall if wall else None,
+            'input_file_bytes': self.input_file_bytes,
+            'input_file_bytes_per_second': self.input_file_bytes / wall
+            if wall and self.input_file_bytes is not None else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': stages,
+        }
+
+    def format(self) -> List[str]:
+        stats = self.to_dict()
+        lines = ['{:<12} {:>10} {:>10} {:>10}'.format('stage', 'wall (s)', 'cpu (s)', 'calls')]
+        for name, stage in sorted(stats['stages'].items(), key=lambda s: -s[1]['wall_seconds']):
+            lines.append('{:<12} {:>10.3f} {:>10.3f} {:>10,}'.format(
+                name, stage['wall_seconds'], stage['cpu_seconds'], stage['calls']))
+        lines.append('{:<12} {:>10.3f} {:>10.3f}'.format('total', stats['wall_seconds'], stats['cpu_seconds']))
+        lines.append('{:,.0f} ballots/s, {:.1f} MiB/s of input, {:.1f} MiB peak RSS'.format(
+            stats['ballots_per_second'] or 0, (stats['input_file_bytes_per_second'] or 0) / (1 << 20),
+            (stats['peak_rss_bytes'] or 0) / (1 << 20)))
+        return lines
+
+
+class TimedStream(io.BufferedIOBase):
+    """Wraps a binary file so that the time spent in its reads counts towards a reader stage, e.g. to separate
+    decompressing a zip member from parsing it."""
+
+    def __init__(self, raw: BinaryIO, reader, stage: str):
+        super().__init__()
+        self._raw = raw
+        self._reader = reader
+        self._stage = stage
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self._raw.seekable()
+
+    def read(self, size: int = -1) -> bytes:
+        with self._reader.stage(self._stage):
+            return self._raw.read(size)
+
+    def read1(self, size: int = -1) -> bytes:
+        with self._reader.stage(self._stage):
+            return self._raw.read1(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        with self._reader.stage(self._stage):
+            return self._raw.readline(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        with self._reader.stage(self._stage):
+            return self._raw.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._raw.tell()
+
+    def fileno(self) -> int:
+        return self._raw.fileno()
@@ -0,0 +1,141 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ranked_vote.ballot import UNDERVOTE, OVERVOTE, WRITE_IN
+from ranked_vote_import.ballot_batch import BallotBatch, BatchConsumer, OVERVOTE_CODE, WRITE_IN_CODE
+
+COUNT_DTYPE = np.int64
+
+
+class Tallies(BatchConsumer):
+    """Summary counts of a ballot stream, accumulated a batch at a time so that they can be computed in the same
+    pass as an import:
+
+    - first_choices: the number of ballots with each choice (a candidate, $OVERVOTE or $UNDERVOTE) at rank 1,
+    - rank_counts: for each choice, the number of ballots with it at each rank,
+    - ranked_candidates: the number of ballots ranking 0, 1, 2, ... distinct candidates,
+    - pairwise: for each pair of candidates (a, b), the number of ballots preferring a to b, i.e. ranking a above b
+      or ranking a but not b,
+    - overvotes (ballots with an overvote), undervotes (ballots with no marks at all) and exhaustible ballots (ballots
+      that do not rank every candidate, so may exhaust before the final round), with their rates.
+
+    A ballot's preferences are read as a tabulation would: skipping undervotes and repeated candidates, and stopping at
+    the first overvote. Write-ins count as one candidate."""
+
+    def __init__(self):
+        super().__init__()
+        self.num_ballots = 0
+        self.overvotes = 0
+        self.undervotes = 0
+        self.names = list()  # type: List[str]
+        self._indexes = dict()  # type: Dict[str, int]
+        self._first_choices = np.zeros(0, dtype=COUNT_DTYPE)
+        self._rank_counts = np.zeros((0, 0), dtype=COUNT_DTYPE)
+        self._ranked = np.zeros(0, dtype=COUNT_DTYPE)
+        # _above[a, b] counts ballots ranking both a and b, with a above b.
+        self._above = np.zeros((0, 0), dtype=COUNT_DTYPE)
+        self._ranked_candidates = np.zeros(0, dtype=COUNT_DTYPE)
+
+    def _index(self, name: str) -> int:
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._indexes[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def _grow(self, num_names: int, width: int):
+        grow_names = num_names - len(self._first_choices)
+        grow_width = max(0, width - self._rank_counts.shape[1])
+        if grow_names or grow_width:
+            self._first_choices = np.pad(self._first_choices, (0, grow_names))
+            self._ranked = np.pad(self._ranked, (0, grow_names))
+            self._above = np.pad(self._above, ((0, grow_names), (0, grow_names)))
+            self._rank_counts = np.pad(self._rank_counts, ((0, grow_names), (0, grow_width)))
+        if len(self._ranked_candidates) < width + 1:
+            self._ranked_candidates = np.pad(self._ranked_candidates, (0, width + 1 - len(self._ranked_candidates)))
+
+    def add_batch(self, batch: BallotBatch):
+        codes = batch.choices
+        num_ballots, width = codes.shape
+        if not num_ballots:
+            return
+
+        # Map codes to indexes into self.names; the reserved codes follow the candidate table, padding maps to -1.
+        lookup = np.array([self._index(str(c)) for c in batch.candidates] + [
+            -1, self._index(str(WRITE_IN)), self._index(str(OVERVOTE)), self._index(str(UNDERVOTE))], dtype=np.intp)
+        indexes = lookup[codes]
+        num_names = len(self.names)
+        self._grow(num_names, width)
+        self.num_ballots += num_ballots
+
+        if width:
+            first = indexes[:, 0]
+            self._first_choices += np.bincount(first[first >= 0], minlength=num_names)
+        for rank in range(width):
+            column = indexes[:, rank]
+            self._rank_counts[:, rank] += np.bincount(column[column >= 0], minlength=num_names)
+
+        is_overvote = codes == OVERVOTE_CODE
+        is_choice = (codes >= 0) | (codes == WRITE_IN_CODE)
+        has_overvote = is_overvote.any(axis=1)
+        self.overvotes += int(has_overvote.sum())
+        self.undervotes += int((~(is_choice | is_overvote).any(axis=1)).sum())
+
+        # The effective ranking: first occurrences of each candidate, before the first overvote.
+        repeated = np.zeros_like(is_choice)
+        for col in range(1, width):
+            repeated[:, col] = (codes[:, :col] == codes[:, col:col + 1]).any(axis=1)
+        stop = np.where(has_overvote, is_overvote.argmax(axis=1), width)
+        effective = is_choice & ~repeated & (np.arange(width) < stop[:, None])
+
+        self._ranked += np.bincount(indexes[effective], minlength=num_names)
+        self._ranked_candidates += np.bincount(effective.sum(axis=1), minlength=len(self._ranked_candidates))
+
+        pairs = list()
+        for i in range(width):
+            for j in range(i + 1, width):
+                both = effective[:, i] & effective[:, j]
+                pairs.append(indexes[both, i] * num_names + indexes[both, j])
+        if pairs:
+            self._above += np.bincount(np.concatenate(pairs), minlength=num_names * num_names).reshape(
+                num_names, num_names)
+
+    def to_dict(self, candidates: Optional[List[str]] = None) -> dict:
+        """Return the counts, keyed by choice name. Pairwise counts cover the given candidates, e.g. all those in
+        the contest, and any other candidate that was ranked."""
+        self.flush()
+        candidates = list(candidates or [])
+        special = {str(OVERVOTE), str(UNDERVOTE)}
+        candidates += [name for i, name in enumerate(self.names)
+                       if self._ranked[i] and name not in special and name not in candidates]
+        num_candidates = len(candidates)
+
+        ranked = {name: int(self._ranked[i]) for i, name in enumerate(self.names)}
+        pairwise = dict()
+        for a in candidates:
+            pairwise[a] = dict()
+            for b in candidates:
+                if a != b:
+                    above = int(self._above[self._indexes[b], self._indexes[a]]) \
+                        if a in self._indexes and b in self._indexes else 0
+                    # Ballots ranking a, less those that rank b above it.
+                    pairwise[a][b] = ranked.get(a, 0) - above
+
+        ranked_candidates = self._ranked_candidates.tolist()
+        exhaustible = sum(ranked_candidates[:num_candidates])
+        return {
+            'num_ballots': self.num_ballots,
+            'first_choices': {name: int(self._first_choices[i]) for i, name in enumerate(self.names)
+                              if self._first_choices[i]},
+            'rank_counts': {name: self._rank_counts[i].tolist() for i, name in enumerate(self.names)
+                            if self._rank_counts[i].any()},
+            'ranked_candidates': ranked_candidates,
+            'pairwise': pairwise,
+            'overvotes': self.overvotes,
+            'undervotes': self.undervotes,
+            'exhaustible': exhaustible,
+            'overvote_rate': self.overvotes / self.num_ballots if self.num_ballots else None,
+            'undervote_rate': self.undervotes / self.num_ballots if self.num_ballots else None,
+            'exhaustible_rate': exhaustible / self.num_ballots if self.num_ballots else None,
+        }
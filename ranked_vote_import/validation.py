@@ -0,0 +1,123 @@
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ranked_vote_import.ballot_batch import BallotBatch, BatchConsumer, UNDERVOTE_CODE, OVERVOTE_CODE, WRITE_IN_CODE
+from ranked_vote_import.stats import ImportHook
+
+# The duplicate ballot id filter is sized for this many ballots at this false positive rate, which takes 23 MiB. Past
+# its capacity the false positive rate rises; the report gives an estimate.
+DUPLICATE_CAPACITY = 10 ** 7
+DUPLICATE_ERROR_RATE = 1e-4
+
+# Ballot ids kept as examples of each anomaly.
+NUM_SAMPLES = 10
+
+
+class BloomFilter:
+    """A set of 64-bit hashes that can answer "possibly seen" or "definitely not seen", in a fixed number of bits."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.num_bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.num_items = 0
+        self._bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # Double hashing: the i-th position of each hash is h1 + i * h2.
+        h = hashes.view(np.uint64)
+        h1, h2 = h & np.uint64(0xffffffff), (h >> np.uint64(32)) | np.uint64(1)
+        i = np.arange(self.num_hashes, dtype=np.uint64)
+        return ((h1[:, None] + i * h2[:, None]) % np.uint64(self.num_bits)).astype(np.intp)
+
+    def add(self, hashes: np.ndarray) -> np.ndarray:
+        """Add hashes, returning which of them had possibly been added before, including earlier in hashes."""
+        positions = self._positions(hashes)
+        seen = (self._bits[positions >> 3] >> (positions & 7).astype(np.uint8) & 1).all(axis=1)
+        _, first = np.unique(hashes, return_index=True)
+        repeated = np.ones(len(hashes), dtype=bool)
+        repeated[first] = False
+
+        # Combine the bits set in each byte first, which is much faster than np.bitwise_or.at().
+        flat = np.sort(positions.ravel())
+        byte_indexes = flat >> 3
+        masks = np.left_shift(1, flat & 7).astype(np.uint8)
+        starts = np.flatnonzero(np.concatenate(([True], byte_indexes[1:] != byte_indexes[:-1])))
+        self._bits[byte_indexes[starts]] |= np.bitwise_or.reduceat(masks, starts)
+        self.num_items += len(hashes)
+        return seen | repeated
+
+    @property
+    def error_rate(self) -> float:
+        """The current chance that a new item is reported as possibly seen."""
+        return (1 - math.exp(-self.num_hashes * self.num_items / self.num_bits)) ** self.num_hashes
+
+
+class Validator(BatchConsumer, ImportHook):
+    """Checks a stream of ballots for anomalies in one pass with bounded memory, counting each kind and keeping a few
+    example ballot ids:
+
+    - duplicate_ballot_id: a ballot id seen before, found with a Bloom filter, so a small share may be false alarms,
+    - rank_gap: a skipped rank followed by a marked one,
+    - repeated_candidate: a candidate ranked more than once,
+
+    along with the anomalies readers report while parsing their input when BaseReader.validate is set, such as
+    unknown_candidate and rank_out_of_order."""
+
+    def __init__(self, capacity: int = DUPLICATE_CAPACITY, error_rate: float = DUPLICATE_ERROR_RATE):
+        super().__init__()
+        self.num_ballots = 0
+        self.counts = dict()  # type: Dict[str, int]
+        self.samples = dict()  # type: Dict[str, List[str]]
+        self._ids = BloomFilter(capacity, error_rate)
+
+    def anomaly(self, kind: str, ballot_id: Optional[str] = None):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        samples = self.samples.setdefault(kind, list())
+        if ballot_id is not None and len(samples) < NUM_SAMPLES:
+            samples.append(ballot_id)
+
+    def _record(self, kind: str, mask: np.ndarray, ballot_ids: List[str]):
+        count = int(mask.sum())
+        if count:
+            self.counts[kind] = self.counts.get(kind, 0) + count
+            samples = self.samples.setdefault(kind, list())
+            samples.extend(ballot_ids[i] for i in np.flatnonzero(mask)[:NUM_SAMPLES - len(samples)])
+
+    def add_batch(self, batch: BallotBatch):
+        ids = batch.ballot_ids
+        self.num_ballots += len(batch)
+        if not len(batch):
+            return
+        self._record('duplicate_ballot_id', self._ids.add(np.fromiter(map(hash, ids), np.int64, len(ids))), ids)
+
+        codes = batch.choices
+        width = codes.shape[1]
+        marked = (codes >= 0) | (codes == WRITE_IN_CODE) | (codes == OVERVOTE_CODE)
+        # Whether any rank after each one is marked.
+        later_marked = np.zeros_like(marked)
+        later_marked[:, :-1] = np.logical_or.accumulate(marked[:, ::-1], axis=1)[:, ::-1][:, 1:]
+        self._record('rank_gap', ((codes == UNDERVOTE_CODE) & later_marked).any(axis=1), batch.ballot_ids)
+
+        repeated = np.zeros(len(batch), dtype=bool)
+        for col in range(1, width):
+            repeated |= (codes[:, col] >= 0) & (codes[:, :col] == codes[:, col:col + 1]).any(axis=1)
+        self._record('repeated_candidate', repeated, batch.ballot_ids)
+
+    def to_dict(self) -> dict:
+        self.flush()
+        return {
+            'num_ballots': self.num_ballots,
+            'valid': not any(self.counts.values()),
+            'anomalies': dict(self.counts),
+            'samples': {kind: samples for kind, samples in self.samples.items() if samples},
+            'duplicate_id_error_rate': self._ids.error_rate,
+        }
+
+    def format(self) -> List[str]:
+        report = self.to_dict()
+        if report['valid']:
+            return ['No anomalies in {:,} ballots.'.format(report['num_ballots'])]
+        return ['{}: {:,} (e.g. {})'.format(kind, count, ', '.join(report['samples'].get(kind, [])) or 'n/a')
+                for kind, count in sorted(report['anomalies'].items())]
@@ -11,12 +11,18 @@ setup(name='ranked-vote-import',
       packages=['ranked_vote_import'],
       entry_points={
           'console_scripts': [
-              'rcv-import = ranked_vote_import.bin.import_rcv_data:main'
+              'rcv-import = ranked_vote_import.bin.import_rcv_data:main',
+              'rcv-import-batch = ranked_vote_import.bin.import_rcv_batch:main',
           ]
       },
       install_requires=[
+          'numpy',
           'pandas>=0.23.4',
           'ranked-vote>=0.0.1'
       ],
+      extras_require={
+          'columnar': ['pyarrow'],
+          'streaming': ['openpyxl'],
+      },
       python_requires='>=3.6',
       )
@@ -0,0 +1,71 @@
+import io
+import os
+import zipfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote_import import archive
+from ranked_vote_import.archive import MappedMember, ZipArchive
+
+DATA = b''.join(b'%d,%d\r\n' % (i, i * i) for i in range(5000))
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'data.zip')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_zip(self, compression):
+        with zipfile.ZipFile(self.filename, 'w', compression) as zf:
+            zf.writestr('readme.txt', b'hello')
+            zf.writestr('csvFiles/data.csv', DATA)
+
+    def test_read_members(self):
+        chunk_size = archive.INFLATE_CHUNK_SIZE
+        archive.INFLATE_CHUNK_SIZE = 1000
+        try:
+            for compression in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2]:
+                self.write_zip(compression)
+                with ZipArchive(self.filename) as zip_archive:
+                    with zip_archive.open('csvFiles/data.csv') as fh:
+                        self.assertEqual(DATA, fh.read())
+                    with zip_archive.open('csvFiles/data.csv') as fh:
+                        self.assertEqual(DATA.splitlines(keepends=True), list(fh))
+                    with zip_archive.open('readme.txt') as fh:
+                        self.assertEqual('hello', io.TextIOWrapper(fh, 'utf-8').read())
+        finally:
+            archive.INFLATE_CHUNK_SIZE = chunk_size
+
+    def test_stored_member(self):
+        self.write_zip(zipfile.ZIP_STORED)
+        with ZipArchive(self.filename) as zip_archive:
+            with zip_archive.open('csvFiles/data.csv') as fh:
+                self.assertIsInstance(fh, MappedMember)
+                self.assertEqual(b'0,0\r\n', fh.readline())
+                self.assertEqual(b'1,1', fh.read(3))
+                self.assertEqual(8, fh.tell())
+                fh.seek(-4, io.SEEK_END)
+                self.assertEqual(b'01\r\n', fh.read())
+                fh.seek(0)
+                self.assertEqual(DATA, fh.read())
+
+    def test_corrupt_member(self):
+        self.write_zip(zipfile.ZIP_DEFLATED)
+        with ZipArchive(self.filename) as zip_archive:
+            info = zip_archive._zip.getinfo('csvFiles/data.csv')
+            info.CRC ^= 1
+            with zip_archive.open('csvFiles/data.csv') as fh, self.assertRaises(zipfile.BadZipFile):
+                fh.read()
+
+    def test_read_after_unlink(self):
+        # Members are read through the handle opened with the archive, not by opening the file again.
+        for compression in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+            self.write_zip(compression)
+            with ZipArchive(self.filename) as zip_archive:
+                os.unlink(self.filename)
+                for _ in range(2):
+                    with zip_archive.open('csvFiles/data.csv') as fh:
+                        self.assertEqual(DATA, fh.read())
@@ -0,0 +1,70 @@
+import random
+from unittest import TestCase
+
+import numpy as np
+
+from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE, WRITE_IN
+from ranked_vote_import.ballot_batch import BallotBatch, ChoiceEncoder, PADDING_CODE, UNDERVOTE_CODE, \
+    OVERVOTE_CODE, WRITE_IN_CODE
+from ranked_vote_import.formats.us.ca.sfo import SanFranciscoNormalizer
+from ranked_vote_import.formats.us.me import MaineNormalizer
+from ranked_vote_import.formats.us.nm.saf import SantaFeNormalizer
+from ranked_vote_import.formats.us.vt.btv import BurlingtonNormalizer
+
+BALLOTS = [
+    Ballot('1', [Candidate('A'), Candidate('B'), UNDERVOTE]),
+    Ballot('2', [OVERVOTE, WRITE_IN]),
+    Ballot('3', []),
+    Ballot('4', [UNDERVOTE, Candidate('C'), Candidate('A'), Candidate('A')]),
+]
+
+
+class TestBallotBatch(TestCase):
+    def test_from_ballots(self):
+        batch = BallotBatch.from_ballots(BALLOTS, ChoiceEncoder())
+
+        self.assertEqual(['1', '2', '3', '4'], batch.ballot_ids)
+        self.assertEqual([Candidate('A'), Candidate('B'), Candidate('C')], batch.candidates)
+        self.assertEqual([3, 2, 0, 4], batch.lengths.tolist())
+        np.testing.assert_array_equal([
+            [0, 1, UNDERVOTE_CODE, PADDING_CODE],
+            [OVERVOTE_CODE, WRITE_IN_CODE, PADDING_CODE, PADDING_CODE],
+            [PADDING_CODE, PADDING_CODE, PADDING_CODE, PADDING_CODE],
+            [UNDERVOTE_CODE, 2, 0, 0],
+        ], batch.choices)
+
+    def test_round_trip(self):
+        batch = BallotBatch.from_ballots(BALLOTS, ChoiceEncoder())
+        self.assertEqual(BALLOTS, list(batch.to_ballots()))
+
+    def test_normalize_batch(self):
+        normalizer = BurlingtonNormalizer()
+        batch = normalizer.normalize_batch(BallotBatch.from_ballots(BALLOTS, ChoiceEncoder()))
+
+        self.assertEqual([normalizer.normalize(ballot) for ballot in BALLOTS], list(batch.to_ballots()))
+
+    def test_normalize_batch_write_in(self):
+        batch = BallotBatch.from_ballots([
+            Ballot('1', [WRITE_IN, UNDERVOTE, Candidate('A'), WRITE_IN]),
+            Ballot('2', [UNDERVOTE, WRITE_IN, UNDERVOTE, UNDERVOTE, Candidate('A')]),
+        ], ChoiceEncoder())
+
+        self.assertEqual([
+            Ballot('1', [WRITE_IN, Candidate('A'), UNDERVOTE, UNDERVOTE]),
+            Ballot('2', [WRITE_IN, UNDERVOTE, UNDERVOTE, UNDERVOTE, UNDERVOTE]),
+        ], list(MaineNormalizer().normalize_batch(batch).to_ballots()))
+
+    def test_normalize_batch_matches_normalize(self):
+        # WRITE_IN is left out of the random ballots because per-ballot normalize() keeps a set of seen choices,
+        # and some versions of ranked_vote cannot hash the special choices.
+        rng = random.Random(1)
+        choices = [Candidate('A'), Candidate('B'), Candidate('C'), Candidate('D'), UNDERVOTE, UNDERVOTE, OVERVOTE]
+
+        for normalizer in [MaineNormalizer(), SanFranciscoNormalizer(), SantaFeNormalizer(), BurlingtonNormalizer()]:
+            for trial in range(200):
+                ballots = [Ballot(str(i), [rng.choice(choices) for _ in range(rng.randint(0, 7))])
+                           for i in range(rng.randint(1, 20))]
+                batch = normalizer.normalize_batch(BallotBatch.from_ballots(ballots, ChoiceEncoder()))
+
+                self.assertEqual([normalizer.normalize(ballot) for ballot in ballots], list(batch.to_ballots()),
+                                 '{} trial {}'.format(type(normalizer).__name__, trial))
@@ -0,0 +1,61 @@
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote_import import base_reader
+from ranked_vote_import.base_reader import Sha1Cache, get_file_sha1
+
+
+class TestBaseReader(TestCase):
+    def test_get_file_sha1(self):
+        data = bytes(range(256)) * 100
+
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'data.bin')
+            with open(filename, 'wb') as fh:
+                fh.write(data)
+
+            chunk_size = base_reader.HASH_CHUNK_SIZE
+            base_reader.HASH_CHUNK_SIZE = 1000
+            try:
+                self.assertEqual(hashlib.sha1(data).hexdigest(), get_file_sha1(filename))
+            finally:
+                base_reader.HASH_CHUNK_SIZE = chunk_size
+
+    def test_sha1_cache(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'data.bin')
+            cache_filename = os.path.join(tmp, 'sha1.json')
+            with open(filename, 'wb') as fh:
+                fh.write(b'ballots')
+
+            cache = Sha1Cache(cache_filename)
+            self.assertIsNone(cache.get(filename))
+            sha1 = get_file_sha1(filename, cache)
+            cache.save()
+
+            cache = Sha1Cache(cache_filename)
+            self.assertEqual(sha1, cache.get(filename))
+
+            # A changed size or mtime invalidates the cached digest.
+            with open(filename, 'wb') as fh:
+                fh.write(b'more ballots')
+            self.assertIsNone(cache.get(filename))
+            self.assertEqual(hashlib.sha1(b'more ballots').hexdigest(), get_file_sha1(filename, cache))
+
+    def test_hash_with_read(self):
+        from test.test_us_nm_saf import CVR_EXPORT, write_cvr_zip
+        from ranked_vote_import.formats.us.nm.saf import SantaFeImporter
+
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cvr.zip')
+            write_cvr_zip(filename, CVR_EXPORT)
+
+            # Readers only hash their input once they read it, and are done hashing when they are done reading.
+            reader = SantaFeImporter([filename], {'contest': 'Mayor'})
+            self.assertIsNone(reader._hash_thread)
+            self.assertEqual(3, len(list(reader)))
+            self.assertFalse(reader._hash_thread.is_alive())
+            sha1 = get_file_sha1(filename)
+        self.assertEqual([{'name': filename, 'sha1': sha1}], reader.files)
@@ -0,0 +1,39 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote_import.bin.import_rcv_batch import import_rcv_batch
+from test.test_us_nm_saf import write_cvr_zip, CVR_EXPORT
+
+
+class TestBatch(TestCase):
+    def test_import_batch(self):
+        with TemporaryDirectory() as tmp:
+            write_cvr_zip(os.path.join(tmp, 'cvr.zip'), CVR_EXPORT)
+            manifest = os.path.join(tmp, 'manifest.json')
+            with open(manifest, 'w') as fh:
+                json.dump([
+                    {'format': 'us_nm_saf', 'files': ['cvr.zip'], 'params': {'contest': 'Mayor'},
+                     'output': 'out/mayor.csv'},
+                    {'format': 'us_nm_saf', 'files': ['cvr.zip'], 'params': {'contest': 'Council'},
+                     'normalize': True, 'output': 'out/council.csv'},
+                    {'name': 'missing', 'format': 'us_nm_saf', 'files': ['missing.zip'], 'output': 'missing.csv'},
+                ], fh)
+
+            results = import_rcv_batch(manifest, jobs=2)
+            self.assertEqual(['imported', 'imported', 'failed'], [r['status'] for r in results])
+            self.assertEqual([3, 2], [r['num_ballots'] for r in results[:2]])
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'out', 'council.json')))
+
+            # Outputs that are up to date are skipped on the next run, unless an input changes.
+            self.assertEqual(['up_to_date', 'up_to_date', 'failed'],
+                             [r['status'] for r in import_rcv_batch(manifest, jobs=2)])
+            write_cvr_zip(os.path.join(tmp, 'cvr.zip'), CVR_EXPORT + '4,1,11,1,,,,,,,,,,,\n')
+            self.assertEqual(['imported', 'imported', 'failed'],
+                             [r['status'] for r in import_rcv_batch(manifest, jobs=2)])
+
+            with open(os.path.join(tmp, 'manifest.report.json')) as fh:
+                report = json.load(fh)
+            self.assertEqual(1, report['failed'])
+            self.assertIn('FileNotFoundError', report['jobs'][2]['error'])
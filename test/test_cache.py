@@ -0,0 +1,60 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote_import.cache import ImportCache
+
+
+class TestImportCache(TestCase):
+    def test_key(self):
+        key = ImportCache.key('us_me', ['abc'], {}, False, 'csv', 1)
+
+        self.assertEqual(key, ImportCache.key('us_me', ['abc'], {}, False, 'csv', 1))
+        self.assertNotEqual(key, ImportCache.key('us_me', ['abd'], {}, False, 'csv', 1))
+        self.assertNotEqual(key, ImportCache.key('us_me', ['abc'], {'contest': 1}, False, 'csv', 1))
+        self.assertNotEqual(key, ImportCache.key('us_me', ['abc'], {}, True, 'csv', 1))
+        self.assertNotEqual(key, ImportCache.key('us_me', ['abc'], {}, False, 'csv.gz', 1))
+        self.assertNotEqual(key, ImportCache.key('us_me', ['abc'], {}, False, 'csv', 2))
+
+    def test_store_and_restore(self):
+        with TemporaryDirectory() as tmp:
+            cache = ImportCache(os.path.join(tmp, 'cache'))
+            output = os.path.join(tmp, 'ballots.csv')
+            with open(output, 'w') as fh:
+                fh.write('ballot_id,rank,choice\n')
+
+            self.assertIsNone(cache.restore('a' * 40, output))
+            cache.store('a' * 40, output, {'num_ballots': 0})
+
+            restored = os.path.join(tmp, 'restored.csv')
+            self.assertEqual({'num_ballots': 0}, cache.restore('a' * 40, restored))
+            with open(restored) as fh:
+                self.assertEqual('ballot_id,rank,choice\n', fh.read())
+
+            # Storing the same key again replaces the entry, e.g. with one that has tallies.
+            with open(output, 'w') as fh:
+                fh.write('ballot_id,rank,choice\n1,1,A\n')
+            cache.store('a' * 40, output, {'num_ballots': 1, 'tallies': {}})
+            self.assertEqual({'num_ballots': 1, 'tallies': {}}, cache.restore('a' * 40, restored))
+            with open(restored) as fh:
+                self.assertEqual('ballot_id,rank,choice\n1,1,A\n', fh.read())
+            self.assertEqual(['a' * 40], os.listdir(os.path.join(tmp, 'cache', 'aa')))
+
+    def test_evict_least_recently_used(self):
+        with TemporaryDirectory() as tmp:
+            cache = ImportCache(os.path.join(tmp, 'cache'))
+            output = os.path.join(tmp, 'ballots.csv')
+            with open(output, 'w') as fh:
+                fh.write('x' * 1000)
+
+            for i, key in enumerate(['a' * 40, 'b' * 40, 'c' * 40]):
+                cache.store(key, output, {})
+                os.utime(os.path.join(tmp, 'cache', key[:2], key), (time.time() + i, time.time() + i))
+            cache.restore('a' * 40, os.path.join(tmp, 'restored.csv'))
+            os.utime(os.path.join(tmp, 'cache', 'aa', 'a' * 40), (time.time() + 10, time.time() + 10))
+
+            cache.evict(2500)
+            self.assertIsNotNone(cache.restore('a' * 40, os.path.join(tmp, 'restored.csv')))
+            self.assertIsNone(cache.restore('b' * 40, os.path.join(tmp, 'restored.csv')))
+            self.assertIsNotNone(cache.restore('c' * 40, os.path.join(tmp, 'restored.csv')))
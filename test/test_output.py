@@ -0,0 +1,51 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+
+from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE, WRITE_IN
+from ranked_vote.format import write_ballots
+from ranked_vote_import.output import BallotWriter, ColumnarBallotWriter, read_columnar_ballots
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+BALLOTS = [
+    Ballot('1', [Candidate('A'), Candidate('B'), UNDERVOTE]),
+    Ballot('2', [OVERVOTE, WRITE_IN]),
+    Ballot('3, "quoted"', [Candidate('C, Jr.')]),
+]
+
+
+class TestOutput(TestCase):
+    def test_ballot_writer_matches_write_ballots(self):
+        with TemporaryDirectory() as tmp:
+            expected = os.path.join(tmp, 'expected.csv')
+            actual = os.path.join(tmp, 'actual.csv')
+            write_ballots(expected, iter(BALLOTS))
+            with BallotWriter(actual) as writer:
+                for ballot in BALLOTS:
+                    writer.write(ballot)
+
+            with open(expected) as expected_fh, open(actual) as actual_fh:
+                self.assertEqual(expected_fh.read(), actual_fh.read())
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_columnar_round_trip(self):
+        metadata = {'num_ballots': 3, 'format': 'us_me'}
+
+        for extension in ['parquet', 'arrow']:
+            with TemporaryDirectory() as tmp:
+                filename = os.path.join(tmp, 'ballots.' + extension)
+                writer = ColumnarBallotWriter(filename)
+                writer.CHUNK_SIZE = 2
+                for ballot in BALLOTS:
+                    writer.write(ballot)
+                writer.close(metadata)
+                # The chunks spilled while writing are removed.
+                self.assertEqual(['ballots.' + extension], os.listdir(tmp))
+
+                ballots, read_metadata = read_columnar_ballots(filename)
+                self.assertEqual(BALLOTS, list(ballots))
+                self.assertEqual(metadata, read_metadata)
@@ -0,0 +1,48 @@
+import io
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote_import.bin.import_rcv_data import import_rcv_data
+from ranked_vote_import.pipeline import threaded, read_ahead
+from test.test_us_nm_saf import write_cvr_zip, CVR_EXPORT
+
+
+class TestPipeline(TestCase):
+    def test_threaded_keeps_order(self):
+        self.assertEqual(list(range(2500)), list(threaded(range(2500), chunk_size=100, depth=2)))
+
+    def test_threaded_raises(self):
+        def items():
+            yield 1
+            raise ValueError('bad ballot')
+
+        with self.assertRaises(ValueError):
+            list(threaded(items()))
+
+    def test_threaded_stops_early(self):
+        ballots = threaded(iter(range(10 ** 9)), chunk_size=10, depth=1)
+        self.assertEqual([0, 1, 2], [next(ballots) for _ in range(3)])
+        ballots.close()
+
+    def test_read_ahead(self):
+        data = b''.join(b'line %d\r\n' % i for i in range(10000))
+        with read_ahead(io.BytesIO(data), chunk_size=1000, depth=2) as fh:
+            self.assertEqual(b'line 0\r\n', fh.readline())
+            self.assertEqual(data[8:], fh.read())
+
+    def test_pipelined_import(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cvr.zip')
+            write_cvr_zip(filename, CVR_EXPORT)
+            serial, pipelined = os.path.join(tmp, 'serial.csv'), os.path.join(tmp, 'pipelined.csv')
+
+            import_rcv_data('us_nm_saf', [filename], serial, normalize=True, params={'contest': 'Mayor'})
+            import_rcv_data('us_nm_saf', [filename], pipelined, normalize=True, params={'contest': 'Mayor'},
+                            pipeline=True)
+
+            with open(serial) as serial_fh, open(pipelined) as pipelined_fh:
+                self.assertEqual(serial_fh.read(), pipelined_fh.read())
+            with open(os.path.join(tmp, 'serial.json')) as serial_fh, \
+                    open(os.path.join(tmp, 'pipelined.json')) as pipelined_fh:
+                self.assertEqual(serial_fh.read(), pipelined_fh.read())
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from ranked_vote_import.registry import LazyRegistry
+
+
+class TestRegistry(TestCase):
+    def test_lazy_lookup(self):
+        registry = LazyRegistry({'ordered': 'collections:OrderedDict', 'decoder': 'json.decoder:JSONDecoder'})
+
+        self.assertIn('ordered', registry)
+        self.assertNotIn('missing', registry)
+        self.assertEqual(['ordered', 'decoder'], list(registry))
+
+        from collections import OrderedDict
+        self.assertIs(OrderedDict, registry['ordered'])
+        self.assertEqual('ordered', registry.find_attribute('OrderedDict'))
+        with self.assertRaises(KeyError):
+            registry['missing']
+
+    def test_formats_import_on_lookup(self):
+        from ranked_vote_import import FORMATS, NORMALIZERS
+
+        self.assertEqual({'us_ca_sfo', 'us_me', 'us_nm_saf', 'us_vt_btv'}, set(FORMATS) & set(NORMALIZERS))
+        reader = FORMATS['us_vt_btv']
+        self.assertIn(reader.__module__, sys.modules)
+        self.assertEqual('us_vt_btv', reader.format_name)
+
+    def test_entry_points_without_importlib_metadata(self):
+        entry_point = SimpleNamespace(name='xx_abc', load=lambda: dict)
+        pkg_resources = SimpleNamespace(iter_entry_points=lambda group: [entry_point] if group == 'plugins' else [])
+        # Python < 3.8 without the importlib_metadata backport.
+        with patch.dict(sys.modules, {'importlib.metadata': None, 'importlib_metadata': None,
+                                      'pkg_resources': pkg_resources}):
+            registry = LazyRegistry({}, 'plugins')
+            self.assertEqual(['xx_abc'], list(registry))
+            self.assertIs(dict, registry['xx_abc'])
+
+    def test_compatible_names(self):
+        from ranked_vote_import import FORMATS, SantaFeImporter, SantaFeNormalizer
+
+        self.assertIs(FORMATS['us_nm_saf'], SantaFeImporter)
+        self.assertEqual('SantaFeNormalizer', SantaFeNormalizer.__name__)
+
+    def test_startup_leaves_out_numpy(self):
+        # Formats other than Maine only need numpy for batches, tallies, validation and columnar output.
+        script = ('import sys, ranked_vote_import.bin.import_rcv_data\n'
+                  'from ranked_vote_import import FORMATS, NORMALIZERS\n'
+                  'for name in ["us_ca_sfo", "us_nm_saf", "us_vt_btv"]: FORMATS[name], NORMALIZERS[name]\n'
+                  'print("numpy" in sys.modules)')
+        result = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, check=True)
+        self.assertEqual(b'False', result.stdout.strip())
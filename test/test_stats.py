@@ -0,0 +1,43 @@
+import io
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote_import.formats.us.nm.saf import SantaFeImporter
+from ranked_vote_import.stats import ImportStats
+from test.test_us_nm_saf import write_cvr_zip, CVR_EXPORT
+
+
+class TestStats(TestCase):
+    def test_nested_stages_are_exclusive(self):
+        stats = ImportStats()
+        with stats.stage('write'):
+            self.assertEqual([1, 2], list(stats.timed('read', [1, 2])))
+
+        stages = stats.to_dict()['stages']
+        self.assertEqual(3, stages['read']['calls'])
+        self.assertEqual(1, stages['write']['calls'])
+        self.assertGreaterEqual(stages['write']['wall_seconds'], 0)
+
+    def test_progress(self):
+        out = io.StringIO()
+        stats = ImportStats(progress_seconds=0, progress_fh=out)
+        stats.progress(20000)
+        self.assertIn('20,000 ballots', out.getvalue())
+        self.assertEqual(20000, stats.to_dict()['num_ballots'])
+
+    def test_reader_hooks(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cvr.zip')
+            write_cvr_zip(filename, CVR_EXPORT)
+
+            stats = ImportStats()
+            reader = SantaFeImporter([filename], {'contest': 'Mayor'}, hooks=[stats])
+            self.assertEqual(3, len(list(reader)))
+            reader.get_metadata()
+            stats.finish(reader.num_ballots, reader.input_file_bytes)
+
+            result = stats.to_dict()
+            self.assertEqual({'decompress', 'hash'}, set(result['stages']))
+            self.assertEqual(3, result['num_ballots'])
+            self.assertEqual(os.path.getsize(filename), result['input_file_bytes'])
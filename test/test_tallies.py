@@ -0,0 +1,88 @@
+import json
+import os
+import random
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE, WRITE_IN
+from ranked_vote_import.ballot_batch import BallotBatch, ChoiceEncoder
+from ranked_vote_import.bin.import_rcv_data import import_rcv_data
+from ranked_vote_import.tallies import Tallies
+from test.test_ballot_batch import BALLOTS
+from test.test_us_nm_saf import write_cvr_zip, CVR_EXPORT
+
+
+def preferences(ballot: Ballot) -> list:
+    ranked = list()
+    for choice in ballot.choices:
+        if choice is OVERVOTE:
+            break
+        if choice is not UNDERVOTE and str(choice) not in ranked:
+            ranked.append(str(choice))
+    return ranked
+
+
+class TestTallies(TestCase):
+    def test_tallies(self):
+        tallies = Tallies()
+        tallies.add_batch(BallotBatch.from_ballots(BALLOTS, ChoiceEncoder()))
+        result = tallies.to_dict(['A', 'B', 'C'])
+
+        self.assertEqual(4, result['num_ballots'])
+        self.assertEqual({'A': 1, '$OVERVOTE': 1, '$UNDERVOTE': 1}, result['first_choices'])
+        self.assertEqual({
+            'A': [1, 0, 1, 1],
+            'B': [0, 1, 0, 0],
+            'C': [0, 1, 0, 0],
+            '$WRITE_IN': [0, 1, 0, 0],
+            '$OVERVOTE': [1, 0, 0, 0],
+            '$UNDERVOTE': [1, 0, 1, 0],
+        }, result['rank_counts'])
+        self.assertEqual([2, 0, 2, 0, 0], result['ranked_candidates'])
+        self.assertEqual({
+            'A': {'B': 2, 'C': 1},
+            'B': {'A': 0, 'C': 1},
+            'C': {'A': 1, 'B': 1},
+        }, result['pairwise'])
+        self.assertEqual(1, result['overvotes'])
+        self.assertEqual(1, result['undervotes'])
+        self.assertEqual(4, result['exhaustible'])
+        self.assertEqual(0.25, result['overvote_rate'])
+
+    def test_matches_per_ballot_count(self):
+        rng = random.Random(1)
+        choices = [Candidate('A'), Candidate('B'), Candidate('C'), Candidate('D'), WRITE_IN, UNDERVOTE, OVERVOTE]
+        ballots = [Ballot(str(i), [rng.choice(choices) for _ in range(rng.randint(0, 6))]) for i in range(500)]
+
+        # Small batches, whose candidates and widths differ, then single ballots.
+        tallies = Tallies()
+        for start in range(0, 400, 7):
+            tallies.add_batch(BallotBatch.from_ballots(ballots[start:start + 7], ChoiceEncoder()))
+        for ballot in ballots[start + 7:]:
+            tallies.add(ballot)
+        result = tallies.to_dict()
+
+        names = ['A', 'B', 'C', 'D', '$WRITE_IN']
+        ranked = [preferences(ballot) for ballot in ballots]
+        for a in names:
+            for b in names:
+                if a != b:
+                    expected = sum(a in r and (b not in r or r.index(a) < r.index(b)) for r in ranked)
+                    self.assertEqual(expected, result['pairwise'][a][b], '{} over {}'.format(a, b))
+        self.assertEqual(sum(any(c is OVERVOTE for c in ballot.choices) for ballot in ballots), result['overvotes'])
+        self.assertEqual(sum(len(r) < len(names) for r in ranked), result['exhaustible'])
+
+    def test_import_tallies(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cvr.zip')
+            write_cvr_zip(filename, CVR_EXPORT)
+            output = os.path.join(tmp, 'out.csv')
+
+            for batch_size in [None, 2]:
+                import_rcv_data('us_nm_saf', [filename], output, normalize=True, params={'contest': 'Mayor'},
+                                batch_size=batch_size, tallies=True)
+                with open(os.path.join(tmp, 'out.json')) as meta_fh:
+                    metadata = json.load(meta_fh)
+
+                self.assertEqual(3, metadata['tallies']['num_ballots'])
+                self.assertEqual(set(metadata['candidate_ids']), set(metadata['tallies']['pairwise']))
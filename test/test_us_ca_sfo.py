@@ -0,0 +1,208 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE
+from ranked_vote_import import FORMATS
+from ranked_vote_import.formats.us.ca import sfo
+from ranked_vote_import.formats.us.ca.sfo import SanFranciscoImporter, SanFranciscoNormalizer
+
+
+def ballot_image_line(contest_id, pref_voter_id, vote_rank, candidate_id, over_vote=0, under_vote=0):
+    return '{:07d}{:09d}{:07d}{:03d}{:07d}{:03d}{:07d}{:d}{:d}\n'.format(
+        contest_id, pref_voter_id, 1, 1, 100, vote_rank, candidate_id, over_vote, under_vote)
+
+
+BALLOT_IMAGE = ''.join([
+    ballot_image_line(1, 1, 1, 11),
+    ballot_image_line(1, 1, 2, 12),
+    ballot_image_line(1, 2, 1, 0, over_vote=1),
+    ballot_image_line(1, 2, 2, 0, under_vote=1),
+    ballot_image_line(2, 1, 1, 21),
+    ballot_image_line(2, 2, 1, 22),
+    ballot_image_line(1, 3, 1, 12),
+])
+
+
+def master_lookup_line(record_type, record_id, description, contest_id=0):
+    return '{:<10}{:07d}{:<50}{:07d}{:07d}00\n'.format(record_type, record_id, description, 1, contest_id)
+
+
+MASTER_LOOKUP = ''.join([
+    master_lookup_line('Contest', 1, 'Mayor'),
+    master_lookup_line('Contest', 2, 'Sheriff'),
+    master_lookup_line('Candidate', 11, 'A', 1),
+    master_lookup_line('Candidate', 12, 'B', 1),
+    master_lookup_line('Candidate', 21, 'C', 2),
+    master_lookup_line('Candidate', 22, 'D', 2),
+])
+
+
+def make_importer(ballot_image_file, params, hooks=None):
+    """Return a reader of the ballot image, with a master lookup of the contests and candidates in BALLOT_IMAGE
+    written next to it."""
+    master_lookup_file = os.path.join(os.path.dirname(ballot_image_file), 'master.txt')
+    with open(master_lookup_file, 'w') as fh:
+        fh.write(MASTER_LOOKUP)
+    return FORMATS['us_ca_sfo']([master_lookup_file, ballot_image_file], params, hooks=hooks)
+
+
+class TestUSCASFO(TestCase):
+    def test_normalize_skip_undervote(self):
+        normalizer = SanFranciscoNormalizer()
+
+        self.assertEqual(
+            Ballot('1', [Candidate('A'), OVERVOTE, UNDERVOTE, UNDERVOTE]),
+            normalizer.normalize(Ballot('1', [UNDERVOTE, Candidate('A'), OVERVOTE, Candidate('B')]))
+        )
+
+    def test_iter_lines_across_chunks(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'ballots.txt')
+            with open(filename, 'w') as fh:
+                fh.write(BALLOT_IMAGE)
+
+            chunk_size = sfo.READ_CHUNK_SIZE
+            sfo.READ_CHUNK_SIZE = 10
+            try:
+                with open(filename, 'rb') as fh:
+                    self.assertEqual(BALLOT_IMAGE.encode().splitlines(), list(sfo.iter_lines(fh)))
+                    self.assertEqual(BALLOT_IMAGE.encode().splitlines()[1:3], list(sfo.iter_lines(fh, 46, 138)))
+            finally:
+                sfo.READ_CHUNK_SIZE = chunk_size
+
+    def test_read_contest(self):
+        expected = [
+            Ballot('1', [Candidate('A'), Candidate('B')]),
+            Ballot('2', [OVERVOTE, UNDERVOTE]),
+            Ballot('3', [Candidate('B')]),
+        ]
+
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'ballots.txt')
+            with open(filename, 'w') as fh:
+                fh.write(BALLOT_IMAGE)
+
+            importer = make_importer(filename, {'contest': 1, 'index': True})
+            self.assertEqual(expected, list(importer))
+            self.assertEqual({1: [(0, 184), (276, 322)], 2: [(184, 276)]}, sfo.read_contest_index(filename))
+
+            # The second read only visits the byte ranges recorded in the index.
+            importer = make_importer(filename, {'contest': 1, 'index': True})
+            self.assertEqual(expected, list(importer))
+
+            importer = make_importer(filename, {'contest': 2, 'index': True})
+            self.assertEqual([
+                Ballot('1', [Candidate('C')]),
+                Ballot('2', [Candidate('D')]),
+            ], list(importer))
+
+    def test_read_partitions(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'ballots.txt')
+            with open(filename, 'w') as fh:
+                fh.write(BALLOT_IMAGE)
+
+            partitions = sfo.split_at_ballots(filename, [(0, len(BALLOT_IMAGE))], 50)
+            self.assertEqual([(0, 184), (184, 322)], partitions)
+
+            importer = make_importer(filename, {'contest': 1})
+            self.assertEqual(
+                list(importer),
+                [ballot for partition in partitions for ballot in importer.read_partition(partition)])
+
+    def test_continue_after_position(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'ballots.txt')
+            with open(filename, 'w') as fh:
+                fh.write(BALLOT_IMAGE[:184])
+
+            importer = make_importer(filename, {'contest': 1})
+            importer.track_checkpoints = True
+            self.assertEqual([
+                Ballot('1', [Candidate('A'), Candidate('B')]),
+                Ballot('2', [OVERVOTE, UNDERVOTE]),
+            ], list(importer))
+            # The last ballot's records may continue in a later drop, so the position is at its start.
+            position = importer.get_position()
+            self.assertEqual(92, position['offset'])
+            self.assertEqual(1, importer.ballots_past_position)
+
+            # A later drop appends to the ballot image; only the last ballot read and the new ones are read.
+            with open(filename, 'w') as fh:
+                fh.write(BALLOT_IMAGE)
+            importer = make_importer(filename, {'contest': 1})
+            self.assertTrue(importer.seek_position(position))
+            self.assertEqual([
+                Ballot('2', [OVERVOTE, UNDERVOTE]),
+                Ballot('3', [Candidate('B')]),
+            ], list(importer))
+
+            # Any change to the records already read means starting over.
+            with open(filename, 'w') as fh:
+                fh.write(BALLOT_IMAGE.replace(ballot_image_line(1, 1, 2, 12), ballot_image_line(1, 1, 2, 11)))
+            importer = make_importer(filename, {'contest': 1})
+            self.assertFalse(importer.seek_position(position))
+
+    def test_continue_after_cut_off_drop(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'ballots.txt')
+            # Drops cut off between the records of a ballot, and part way through one.
+            for cut, cut_off_record in [(46, False), (60, True)]:
+                with open(filename, 'w') as fh:
+                    fh.write(BALLOT_IMAGE[:cut])
+                importer = make_importer(filename, {'contest': 1})
+                if cut_off_record:
+                    # Outside a checkpointed read, a cut-off record is an error rather than the end of the input.
+                    with self.assertRaises(ValueError):
+                        list(importer)
+                    importer = make_importer(filename, {'contest': 1})
+                importer.track_checkpoints = True
+                self.assertEqual([Ballot('1', [Candidate('A')])], list(importer))
+                position = importer.get_position()
+                self.assertEqual(0, position['offset'])
+
+                with open(filename, 'w') as fh:
+                    fh.write(BALLOT_IMAGE)
+                importer = make_importer(filename, {'contest': 1})
+                self.assertTrue(importer.seek_position(position))
+                self.assertEqual([
+                    Ballot('1', [Candidate('A'), Candidate('B')]),
+                    Ballot('2', [OVERVOTE, UNDERVOTE]),
+                    Ballot('3', [Candidate('B')]),
+                ], list(importer))
+
+    def test_resolve_write_in(self):
+        importer = SanFranciscoImporter.__new__(SanFranciscoImporter)
+        created = list()
+        importer.new_candidate = lambda raw, name: created.append(raw) or Candidate(raw)
+
+        qualified = importer.resolve_candidate('JANE DOE')
+        # A write-in of the same name is a different candidate.
+        write_in = importer.resolve_candidate('WRITE-IN - JANE DOE')
+        self.assertIsNot(qualified, write_in)
+        self.assertIs(qualified, importer.resolve_candidate('Jane Doe'))
+        self.assertIs(write_in, importer.resolve_candidate('WRITE-IN - Jane Doe'))
+        self.assertEqual(['JANE DOE', 'WRITE-IN - JANE DOE'], created)
+
+    def test_random_access(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'ballots.txt')
+            with open(filename, 'w') as fh:
+                fh.write(BALLOT_IMAGE)
+
+            importer = make_importer(filename, {'contest': 1})
+            self.assertEqual(Ballot('2', [OVERVOTE, UNDERVOTE]), importer.ballot(2))
+            self.assertEqual(Ballot('1', [Candidate('C')]), importer.ballot(1, contest=2))
+            self.assertIsNone(importer.ballot(4))
+            self.assertEqual(list(importer), list(importer.ballots_in_precinct(100)))
+            self.assertEqual([], list(importer.ballots_in_precinct(101)))
+            self.assertTrue(os.path.exists(sfo.voter_index_filename(filename)))
+
+            # Later readers load the saved index, which is rebuilt once the ballot image changes.
+            self.assertEqual([1, 1, 1, 2, 2], sfo.read_voter_index(filename)['contest_id'].tolist())
+            with open(filename, 'a') as fh:
+                fh.write(ballot_image_line(1, 4, 1, 11))
+            self.assertIsNone(sfo.read_voter_index(filename))
+            importer = make_importer(filename, {'contest': 1})
+            self.assertEqual(Ballot('4', [Candidate('A')]), importer.ballot(4))
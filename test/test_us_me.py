@@ -1,7 +1,31 @@
+import json
+import os
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
-from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE
-from ranked_vote_import.formats.us.me import MaineNormalizer
+import pandas as pd
+
+from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE, WRITE_IN
+from ranked_vote_import.ballot_batch import ChoiceEncoder
+from ranked_vote_import.bin.import_rcv_data import import_rcv_data
+from ranked_vote_import.formats.us.me import MaineNormalizer, MaineImporter
+from ranked_vote_import.output import BallotWriter
+
+
+def write_batch(filename, first_id, choices):
+    pd.DataFrame({
+        'Cast Vote Record': [first_id + j for j in range(len(choices))],
+        'Rep. to Congress 1st Choice': [c[0] for c in choices],
+        'Rep. to Congress 2nd Choice': [c[1] for c in choices],
+    }).to_excel(filename, index=False)
+
+
+BATCHES = [
+    [['REP Poliquin, Bruce (4725)', 'undervote'], ['overvote', 'Write-in']],
+    [['DEM Golden, Jared F. (5931)', 'Bond, Tiffany L.']],
+    [['Bond, Tiffany L.', 'REP Poliquin, Bruce (4725)'], ['undervote', 'undervote']],
+]
 
 
 class TestUSME(TestCase):
@@ -46,3 +70,158 @@ class TestUSME(TestCase):
                 Candidate('C'),
                 Candidate('B')]))
         )
+
+    def test_read_ballots_from_frame(self):
+        data = pd.DataFrame({
+            'Cast Vote Record': [1, 2, 3],
+            'Precinct': ['Auburn', 'Auburn', 'Bangor'],
+            'Rep. to Congress 1st Choice': ['DEM Golden, Jared F. (5931)', 'overvote', 'REP Poliquin, Bruce (4725)'],
+            'Rep. to Congress 2nd Choice': ['REP Poliquin, Bruce (4725)', 'undervote', 'Write-in'],
+            'Rep. to Congress 3rd Choice': ['undervote', 'Bond, Tiffany L.', 'Bond, Tiffany L.'],
+        })
+        importer = MaineImporter.__new__(MaineImporter)
+        importer._candidates = dict()
+
+        self.assertEqual([
+            Ballot('1', [Candidate('Jared F. Golden'), Candidate('Bruce Poliquin'), UNDERVOTE]),
+            Ballot('2', [OVERVOTE, UNDERVOTE, Candidate('Tiffany L. Bond')]),
+            Ballot('3', [Candidate('Bruce Poliquin'), WRITE_IN, Candidate('Tiffany L. Bond')]),
+        ], list(importer._ballots_from_frame(data)))
+
+        self.assertEqual(['Jared F. Golden', 'Bruce Poliquin', 'Tiffany L. Bond'],
+                         [str(c) for c in importer.candidates])
+
+    def test_read_parallel(self):
+        with TemporaryDirectory() as tmp:
+            files = list()
+            for i, choices in enumerate([
+                [['REP Poliquin, Bruce (4725)', 'undervote'], ['overvote', 'Write-in']],
+                [['DEM Golden, Jared F. (5931)', 'Bond, Tiffany L.']],
+                [['Bond, Tiffany L.', 'REP Poliquin, Bruce (4725)'], ['undervote', 'undervote']],
+            ]):
+                filename = os.path.join(tmp, 'batch{}.xlsx'.format(i))
+                pd.DataFrame({
+                    'Cast Vote Record': [10 * i + j for j in range(len(choices))],
+                    'Rep. to Congress 1st Choice': [c[0] for c in choices],
+                    'Rep. to Congress 2nd Choice': [c[1] for c in choices],
+                }).to_excel(filename, index=False)
+                files.append(filename)
+
+            serial = MaineImporter(files, {})
+            serial_ballots = list(serial)
+            parallel = MaineImporter(files, {}, jobs=2)
+            parallel_ballots = list(parallel)
+
+        self.assertEqual(serial_ballots, parallel_ballots)
+        self.assertEqual(serial.get_metadata(), parallel.get_metadata())
+        self.assertEqual(['Bruce Poliquin', 'Jared F. Golden', 'Tiffany L. Bond'],
+                         parallel.get_metadata()['candidate_ids'])
+
+    def test_read_batches_from_frame(self):
+        data = pd.DataFrame({
+            'Cast Vote Record': [1, 2, 3],
+            'Rep. to Congress 1st Choice': ['DEM Golden, Jared F. (5931)', 'overvote', 'REP Poliquin, Bruce (4725)'],
+            'Rep. to Congress 2nd Choice': ['REP Poliquin, Bruce (4725)', 'undervote', 'Write-in'],
+        })
+        importer = MaineImporter.__new__(MaineImporter)
+        importer._candidates = dict()
+        importer._encoder = ChoiceEncoder()
+
+        batches = list(importer._batches_from_frame(data, 2))
+        self.assertEqual([2, 1], [len(batch) for batch in batches])
+        self.assertEqual([
+            Ballot('1', [Candidate('Jared F. Golden'), Candidate('Bruce Poliquin')]),
+            Ballot('2', [OVERVOTE, UNDERVOTE]),
+            Ballot('3', [Candidate('Bruce Poliquin'), WRITE_IN]),
+        ], [ballot for batch in batches for ballot in batch.to_ballots()])
+
+    def test_read_streaming(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'ballots.xlsx')
+            pd.DataFrame({
+                'Cast Vote Record': [1, 2, 3],
+                'Precinct': ['Auburn', 'Auburn', 'Bangor'],
+                'Rep. to Congress 1st Choice': ['DEM Golden, Jared F. (5931)', 'overvote', 'Bond, Tiffany L.'],
+                'Rep. to Congress 2nd Choice': ['REP Poliquin, Bruce (4725)', 'undervote', 'Write-in'],
+            }).to_excel(filename, index=False)
+
+            in_memory = MaineImporter([filename], {})
+            in_memory_ballots = list(in_memory)
+            streaming = MaineImporter([filename], {'streaming': True})
+            streaming_ballots = list(streaming)
+
+        self.assertEqual(in_memory_ballots, streaming_ballots)
+        self.assertEqual(in_memory.get_metadata()['candidate_ids'], streaming.get_metadata()['candidate_ids'])
+
+    def test_streaming_without_openpyxl(self):
+        with patch.dict('sys.modules', {'openpyxl': None}), self.assertRaisesRegex(ImportError, r'\[streaming\]'):
+            MaineImporter(['ballots.xlsx'], {'streaming': True})
+
+    def test_resolve_candidate_once(self):
+        importer = MaineImporter.__new__(MaineImporter)
+        importer._candidates = dict()
+        canonicalized = list()
+        fix_string = MaineImporter.fix_string
+        importer.canonical_candidate_name = lambda raw: canonicalized.append(raw) or fix_string(raw)
+
+        golden = importer.parse_ballot('DEM Golden, Jared F. (5931)')
+        self.assertIs(golden, importer.parse_ballot('DEM Golden, Jared F. (5931)'))
+        # The same candidate, written differently in another file.
+        self.assertIs(golden, importer.parse_ballot('Golden, Jared F.'))
+        self.assertEqual(['DEM Golden, Jared F. (5931)', 'Golden, Jared F.'], canonicalized)
+        self.assertEqual(['Jared F. Golden'], [str(c) for c in importer.candidates])
+
+    def test_incremental_import(self):
+        with TemporaryDirectory() as tmp:
+            files = [os.path.join(tmp, 'batch{}.xlsx'.format(i)) for i in range(len(BATCHES))]
+            for i, (filename, choices) in enumerate(zip(files, BATCHES)):
+                write_batch(filename, 10 * i, choices)
+            output = os.path.join(tmp, 'ballots.csv')
+            expected = os.path.join(tmp, 'expected.csv')
+            import_rcv_data('us_me', files, expected, params={})
+
+            # Each drop adds a file; the ballots already imported are read again only from the last file.
+            for num_files in [1, 2, 3]:
+                import_rcv_data('us_me', files[:num_files], output, params={}, incremental=True)
+            with open(output) as fh, open(expected) as expected_fh:
+                self.assertEqual(expected_fh.read(), fh.read())
+            with open(os.path.join(tmp, 'ballots.json')) as fh, \
+                    open(os.path.join(tmp, 'expected.json')) as expected_fh:
+                metadata, expected_metadata = json.load(fh), json.load(expected_fh)
+            self.assertEqual(expected_metadata['candidate_ids'], metadata['candidate_ids'])
+            with open(os.path.join(tmp, 'ballots.checkpoint.json')) as fh:
+                position = json.load(fh)['reader']['position']
+            self.assertEqual((2, 2), (position['file'], position['row']))
+
+            # A file rewritten with other ballots is imported in full.
+            write_batch(files[2], 20, BATCHES[0] + BATCHES[1])
+            import_rcv_data('us_me', files, expected, params={})
+            import_rcv_data('us_me', files, output, params={}, incremental=True)
+            with open(output) as fh, open(expected) as expected_fh:
+                self.assertEqual(expected_fh.read(), fh.read())
+
+    def test_resume_import(self):
+        with TemporaryDirectory() as tmp:
+            files = [os.path.join(tmp, 'batch{}.xlsx'.format(i)) for i in range(len(BATCHES))]
+            for i, (filename, choices) in enumerate(zip(files, BATCHES)):
+                write_batch(filename, 10 * i, choices)
+            output = os.path.join(tmp, 'ballots.csv')
+            expected = os.path.join(tmp, 'expected.csv')
+            import_rcv_data('us_me', files, expected, params={})
+
+            # The import is killed part way through the last file, past the checkpoint taken in the middle of it.
+            write = BallotWriter.write
+
+            def write_then_fail(ballot_writer, ballot):
+                write(ballot_writer, ballot)
+                if ballot.ballot_id == '21':
+                    raise KeyboardInterrupt
+
+            with patch.object(BallotWriter, 'write', write_then_fail), self.assertRaises(KeyboardInterrupt):
+                import_rcv_data('us_me', files, output, params={}, resume=True, checkpoint_interval=4)
+            with open(os.path.join(tmp, 'ballots.csv.partial.checkpoint.json')) as fh:
+                self.assertEqual(4, json.load(fh)['reader']['num_ballots'])
+
+            import_rcv_data('us_me', files, output, params={}, resume=True, checkpoint_interval=4)
+            with open(output) as fh, open(expected) as expected_fh:
+                self.assertEqual(expected_fh.read(), fh.read())
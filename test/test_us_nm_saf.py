@@ -0,0 +1,221 @@
+import json
+import os
+import zipfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE
+from ranked_vote.format import read_ballots
+from ranked_vote_import.bin.import_rcv_data import import_rcv_data
+from ranked_vote_import.output import BallotWriter
+from ranked_vote_import.formats.us.nm.saf import SantaFeImporter
+
+CONTEST_MANIFEST = '''Description,Id,ExternalId,VoteFor,NumOfRanks
+Mayor,1,,1,2
+Council,2,,1,1
+'''
+
+CANDIDATE_MANIFEST = '''Description,Id,ExternalId,ContestId,Type
+Alan,11,,1,Regular
+Ron,12,,1,Regular
+JoAnne,13,,1,Regular
+Signe,21,,2,Regular
+Renee,22,,2,Regular
+'''
+
+
+def cvr_export(rows):
+    header = ['RecordId']
+    for contest in range(2):
+        header.append('Original/Cards/0/Contests/{}/Id'.format(contest))
+        for mark in range(3):
+            header.append('Original/Cards/0/Contests/{}/Marks/{}/CandidateId'.format(contest, mark))
+            header.append('Original/Cards/0/Contests/{}/Marks/{}/Rank'.format(contest, mark))
+    return '\n'.join(','.join(row) for row in [header] + rows) + '\n'
+
+
+CVR_ROWS = [
+    ['1', '1', '11', '1', '12', '2', '', '', '2', '21', '1', '', '', '', ''],
+    ['2', '2', '22', '1', '', '', '', '', '1', '12', '1', '13', '1', '', ''],
+    ['3', '1', '13', '2', '', '', '', '', '', '', '', '', '', '', ''],
+]
+
+CVR_EXPORT = cvr_export(CVR_ROWS)
+
+
+def write_cvr_zip(filename, cvr_export_text, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(filename, 'w', compression) as zf:
+        zf.writestr('csvFiles/ContestManifest.csv', CONTEST_MANIFEST)
+        zf.writestr('csvFiles/CandidateManifest.csv', CANDIDATE_MANIFEST)
+        zf.writestr('csvFiles/CvrExport.csv', cvr_export_text)
+
+
+class TestUSNMSAF(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'cvr.zip')
+        write_cvr_zip(self.filename, CVR_EXPORT)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read_contest(self):
+        reader = SantaFeImporter([self.filename], {'contest': 'Mayor'})
+
+        self.assertEqual([
+            Ballot('1', [Candidate('Alan'), Candidate('Ron'), UNDERVOTE]),
+            Ballot('2', [OVERVOTE, UNDERVOTE, UNDERVOTE]),
+            Ballot('3', [UNDERVOTE, Candidate('JoAnne'), UNDERVOTE]),
+        ], list(reader))
+        self.assertEqual(3, reader.get_metadata()['num_ballots'])
+        self.assertEqual(['Alan', 'Ron', 'JoAnne'], reader.get_metadata()['candidate_ids'])
+
+    def test_read_compressed(self):
+        expected = list(SantaFeImporter([self.filename], {'contest': 'Mayor'}))
+        for compression in [zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2]:
+            write_cvr_zip(self.filename, CVR_EXPORT, compression)
+            self.assertEqual(expected, list(SantaFeImporter([self.filename], {'contest': 'Mayor'})))
+
+    def test_read_contests(self):
+        reader = SantaFeImporter([self.filename], {'contests': ['Mayor', 'Council']})
+
+        self.assertEqual([
+            ('Mayor', Ballot('1', [Candidate('Alan'), Candidate('Ron'), UNDERVOTE])),
+            ('Council', Ballot('1', [Candidate('Signe'), UNDERVOTE])),
+            ('Council', Ballot('2', [Candidate('Renee'), UNDERVOTE])),
+            ('Mayor', Ballot('2', [OVERVOTE, UNDERVOTE, UNDERVOTE])),
+            ('Mayor', Ballot('3', [UNDERVOTE, Candidate('JoAnne'), UNDERVOTE])),
+        ], list(reader.iter_contests()))
+
+        self.assertEqual(3, reader.get_contest_metadata('Mayor')['num_ballots'])
+        self.assertEqual(['Signe', 'Renee'], reader.get_contest_metadata('Council')['candidate_ids'])
+
+    def test_import_contests_options(self):
+        output = os.path.join(self.tmp.name, '{contest}.csv')
+        for options in [{'jobs': 2}, {'batch_size': 10}, {'pipeline': True},
+                        {'cache_dir': os.path.join(self.tmp.name, 'cache')}]:
+            with self.assertRaises(ValueError):
+                import_rcv_data('us_nm_saf', [self.filename], output, contests=['Mayor', 'Council'], **options)
+
+    def test_checkpoint_options(self):
+        output = os.path.join(self.tmp.name, 'ballots.csv')
+        for options in [{'incremental': True, 'resume': True}, {'incremental': True, 'tallies': True},
+                        {'resume': True, 'tallies': True}, {'resume': True, 'output_format': 'parquet'}]:
+            with self.assertRaises(ValueError):
+                import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, **options)
+        with self.assertRaises(ValueError):
+            import_rcv_data('us_nm_saf', [self.filename], output + '.gz', params={'contest': 'Mayor'}, resume=True)
+        self.assertEqual(['cvr.zip'], os.listdir(self.tmp.name))
+
+    def test_incremental_import(self):
+        output = os.path.join(self.tmp.name, 'ballots.csv')
+        expected = os.path.join(self.tmp.name, 'expected.csv')
+        import_rcv_data('us_nm_saf', [self.filename], expected, params={'contest': 'Mayor'})
+
+        write_cvr_zip(self.filename, cvr_export(CVR_ROWS[:2]))
+        import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, incremental=True)
+        with open(os.path.join(self.tmp.name, 'ballots.checkpoint.json')) as fh:
+            self.assertEqual(2, json.load(fh)['reader']['num_ballots'])
+
+        # The next drop only adds a row, which is appended to the output.
+        write_cvr_zip(self.filename, CVR_EXPORT)
+        import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, incremental=True)
+        with open(output) as fh, open(expected) as expected_fh:
+            self.assertEqual(expected_fh.read(), fh.read())
+        with open(os.path.join(self.tmp.name, 'ballots.json')) as fh:
+            self.assertEqual(3, json.load(fh)['num_ballots'])
+
+        # A drop that rewrites earlier rows is imported in full.
+        rows = [CVR_ROWS[0], CVR_ROWS[2]]
+        write_cvr_zip(self.filename, cvr_export(rows))
+        import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, incremental=True)
+        self.assertEqual(['1', '3'], [b.ballot_id for b in read_ballots(output)])
+
+    def test_incremental_import_after_cut_off_drop(self):
+        output = os.path.join(self.tmp.name, 'ballots.csv')
+        expected = os.path.join(self.tmp.name, 'expected.csv')
+        import_rcv_data('us_nm_saf', [self.filename], expected, params={'contest': 'Mayor'})
+
+        # Drops cut off part way through the last row, and just before its line terminator.
+        last_row = CVR_EXPORT.rindex('\n', 0, -1) + 1
+        for cut in [last_row + 10, len(CVR_EXPORT) - 1]:
+            if os.path.exists(output):
+                os.remove(output)
+            write_cvr_zip(self.filename, CVR_EXPORT[:cut])
+            import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, incremental=True)
+            with open(os.path.join(self.tmp.name, 'ballots.checkpoint.json')) as fh:
+                self.assertEqual(2, json.load(fh)['reader']['num_ballots'])
+
+            write_cvr_zip(self.filename, CVR_EXPORT)
+            import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, incremental=True)
+            with open(output) as fh, open(expected) as expected_fh:
+                self.assertEqual(expected_fh.read(), fh.read())
+
+    def test_resume_import(self):
+        output = os.path.join(self.tmp.name, 'ballots.csv')
+        expected = os.path.join(self.tmp.name, 'expected.csv')
+        import_rcv_data('us_nm_saf', [self.filename], expected, params={'contest': 'Mayor'})
+
+        # The import is killed just after writing the third ballot, past the checkpoint taken after the second.
+        write = BallotWriter.write
+
+        def write_then_fail(ballot_writer, ballot):
+            write(ballot_writer, ballot)
+            if ballot.ballot_id == '3':
+                raise KeyboardInterrupt
+
+        with patch.object(BallotWriter, 'write', write_then_fail), self.assertRaises(KeyboardInterrupt):
+            import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, resume=True,
+                            checkpoint_interval=2)
+        self.assertFalse(os.path.exists(output))
+        with open(os.path.join(self.tmp.name, 'ballots.csv.partial.checkpoint.json')) as fh:
+            self.assertEqual(2, json.load(fh)['reader']['num_ballots'])
+
+        import_rcv_data('us_nm_saf', [self.filename], output, params={'contest': 'Mayor'}, resume=True,
+                        checkpoint_interval=2)
+        with open(output) as fh, open(expected) as expected_fh:
+            self.assertEqual(expected_fh.read(), fh.read())
+        with open(os.path.join(self.tmp.name, 'ballots.json')) as fh, \
+                open(os.path.join(self.tmp.name, 'expected.json')) as expected_fh:
+            self.assertEqual(expected_fh.read(), fh.read())
+        self.assertEqual(['ballots.csv', 'ballots.json', 'cvr.zip', 'expected.csv', 'expected.json'],
+                         sorted(os.listdir(self.tmp.name)))
+
+    def test_read_reordered_columns(self):
+        expected = list(SantaFeImporter([self.filename], {'contest': 'Mayor'}))
+
+        # Columns are found by name, wherever they are and whatever else the export holds.
+        rows = [row.split(',') for row in CVR_EXPORT.splitlines()]
+        order = list(reversed(range(len(rows[0]))))
+        reordered = [['CvrNumber'] + [row[i] for i in order] for row in rows[:1]]
+        reordered += [[str(n)] + [row[i] for i in order] for n, row in enumerate(rows[1:])]
+        write_cvr_zip(self.filename, '\n'.join(','.join(row) for row in reordered) + '\n')
+        self.assertEqual(expected, list(SantaFeImporter([self.filename], {'contest': 'Mayor'})))
+
+    def test_read_multiple_cards(self):
+        header = ['RecordId']
+        for card in range(2):
+            header.append('Original/Cards/{}/Contests/0/Id'.format(card))
+            for mark in range(2):
+                header.append('Original/Cards/{}/Contests/0/Marks/{}/CandidateId'.format(card, mark))
+                header.append('Original/Cards/{}/Contests/0/Marks/{}/Rank'.format(card, mark))
+        rows = [
+            ['1', '1', '11', '1', '', '', '', '', '', '', ''],
+            # The contest can be on any card.
+            ['2', '2', '21', '1', '', '', '1', '13', '1', '12', '2'],
+            ['3', '', '', '', '', '', '1', '12', '1', '', ''],
+        ]
+        write_cvr_zip(self.filename, '\n'.join(','.join(row) for row in [header] + rows) + '\n')
+
+        self.assertEqual([
+            Ballot('1', [Candidate('Alan'), UNDERVOTE, UNDERVOTE]),
+            Ballot('2', [Candidate('JoAnne'), Candidate('Ron'), UNDERVOTE]),
+            Ballot('3', [Candidate('Ron'), UNDERVOTE, UNDERVOTE]),
+        ], list(SantaFeImporter([self.filename], {'contest': 'Mayor'})))
+
+    def test_index_columns(self):
+        header = ['RecordId', 'Original/Cards/1/Contests/0/Id', 'Original/Cards/0/Contests/1/Id',
+                  'Original/Cards/0/Contests/1/Marks/0/CandidateId', 'Original/Cards/0/Contests/1/Marks/0/Rank',
+                  'Original/Cards/0/Contests/0/Id']
+        self.assertEqual((0, [(5, []), (2, [(3, 4)]), (1, [])]), SantaFeImporter.index_columns(header))
@@ -0,0 +1,98 @@
+import json
+import os
+import zipfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from ranked_vote.ballot import Ballot, Candidate, OVERVOTE
+from ranked_vote_import.bin.import_rcv_data import import_rcv_data
+from ranked_vote_import.formats.us.vt.btv import BurlingtonImporter
+from ranked_vote_import.output import BallotWriter
+
+REPORT = '\r\n'.join([
+    '.ELECTION "Mayor"',
+    '.CANDIDATE C01, "Kurt Wright"',
+    '.CANDIDATE C02, "Bob Kiss"',
+    '.CANDIDATE C03, "Andy Montroll"',
+    '.FINAL-PILE',
+    '0001, 1) C02,C01',
+    '0002, 1) C03',
+    '',
+    '0003, 1) C01=C02,C03',
+])
+
+
+def write_report_zip(filename, report):
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('Mayor.txt', report)
+
+
+class TestUSVTBTV(TestCase):
+    def test_read_ballots(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'btv.zip')
+            with zipfile.ZipFile(filename, 'w') as zf:
+                zf.writestr('Mayor.txt', REPORT)
+
+            reader = BurlingtonImporter([filename], {'report_path': 'Mayor.txt'})
+
+            self.assertEqual([
+                Ballot('0001', [Candidate('Bob Kiss'), Candidate('Kurt Wright')]),
+                Ballot('0002', [Candidate('Andy Montroll')]),
+                Ballot('0003', [OVERVOTE, Candidate('Andy Montroll')]),
+            ], list(reader))
+            self.assertEqual(['Kurt Wright', 'Bob Kiss', 'Andy Montroll'], reader.get_metadata()['candidate_ids'])
+
+    def test_incremental_import(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'btv.zip')
+            output = os.path.join(tmp, 'ballots.csv')
+            expected = os.path.join(tmp, 'expected.csv')
+            params = {'report_path': 'Mayor.txt'}
+            write_report_zip(filename, REPORT)
+            import_rcv_data('us_vt_btv', [filename], expected, params=params)
+
+            # A drop cut off part way through the second ballot; the last line of the report has no terminator.
+            write_report_zip(filename, REPORT[:REPORT.index('0002') + 10])
+            import_rcv_data('us_vt_btv', [filename], output, params=params, incremental=True)
+            with open(os.path.join(tmp, 'ballots.checkpoint.json')) as fh:
+                self.assertEqual(1, json.load(fh)['reader']['num_ballots'])
+
+            write_report_zip(filename, REPORT)
+            import_rcv_data('us_vt_btv', [filename], output, params=params, incremental=True)
+            with open(output) as fh, open(expected) as expected_fh:
+                self.assertEqual(expected_fh.read(), fh.read())
+            with open(os.path.join(tmp, 'ballots.json')) as fh:
+                self.assertEqual(['Kurt Wright', 'Bob Kiss', 'Andy Montroll'], json.load(fh)['candidate_ids'])
+
+            # A drop that renames a candidate is imported in full.
+            write_report_zip(filename, REPORT.replace('Bob Kiss', 'Robert Kiss'))
+            import_rcv_data('us_vt_btv', [filename], output, params=params, incremental=True)
+            with open(os.path.join(tmp, 'ballots.json')) as fh:
+                self.assertEqual(3, json.load(fh)['num_ballots'])
+
+    def test_resume_import(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'btv.zip')
+            output = os.path.join(tmp, 'ballots.csv')
+            expected = os.path.join(tmp, 'expected.csv')
+            params = {'report_path': 'Mayor.txt'}
+            write_report_zip(filename, REPORT + '\r\n')
+            import_rcv_data('us_vt_btv', [filename], expected, params=params)
+
+            write = BallotWriter.write
+
+            def write_then_fail(ballot_writer, ballot):
+                write(ballot_writer, ballot)
+                if ballot.ballot_id == '0003':
+                    raise KeyboardInterrupt
+
+            with patch.object(BallotWriter, 'write', write_then_fail), self.assertRaises(KeyboardInterrupt):
+                import_rcv_data('us_vt_btv', [filename], output, params=params, resume=True, checkpoint_interval=2)
+            with open(os.path.join(tmp, 'ballots.csv.partial.checkpoint.json')) as fh:
+                self.assertEqual(2, json.load(fh)['reader']['num_ballots'])
+
+            import_rcv_data('us_vt_btv', [filename], output, params=params, resume=True, checkpoint_interval=2)
+            with open(output) as fh, open(expected) as expected_fh:
+                self.assertEqual(expected_fh.read(), fh.read())
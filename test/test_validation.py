@@ -0,0 +1,83 @@
+import json
+import os
+import zipfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from ranked_vote.ballot import Ballot, Candidate, UNDERVOTE, OVERVOTE, WRITE_IN
+from ranked_vote_import.ballot_batch import BallotBatch, ChoiceEncoder
+from ranked_vote_import.bin.import_rcv_data import import_rcv_data
+from ranked_vote_import.formats.us.vt.btv import BurlingtonImporter
+from ranked_vote_import.validation import BloomFilter, Validator
+from test.test_us_ca_sfo import BALLOT_IMAGE, ballot_image_line, make_importer
+from test.test_us_nm_saf import write_cvr_zip, cvr_export, CVR_ROWS
+from test.test_us_vt_btv import REPORT
+
+
+class TestValidation(TestCase):
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 1e-4)
+        self.assertEqual([False, False, True], bloom.add(np.array([1, 2, 1], dtype=np.int64)).tolist())
+        self.assertEqual([True, False], bloom.add(np.array([2, 3], dtype=np.int64)).tolist())
+
+        hashes = np.arange(10, 1010, dtype=np.int64) * 7919
+        self.assertLess(bloom.add(hashes).sum(), 5)
+        self.assertLess(bloom.error_rate, 1e-3)
+
+    def test_check_ballots(self):
+        validator = Validator(capacity=1000)
+        ballots = [
+            Ballot('1', [Candidate('A'), UNDERVOTE, Candidate('B')]),
+            Ballot('2', [Candidate('A'), Candidate('B'), Candidate('A')]),
+            Ballot('3', [WRITE_IN, WRITE_IN, UNDERVOTE]),
+            Ballot('4', [UNDERVOTE, OVERVOTE]),
+        ]
+        validator.add_batch(BallotBatch.from_ballots(ballots, ChoiceEncoder()))
+        for ballot in [Ballot('2', [Candidate('C')]), Ballot('5', [])]:
+            validator.add(ballot)
+
+        report = validator.to_dict()
+        self.assertEqual(6, report['num_ballots'])
+        self.assertFalse(report['valid'])
+        self.assertEqual({'duplicate_ballot_id': 1, 'rank_gap': 2, 'repeated_candidate': 1}, report['anomalies'])
+        self.assertEqual({'duplicate_ballot_id': ['2'], 'rank_gap': ['1', '4'], 'repeated_candidate': ['2']},
+                         report['samples'])
+
+    def test_reader_anomalies(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'btv.zip')
+            with zipfile.ZipFile(filename, 'w') as zf:
+                zf.writestr('Mayor.txt', REPORT + '\r\n0004, 1) C09')
+
+            validator = Validator(capacity=1000)
+            reader = BurlingtonImporter([filename], {'report_path': 'Mayor.txt'}, hooks=[validator])
+            reader.validate = True
+            self.assertEqual(4, len(list(reader)))
+            self.assertEqual({'unknown_candidate': 1}, validator.counts)
+            self.assertEqual({'unknown_candidate': ['0004']}, validator.samples)
+
+            ballot_image_file = os.path.join(tmp, 'ballots.txt')
+            with open(ballot_image_file, 'w') as fh:
+                fh.write(BALLOT_IMAGE + ballot_image_line(1, 4, 2, 11) + ballot_image_line(1, 4, 1, 12))
+            validator = Validator(capacity=1000)
+            importer = make_importer(ballot_image_file, {'contest': 1}, hooks=[validator])
+            importer.validate = True
+            self.assertEqual(4, len(list(importer)))
+            self.assertEqual({'rank_out_of_order': 2}, validator.counts)
+
+    def test_import_validation(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cvr.zip')
+            write_cvr_zip(filename, cvr_export(CVR_ROWS + [CVR_ROWS[0]]))
+            output = os.path.join(tmp, 'out.csv')
+
+            for batch_size in [None, 2]:
+                import_rcv_data('us_nm_saf', [filename], output, params={'contest': 'Mayor'},
+                                batch_size=batch_size, validate=True)
+                with open(os.path.join(tmp, 'out.json')) as meta_fh:
+                    validation = json.load(meta_fh)['validation']
+
+                self.assertEqual(4, validation['num_ballots'])
+                self.assertEqual({'duplicate_ballot_id': 1, 'rank_gap': 1}, validation['anomalies'])